@@ -0,0 +1,310 @@
+"""Headless HTTP API for the library: catalog, authentication and RAG queries.
+
+An aiohttp server over the same service core as the Streamlit app (utils.*), for kiosks,
+batch jobs and other clients that should not run the UI. Requests are handled
+concurrently: the event loop only parses and serializes, while catalog reads/writes and
+RAG queries run on a thread pool (config.API_WORKER_THREADS), with at most
+config.API_MAX_CONCURRENT_RAG_QUERIES questions in flight. All sessions of the process
+share one RAG engine and one pooled connection to the LLM backend.
+
+    python api.py [--host 127.0.0.1] [--port 8080]
+
+Endpoints (JSON in and out):
+    GET  /health                         service and document index status
+    POST /auth/login                     {"username", "password"} -> {"token", "expires_at"}
+    POST /auth/logout                    (Authorization: Bearer <token>)
+    GET  /books?limit=&offset=&cursor=   catalog page; also sort=id|title|author|genre, order=asc|desc,
+                                         genre=, author= (repeatable), available=true|false, contains=
+    GET  /books/search?q=&limit=&offset= ranked full-text search (typo-tolerant fallback)
+    GET  /books/{id}                     one book
+    GET  /books/{id}/similar?limit=      "books like this" recommendations
+    POST /books                          {"title", "author", "genre"} (requires a token)
+    POST /rag/query                      {"question"} -> {"answer", "sources", "seconds"} (requires a token)
+    GET  /metrics                        per-operation latency histograms (Prometheus text format)
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from aiohttp import web
+from dotenv import load_dotenv
+import config
+from utils import auth, catalog_search, database, metrics, notifier, rag_service
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+load_dotenv()
+
+_STATE = web.AppKey("state", dict)
+
+
+# --- Helpers ---
+
+def _error(status: int, message: str, messages=None):
+    body = {"error": message}
+    if messages:
+        body["messages"] = [{"level": level, "message": text} for level, text in messages]
+    return web.json_response(body, status=status)
+
+
+async def _run_blocking(request, fn, *args):
+    """Runs blocking service-core work on the API thread pool, collecting its user-facing messages."""
+    sink = notifier.CollectingNotifier()
+
+    def call():
+        with notifier.notifying(sink):
+            return fn(*args)
+
+    executor = request.app[_STATE]["executor"]
+    result = await asyncio.get_running_loop().run_in_executor(executor, call)
+    return result, sink.messages
+
+
+def _records(df) -> list:
+    """DataFrame rows as JSON-ready dicts (NaN becomes null)."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def _int_param(request, name: str, default: int, maximum: int = None) -> int:
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"'{name}' must be an integer")
+    if value < 0:
+        raise web.HTTPBadRequest(text=f"'{name}' must not be negative")
+    return min(value, maximum) if maximum is not None else value
+
+
+async def _json_body(request) -> dict:
+    try:
+        body = await request.json()
+    except Exception:
+        raise web.HTTPBadRequest(text="Request body must be a JSON object")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Request body must be a JSON object")
+    return body
+
+
+def _bearer_token(request):
+    header = request.headers.get("Authorization", "")
+    return header[7:].strip() if header.startswith("Bearer ") else None
+
+
+def _require_user(request) -> str:
+    token = _bearer_token(request)
+    username = auth.session_user(token)
+    if username is None:
+        raise web.HTTPUnauthorized(text="A valid bearer token is required (POST /auth/login)")
+    return username
+
+
+# --- Handlers ---
+
+async def health(request):
+    engine = request.app[_STATE]["engine"]
+    return web.json_response({"status": "ok", "rag": engine.status()})
+
+
+async def metrics_text(request):
+    return web.Response(text=metrics.prometheus_text(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def login(request):
+    body = await _json_body(request)
+    username, password = body.get("username"), body.get("password")
+    if not username or not password:
+        return _error(400, "Both 'username' and 'password' are required.")
+
+    # Password hashing is deliberately slow, so it runs on the thread pool.
+    session, messages = await _run_blocking(request, auth.login, username, password)
+    if session is None:
+        logging.warning(f"API: failed login attempt for username: '{username}'")
+        return _error(401, "Incorrect username or password.", messages)
+    token, expires_at = session
+    logging.info(f"API: user '{username}' logged in.")
+    return web.json_response({"token": token, "expires_at": expires_at})
+
+
+async def logout(request):
+    token = _bearer_token(request)
+    if token:
+        auth.logout(token)
+    return web.json_response({"ok": True})
+
+
+async def list_books(request):
+    limit = _int_param(request, "limit", config.CATALOG_PAGE_SIZE, config.API_MAX_PAGE_SIZE)
+    offset = _int_param(request, "offset", 0)
+    order = request.query.get("order", "asc").lower()
+    if order not in ("asc", "desc"):
+        return _error(400, "'order' must be 'asc' or 'desc'.")
+    filters = {
+        "genre": request.query.getall("genre", []),
+        "author": request.query.getall("author", []),
+        "text": request.query.get("contains"),
+    }
+    if "available" in request.query:
+        available = request.query["available"].lower()
+        if available not in ("true", "false"):
+            return _error(400, "'available' must be 'true' or 'false'.")
+        filters["available"] = available == "true"
+
+    def query():
+        # Keyset paging: pass the previous response's next_cursor to get the following page.
+        return database.query_books(filters, sort=request.query.get("sort", "id"), descending=order == "desc",
+                                    limit=limit, offset=offset, cursor=request.query.get("cursor"))
+
+    try:
+        page, messages = await _run_blocking(request, query)
+    except ValueError as e:
+        return _error(400, str(e))
+    return web.json_response({"total": page["total"], "offset": offset, "next_cursor": page["next_cursor"],
+                              "books": _records(page["books"])})
+
+
+async def search_books(request):
+    query = request.query.get("q", "").strip()
+    if not query:
+        return _error(400, "Query parameter 'q' is required.")
+    limit = _int_param(request, "limit", config.SEARCH_RESULTS_LIMIT, config.API_MAX_PAGE_SIZE)
+    offset = _int_param(request, "offset", 0)
+
+    def search():
+        results_df, total = catalog_search.search_books(query, limit=limit, offset=offset)
+        if results_df.empty and offset == 0:
+            # Same fallback as the search page: typo-tolerant title/author matching.
+            fuzzy_df, fuzzy_total = catalog_search.fuzzy_search_books(query, limit=limit)
+            return fuzzy_df, fuzzy_total, True
+        return results_df, total, False
+
+    (results_df, total, fuzzy), messages = await _run_blocking(request, search)
+    return web.json_response({"total": total, "offset": offset, "fuzzy": fuzzy, "books": _records(results_df)})
+
+
+async def get_book(request):
+    try:
+        book_id = int(request.match_info["book_id"])
+    except ValueError:
+        return _error(400, "Book id must be an integer.")
+    book, messages = await _run_blocking(request, database.get_book, book_id)
+    if book is None:
+        return _error(404, f"Book {book_id} not found.", messages)
+    return web.json_response(_records(pd.DataFrame([book]))[0])
+
+
+async def similar_books(request):
+    try:
+        book_id = int(request.match_info["book_id"])
+    except ValueError:
+        return _error(400, "Book id must be an integer.")
+    limit = _int_param(request, "limit", 10, config.RECOMMENDER_TOP_N)
+
+    def recommend():
+        from utils import recommender
+        return recommender.similar_books(book_id, limit=limit)
+
+    results_df, messages = await _run_blocking(request, recommend)
+    if results_df.empty:
+        book, _ = await _run_blocking(request, database.get_book, book_id)
+        if book is None:
+            return _error(404, f"Book {book_id} not found.", messages)
+    return web.json_response({"book_id": book_id, "books": _records(results_df)})
+
+
+async def add_book(request):
+    username = _require_user(request)
+    body = await _json_body(request)
+    fields = {key: str(body.get(key) or "").strip() for key in ("title", "author", "genre")}
+    missing = [key for key, value in fields.items() if not value]
+    if missing:
+        return _error(400, f"Missing required field(s): {', '.join(missing)}.")
+    new_ids, messages = await _run_blocking(request, database.add_books, [fields])
+    if not new_ids:
+        return _error(500, "Failed to save book data.", messages)
+    logging.info(f"API: '{username}' added book {new_ids[0]}: {fields['title']}")
+    return web.json_response(dict(fields, id=new_ids[0], available=True), status=201)
+
+
+def _answer_question(engine, question):
+    from utils import rag_engine  # langchain/FAISS are only loaded once RAG is used
+    with engine.session() as snapshot:
+        if not snapshot.ready:
+            return None
+        started = time.perf_counter()
+        answer, source_docs = rag_engine.query_rag(snapshot.qa_chain, question, snapshot.version)
+        return {
+            "answer": answer,
+            "sources": [{"content": doc.page_content, "metadata": doc.metadata} for doc in source_docs],
+            "seconds": time.perf_counter() - started,
+        }
+
+
+async def rag_query(request):
+    # Every question costs paid embedding/LLM calls and reveals indexed documents.
+    username = _require_user(request)
+    body = await _json_body(request)
+    question = str(body.get("question") or "").strip()
+    if not question:
+        return _error(400, "'question' is required.")
+    state = request.app[_STATE]
+    async with state["rag_slots"]:
+        result, messages = await _run_blocking(request, _answer_question, state["engine"], question)
+    if result is None:
+        return _error(503, "The document index is not available yet.", messages)
+    logging.info(f"API: '{username}' asked a RAG question ({result['seconds']:.2f}s)")
+    if messages:
+        result["messages"] = [{"level": level, "message": text} for level, text in messages]
+    return web.json_response(result)
+
+
+# --- Application ---
+
+async def _on_startup(app):
+    state = app[_STATE]
+    # Opens the published index and starts syncing documents in the background.
+    await asyncio.get_running_loop().run_in_executor(state["executor"], state["engine"].start)
+
+
+async def _on_cleanup(app):
+    app[_STATE]["executor"].shutdown(wait=False, cancel_futures=True)
+
+
+def create_app(start_engine: bool = True) -> web.Application:
+    """Builds the aiohttp application. With start_engine=False the RAG engine starts on the first query."""
+    app = web.Application()
+    app[_STATE] = {
+        "executor": ThreadPoolExecutor(max_workers=config.API_WORKER_THREADS, thread_name_prefix="api"),
+        "engine": rag_service.get_engine(),
+        "rag_slots": asyncio.Semaphore(config.API_MAX_CONCURRENT_RAG_QUERIES),
+    }
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/metrics", metrics_text),
+        web.post("/auth/login", login),
+        web.post("/auth/logout", logout),
+        web.get("/books", list_books),
+        web.get("/books/search", search_books),
+        web.get(r"/books/{book_id}", get_book),
+        web.get(r"/books/{book_id}/similar", similar_books),
+        web.post("/books", add_book),
+        web.post("/rag/query", rag_query),
+    ])
+    if start_engine:
+        app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the library's headless HTTP API.")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    args = parser.parse_args(argv)
+    web.run_app(create_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
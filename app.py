@@ -1,10 +1,12 @@
+import time
+_script_started = time.perf_counter() # For the LIBRARY_PROFILE_STARTUP=1 time-to-first-render report
 import streamlit as st
 from dotenv import load_dotenv
 import logging
 
 # Import components and utils
-from components import authentication, book_management, search, recommendation
-from utils import rag_engine, database
+from components import authentication, book_management, search, recommendation, notifications, admin
+from utils import rag_service, database, metrics
 import config # Ensure config is loaded early
 
 # Configure logging
@@ -21,21 +23,66 @@ st.set_page_config(
     initial_sidebar_state="expanded" # Can be "auto", "expanded", "collapsed"
 )
 
-# --- Initialize RAG Engine ---
-# Attempt to initialize the RAG engine once and store the QA chain in session state
-# This avoids re-initializing on every interaction, especially the costly index build.
-if 'rag_initialized' not in st.session_state:
-    st.session_state['vector_store'], st.session_state['qa_chain'] = rag_engine.initialize_rag_engine()
-    st.session_state['rag_initialized'] = True
-    if st.session_state['qa_chain'] is None:
-        logging.warning("RAG QA chain initialization failed or returned None.")
-    else:
-        logging.info("RAG QA chain initialized successfully.")
+# Service-core messages (utils.notifier) are shown on the page that triggered them
+notifications.install()
+# Prometheus export to a file and/or a local endpoint, if configured (once per process)
+metrics.start_exporter()
+
+# --- RAG Engine ---
+# One engine per process, shared by every session. It is started on first use of the Search
+# page (not here), so the login form never waits for langchain/FAISS/OpenAI imports: it then
+# opens the published index and syncs it with the documents folder in the background.
+# A newer index published on disk is swapped in automatically.
+rag = rag_service.get_engine()
+
+# --- Sidebar: document index status and build progress ---
+def show_index_status():
+    rag_status = rag.status()
+    progress = rag_status['progress']
+    with st.sidebar:
+        if not rag_status['started']:
+            st.info("Document Index Status: Not loaded")
+            st.caption("Loads on first use of Search & Query.")
+        else:
+            st.info(f"Document Index Status: {'Ready' if rag_status['ready'] else 'Not Available'}")
+        if rag_status['ready']:
+            st.caption(
+                f"{rag_status['chunks']:,} chunks ({rag_status['index_type']}), "
+                f"loaded {time.strftime('%H:%M:%S', time.localtime(rag_status['loaded_at']))}, "
+                f"{rag_status['active_queries']} active queries"
+            )
+        elif rag_status['error']:
+            st.caption(f"Last error: {rag_status['error']}")
+
+        if rag_status['building']:
+            label = "Resuming index build" if progress['resumed'] else "Building document index"
+            details = f"{progress['files_done']}/{progress['files_total']} files, {progress['chunks_embedded']:,} chunks embedded"
+            if progress['eta_seconds'] is not None:
+                details += f", ~{int(progress['eta_seconds'])}s left"
+            st.progress(progress['fraction'] or 0.0, text=f"{label}: {details}")
+            st.session_state.index_build_seen = True
+            return
+        if st.session_state.pop('index_build_seen', False):
+            # The build this fragment was polling has finished: rerun the whole page to stop polling.
+            st.rerun()
+
+        if progress and progress['summary']:
+            summary = progress['summary']
+            st.caption(
+                f"Last sync: {len(summary['added'])} added, {len(summary['changed'])} changed, "
+                f"{len(summary['removed'])} removed."
+            )
+        if st.button("Refresh Document Index"):
+            # Embeds only new/changed files in the documents folder and drops chunks of deleted ones,
+            # in the background; the updated index is swapped in when the build finishes.
+            rag.refresh()
+            st.rerun()
+
 
 # --- Main Application Logic ---
 def main():
     # Check login status
-    if "logged_in" not in st.session_state or not st.session_state.logged_in:
+    if not authentication.is_logged_in():
         authentication.show_login_page()
     else:
         st.sidebar.success(f"Welcome, {st.session_state.get('username', 'User')}!")
@@ -43,10 +90,16 @@ def main():
 
         st.sidebar.title("Navigation")
         page_options = ["🏠 Home", "📚 Book Management", "🔍 Search & Query", "💡 Recommendations"]
+        if st.session_state.get("username") in config.ADMIN_USERS:
+            page_options.append("📈 Metrics")
         selection = st.sidebar.radio("Go to", page_options)
 
         st.sidebar.divider()
-        st.sidebar.info(f"Document Index Status: {'Ready' if st.session_state.get('qa_chain') else 'Not Available'}")
+        if selection == "🔍 Search & Query":
+            # Start the engine (and its first background build) before deciding whether the status polls
+            rag.start()
+        # Re-rendered every couple of seconds on its own while a background index build runs
+        st.fragment(show_index_status, run_every=2 if rag.building else None)()
 
 
         # Display the selected page
@@ -59,25 +112,39 @@ def main():
             - **Recommendations:** Get simple book recommendations.
             """)
             # Display some stats or featured content maybe?
-            books_df = database.load_books()
-            st.metric("Total Books in Catalog", len(books_df))
+            # Counts come from cached aggregates, not a pass over the catalog
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Total Books in Catalog", database.count_books())
+            col2.metric("Available Now", database.count_books({"available": True}))
+            cache_stats = database.get_books_cache_stats()
+            if cache_stats["cached_rows"]:
+                size = cache_stats['cached_bytes']
+                col3.metric("Catalog Memory", f"{size / 1e6:.1f} MB" if size >= 100_000 else f"{size / 1e3:.0f} KB")
 
 
         elif selection == "📚 Book Management":
             book_management.show_book_management()
 
         elif selection == "🔍 Search & Query":
-            # Pass the initialized QA chain to the search page
-            qa_chain = st.session_state.get('qa_chain')
-            search.show_search_page(qa_chain)
+            # Hold the shared engine snapshot while the page (and any answer it streams) renders
+            with rag.session() as engine:
+                search.show_search_page(engine.qa_chain)
 
         elif selection == "💡 Recommendations":
             recommendation.show_recommendation_page()
 
+        elif selection == "📈 Metrics":
+            admin.show_metrics_page()
+
+    if config.PROFILE_STARTUP:
+        from utils import startup_profile
+        startup_profile.report_first_render(_script_started)
+
 # --- Run the App ---
 if __name__ == "__main__":
     # Basic check for OpenAI API Key on startup
-    if not config.OPENAI_API_KEY or config.OPENAI_API_KEY == "sk-...":
+    uses_openai = config.LLM_BACKEND == "openai" or config.EMBEDDING_BACKEND == "openai"
+    if uses_openai and (not config.OPENAI_API_KEY or config.OPENAI_API_KEY == "sk-..."):
         st.error("CRITICAL: OpenAI API Key is not configured. Please set it in your `.env` file.")
         logging.critical("OpenAI API Key is missing or invalid. Application might not function correctly.")
         # You might want to prevent the app from fully starting here,
@@ -0,0 +1,44 @@
+# benchmarks/fakes.py
+"""Offline stand-ins for the models, so the benchmarks time the library's own code paths."""
+
+import zlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+import config
+
+
+class FakeEmbeddings(Embeddings):
+    """Near-instant deterministic embedder: each text maps to a pseudo-random unit vector seeded by its CRC32.
+
+    Unlike utils.embedding_cache.LocalHashEmbeddings, similar texts do not get similar vectors;
+    it exists so that indexing a 1 GB corpus measures FAISS and the pipeline, not the embedder.
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or config.LOCAL_EMBEDDING_DIM
+        self.model_name = f"benchmark-fake-{self.dim}"
+
+    def _embed(self, text: str) -> list:
+        vector = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(self.dim).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def create_embeddings(kind: str):
+    """"fake" (FakeEmbeddings) or "hash" (the app's offline LocalHashEmbeddings)."""
+    if kind == "hash":
+        from utils.embedding_cache import LocalHashEmbeddings
+        return LocalHashEmbeddings()
+    return FakeEmbeddings()
+
+
+def create_llm():
+    """The app's offline extractive chat model, without its simulated token delay."""
+    from utils.local_llm import LocalExtractiveChatModel
+    return LocalExtractiveChatModel(token_delay_seconds=0.0)
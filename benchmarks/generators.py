@@ -0,0 +1,176 @@
+# benchmarks/generators.py
+"""Deterministic synthetic datasets for the benchmarks: book catalogs and text corpora.
+
+Everything is generated from a seed with numpy, so a given (size, seed) always produces the
+same bytes and results stay comparable across commits. Datasets are written once under
+config.BENCHMARK_DIR/datasets and reused by later runs.
+"""
+
+import logging
+import re
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]*)\s*$", re.IGNORECASE)
+_COUNT_UNITS = {"": 1, "k": 1_000, "m": 1_000_000}
+_BYTE_UNITS = {"": 1, "b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+
+_ONSETS = ["b", "br", "c", "ch", "d", "dr", "f", "g", "gr", "h", "j", "k", "l", "m", "n", "p",
+           "pr", "r", "s", "sh", "st", "t", "th", "tr", "v", "w", "z"]
+_VOWELS = ["a", "e", "i", "o", "u", "ai", "ea", "ou"]
+_CODAS = ["", "", "n", "r", "s", "l", "th", "nd", "st"]
+
+GENRES = ["Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Historical Fiction",
+          "Horror", "Biography", "History", "Science", "Philosophy", "Poetry", "Travel",
+          "Self-Help", "Business", "Children", "Young Adult", "Classic", "Graphic Novel", "Cooking"]
+
+VOCABULARY_SIZE = 20_000
+# Words per sentence and sentences per paragraph in generated documents
+_SENTENCE_WORDS = 14
+_PARAGRAPH_SENTENCES = 6
+
+
+def parse_count(text: str) -> int:
+    """'10k' -> 10000, '1M' -> 1000000."""
+    match = _SIZE_RE.match(str(text))
+    if not match or match.group(2).lower() not in _COUNT_UNITS:
+        raise ValueError(f"Not a count: {text!r} (expected e.g. 10k, 100k, 1M)")
+    return int(float(match.group(1)) * _COUNT_UNITS[match.group(2).lower()])
+
+
+def parse_bytes(text: str) -> int:
+    """'10MB' -> 10485760, '1GB' -> 1073741824."""
+    match = _SIZE_RE.match(str(text))
+    if not match or match.group(2).lower() not in _BYTE_UNITS:
+        raise ValueError(f"Not a size: {text!r} (expected e.g. 10MB, 100MB, 1GB)")
+    return int(float(match.group(1)) * _BYTE_UNITS[match.group(2).lower()])
+
+
+def vocabulary(size: int = VOCABULARY_SIZE, seed: int = 0) -> np.ndarray:
+    """Unique pronounceable pseudo-words, most frequent first."""
+    rng = np.random.default_rng(seed)
+    onsets, vowels, codas = (np.array(parts, dtype=object) for parts in (_ONSETS, _VOWELS, _CODAS))
+    words = np.array([], dtype=object)
+    while len(words) < size:
+        n = size * 2
+        syllables = rng.integers(1, 4, size=n)
+        candidates = onsets[rng.integers(len(onsets), size=n)] + vowels[rng.integers(len(vowels), size=n)]
+        for extra in range(1, 3):
+            more = syllables > extra
+            candidates[more] += onsets[rng.integers(len(onsets), size=more.sum())] + vowels[rng.integers(len(vowels), size=more.sum())]
+        candidates += codas[rng.integers(len(codas), size=n)]
+        _, first = np.unique(np.concatenate([words, candidates]), return_index=True)
+        words = np.concatenate([words, candidates])[np.sort(first)]
+    return words[:size]
+
+
+def _zipf_indices(rng, n_items: int, count: int, exponent: float = 1.1) -> np.ndarray:
+    """Samples `count` indices into n_items with Zipf-like frequencies (index 0 most common)."""
+    weights = 1.0 / np.arange(1, n_items + 1) ** exponent
+    return rng.choice(n_items, size=count, p=weights / weights.sum())
+
+
+def generate_catalog(n_books: int, seed: int = 0) -> pd.DataFrame:
+    """A books.csv-shaped catalog of n_books rows with realistic repetition of authors and genres."""
+    rng = np.random.default_rng(seed)
+    words = pd.Series(vocabulary(seed=seed))
+    capitalized = words.str.capitalize()
+
+    n_authors = max(50, n_books // 15)
+    first = capitalized.iloc[rng.integers(0, 2_000, size=n_authors)].to_numpy()
+    last = capitalized.iloc[rng.integers(0, len(words), size=n_authors)].to_numpy()
+    authors = first + " " + last
+
+    title_length = rng.integers(1, 5, size=n_books)
+    title = capitalized.iloc[_zipf_indices(rng, len(words), n_books)].to_numpy()
+    for position in range(1, 4):
+        longer = title_length > position
+        title[longer] += " " + words.iloc[_zipf_indices(rng, len(words), int(longer.sum()))].to_numpy()
+
+    return pd.DataFrame({
+        "id": np.arange(1, n_books + 1),
+        "title": title,
+        "author": authors[_zipf_indices(rng, n_authors, n_books, exponent=0.8)],
+        "genre": np.array(GENRES, dtype=object)[_zipf_indices(rng, len(GENRES), n_books, exponent=0.7)],
+        "available": rng.random(n_books) < 0.8,
+    })
+
+
+def generate_text(n_bytes: int, rng, words: np.ndarray) -> str:
+    """Roughly n_bytes of sentences and paragraphs drawn from `words` with Zipf frequencies."""
+    mean_length = float(np.mean([len(w) for w in words[:2_000]])) + 1
+    n_words = max(_SENTENCE_WORDS, int(n_bytes / mean_length))
+    tokens = words[_zipf_indices(rng, len(words), n_words)].copy()
+    tokens[::_SENTENCE_WORDS] = np.char.capitalize(tokens[::_SENTENCE_WORDS].astype(str)).astype(object)
+    tokens[_SENTENCE_WORDS - 1::_SENTENCE_WORDS] += "."
+    tokens[_SENTENCE_WORDS * _PARAGRAPH_SENTENCES - 1::_SENTENCE_WORDS * _PARAGRAPH_SENTENCES] += "\n"
+    return " ".join(tokens.tolist())[:n_bytes]
+
+
+def write_corpus(folder: Path, total_bytes: int, file_bytes: int, seed: int = 0) -> dict:
+    """Fills `folder` with .txt files of about file_bytes each, totalling about total_bytes."""
+    rng = np.random.default_rng(seed)
+    words = vocabulary(seed=seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    written, files = 0, 0
+    while written < total_bytes:
+        text = generate_text(min(file_bytes, total_bytes - written), rng, words)
+        path = folder / f"doc-{files:06d}.txt"
+        path.write_text(text, encoding="utf-8")
+        written += len(text.encode("utf-8"))
+        files += 1
+    return {"files": files, "bytes": written}
+
+
+def catalog_dataset(root: Path, n_books: int, seed: int = 0) -> Path:
+    """Path to the generated catalog CSV of n_books rows, generating it on first use."""
+    path = Path(root) / f"catalog-{n_books}-seed{seed}.csv"
+    if not path.exists():
+        logging.info(f"Generating a {n_books}-book catalog at {path}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        generate_catalog(n_books, seed).to_csv(tmp_path, index=False)
+        tmp_path.replace(path)
+    return path
+
+
+def corpus_dataset(root: Path, total_bytes: int, file_bytes: int, seed: int = 0) -> Path:
+    """Folder holding the generated corpus of total_bytes, generating it on first use."""
+    folder = Path(root) / f"corpus-{total_bytes}-{file_bytes}-seed{seed}"
+    complete = folder / ".complete"
+    if not complete.exists():
+        logging.info(f"Generating a {total_bytes / 1024 ** 2:.0f} MB corpus at {folder}")
+        for stale in folder.glob("*.txt"):
+            stale.unlink()
+        summary = write_corpus(folder, total_bytes, file_bytes, seed)
+        complete.write_text(f"{summary['files']} {summary['bytes']}\n")
+    return folder
+
+
+def sample_queries(n: int, seed: int = 0) -> list:
+    """Short questions over the generated vocabulary, mixing frequent and rare terms."""
+    rng = np.random.default_rng(seed + 1)
+    words = vocabulary(seed=seed)
+    common = words[_zipf_indices(rng, 500, n)]
+    rare = words[rng.integers(500, len(words), size=n)]
+    return [f"What does the text say about {a} and {b}?" for a, b in zip(common, rare)]
+
+
+def sample_search_terms(catalog: pd.DataFrame, n: int, seed: int = 0) -> list:
+    """Catalog search terms: title words, author surnames, genres and a term that matches nothing."""
+    rng = np.random.default_rng(seed + 2)
+    rows = catalog.iloc[rng.integers(0, len(catalog), size=n)]
+    kinds = rng.integers(0, 3, size=n)
+    terms = []
+    for kind, row in zip(kinds, rows.itertuples()):
+        if kind == 0:
+            terms.append(str(row.title).split()[-1])
+        elif kind == 1:
+            terms.append(str(row.author).split()[-1])
+        else:
+            terms.append(str(row.genre))
+    terms.append("zzqxv")
+    return terms
@@ -0,0 +1,404 @@
+# benchmarks/run.py
+"""Benchmarks for the catalog and RAG hot paths, on synthetic data and offline models.
+
+Each scenario (one catalog size, or one corpus size) runs in its own interpreter, against a
+private copy of its dataset, so cold loads are really cold, process-wide caches do not leak
+between sizes and peak memory is per scenario. Nothing touches data/, the vector store or
+the network: embeddings come from benchmarks.fakes and answers from the offline local model.
+
+    python -m benchmarks.run                                      # 10k catalog, 10MB corpus
+    python -m benchmarks.run --catalog 10k,100k,1M --corpus 10MB,100MB,1GB
+    python -m benchmarks.run --only catalog --storage sqlite
+    python -m benchmarks.run --compare old.json --max-regression 1.25   # exit 1 on regressions
+
+Results are written as JSON (default: config.BENCHMARK_DIR/results-<commit>.json): one
+record per measurement with its per-operation timings in seconds, plus run metadata.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import config
+from benchmarks import generators
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_CATALOGS = "10k"
+DEFAULT_CORPORA = "10MB"
+
+
+# --- Measurement ---
+
+def _summarize(samples: list) -> dict:
+    """Per-operation timing summary (seconds) of a list of samples."""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "runs": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": ordered[-1],
+        "total": sum(ordered),
+    }
+
+
+def _time_each(fn, items) -> tuple:
+    """Calls fn(item) for each item. Returns (timing summary, last result)."""
+    samples, result = [], None
+    for item in items:
+        started = time.perf_counter()
+        result = fn(item)
+        samples.append(time.perf_counter() - started)
+    return _summarize(samples), result
+
+
+def _time_repeat(fn, repeat: int) -> tuple:
+    return _time_each(lambda _: fn(), range(repeat))
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class _Recorder:
+    def __init__(self, scenario: str, size: int):
+        self.scenario, self.size = scenario, size
+        self.results = []
+
+    def add(self, name: str, seconds: dict, **extra):
+        self.results.append(dict(scenario=self.scenario, size=self.size, name=name, seconds=seconds, **extra))
+        logging.info(f"[{self.scenario} {self.size}] {name}: median {seconds['median'] * 1000:.3f} ms "
+                     f"over {seconds['runs']} run(s)")
+
+
+# --- Scenarios (run inside the worker interpreter) ---
+
+def _isolate(workdir: Path):
+    """Points every data path the library writes to at the scenario's scratch directory."""
+    config.BOOKS_CSV_PATH = workdir / "books.csv"
+    config.USERS_CSV_PATH = workdir / "users.csv"
+    config.BOOKS_LOCK_PATH = workdir / "books.csv.lock"
+    config.BOOKS_ID_SEQ_PATH = workdir / "books.seq"
+    config.USERS_LOCK_PATH = workdir / "users.csv.lock"
+    config.SQLITE_DB_PATH = workdir / "library.db"
+    config.DOCUMENTS_DIR = workdir / "documents"
+    config.VECTOR_STORE_DIR = workdir / "vector_store"
+    config.VECTOR_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    config.CACHE_DIR = workdir / "cache"
+    config.RECOMMENDER_DIR = config.CACHE_DIR / "recommendations"
+    config.EMBEDDING_CACHE_ENABLED = False
+    config.ANSWER_CACHE_ENABLED = False
+    config.EMBEDDING_BACKEND = "local"
+    config.LLM_BACKEND = "local"
+    config.USERS_CSV_PATH.write_text("id,username,password\n")
+
+
+def run_catalog(n_books: int, args, workdir: Path) -> list:
+    """load_books (cold and cached), the search_catalog masks, ranked search, catalog pages and add_book."""
+    from utils import catalog_search, database
+
+    config.STORAGE_BACKEND = args.storage
+    source = generators.catalog_dataset(args.datasets, n_books, args.seed)
+    shutil.copyfile(source, config.BOOKS_CSV_PATH)
+    record = _Recorder("catalog", n_books)
+    if args.storage == "sqlite":
+        from utils import sqlite_store
+        started = time.perf_counter()
+        sqlite_store.get_connection()  # creates the database and imports the CSV
+        record.add("sqlite_migrate", _summarize([time.perf_counter() - started]))
+
+    def load_cold():
+        database.invalidate_books_cache()
+        return database.load_books()
+
+    timing, books_df = _time_repeat(load_cold, args.repeat)
+    record.add("load_books_cold", timing, rows=len(books_df), storage=args.storage,
+               memory_bytes=database.catalog_memory_bytes(books_df), compact=config.CATALOG_COMPACT)
+    timing, _ = _time_repeat(database.load_books, max(args.repeat, 100))
+    record.add("load_books_cached", timing, storage=args.storage)
+
+    terms = generators.sample_search_terms(books_df, args.searches, args.seed)
+    timing, _ = _time_each(database.search_catalog, terms)
+    record.add("search_catalog", timing, terms=len(terms), storage=args.storage)
+
+    started = time.perf_counter()
+    catalog_search.search_books(terms[0], limit=config.SEARCH_RESULTS_LIMIT)
+    record.add("search_index_build", _summarize([time.perf_counter() - started]))
+    timing, _ = _time_each(lambda term: catalog_search.search_books(term, limit=config.SEARCH_RESULTS_LIMIT), terms)
+    record.add("search_books", timing, terms=len(terms))
+    timing, _ = _time_each(lambda term: catalog_search.fuzzy_search_books(term, limit=config.SEARCH_RESULTS_LIMIT),
+                           terms[:max(1, len(terms) // 4)])
+    record.add("fuzzy_search_books", timing)
+
+    started = time.perf_counter()
+    page = database.query_books(sort="title")
+    record.add("query_books_sort_build", _summarize([time.perf_counter() - started]), storage=args.storage)
+    cursors = []
+    for _ in range(20):
+        cursors.append(page["next_cursor"])
+        page = database.query_books(sort="title", cursor=page["next_cursor"])
+    timing, _ = _time_each(lambda cursor: database.query_books(sort="title", cursor=cursor), [c for c in cursors if c])
+    record.add("query_books_cursor", timing, storage=args.storage)
+    deep = max(n_books - config.CATALOG_PAGE_SIZE, 0)
+    timing, _ = _time_repeat(lambda: database.query_books(sort="title", offset=deep), args.repeat)
+    record.add("query_books_deep_offset", timing, storage=args.storage)
+    genres = database.distinct_values("genre")[:2]
+    timing, _ = _time_repeat(lambda: database.query_books({"genre": genres, "available": True}, sort="author"), args.repeat)
+    record.add("query_books_filtered", timing, storage=args.storage)
+
+    new_books = [(f"Benchmark Book {i}", f"Bench Author {i % 50}", generators.GENRES[i % len(generators.GENRES)])
+                 for i in range(args.adds)]
+    timing, _ = _time_each(lambda book: database.add_book(*book), new_books)
+    record.add("add_book", timing, storage=args.storage)
+    timing, _ = _time_repeat(database.load_books, max(args.repeat, 100))
+    record.add("load_books_after_add", timing, storage=args.storage)
+    return record.results
+
+
+def run_rag(total_bytes: int, args, workdir: Path) -> list:
+    """load_documents, split_documents, FAISS build/load/query, and query_rag end to end, one by one and batched."""
+    from utils import rag_engine
+    from benchmarks import fakes
+
+    docs_path = generators.corpus_dataset(args.datasets, total_bytes, generators.parse_bytes(args.file_size), args.seed)
+    config.DOCUMENTS_DIR = docs_path
+    embeddings = fakes.create_embeddings(args.embedder)
+    record = _Recorder("rag", total_bytes)
+
+    started = time.perf_counter()
+    documents = rag_engine.load_documents(docs_path)
+    record.add("load_documents", _summarize([time.perf_counter() - started]), documents=len(documents),
+               megabytes=total_bytes / 1024 ** 2)
+
+    started = time.perf_counter()
+    chunks = rag_engine.split_documents(documents)
+    record.add("split_documents", _summarize([time.perf_counter() - started]), chunks=len(chunks))
+    del documents
+
+    started = time.perf_counter()
+    vector_store = rag_engine.create_vector_store(chunks, embeddings)
+    elapsed = time.perf_counter() - started
+    record.add("faiss_build", _summarize([elapsed]), chunks=len(chunks), chunks_per_second=len(chunks) / elapsed,
+               index_type=config.FAISS_INDEX_TYPE, embedder=args.embedder)
+    del chunks
+    vector_store.close()
+
+    def load():
+        store = rag_engine.load_vector_store(embeddings)
+        store.close()
+
+    timing, _ = _time_repeat(load, args.repeat)
+    record.add("faiss_load", timing)
+
+    vector_store = rag_engine.load_vector_store(embeddings)
+    queries = generators.sample_queries(args.queries, args.seed)
+    timing, _ = _time_each(lambda q: vector_store.similarity_search(q, k=config.RETRIEVAL_K), queries)
+    record.add("faiss_query", timing, k=config.RETRIEVAL_K)
+
+    started = time.perf_counter()
+    qa_chain = rag_engine.get_retrieval_qa_chain(vector_store, fakes.create_llm())
+    record.add("rag_chain_setup", _summarize([time.perf_counter() - started]), retrieval_mode=config.RETRIEVAL_MODE)
+    timing, _ = _time_each(lambda q: rag_engine.query_rag(qa_chain, q), queries)
+    record.add("query_rag", timing, retrieval_mode=config.RETRIEVAL_MODE)
+
+    from utils import rag_batch
+    started = time.perf_counter()
+    results = list(rag_batch.iter_batch_answers(queries, qa_chain=qa_chain))
+    elapsed = time.perf_counter() - started
+    record.add("query_rag_batch", _summarize([elapsed]), questions=len(results), questions_per_second=len(results) / elapsed,
+               batch_size=config.RAG_BATCH_SIZE, concurrency=config.RAG_BATCH_CONCURRENCY)
+    vector_store.close()
+    return record.results
+
+
+_SCENARIOS = {"catalog": (run_catalog, generators.parse_count), "rag": (run_rag, generators.parse_bytes)}
+
+
+def _run_worker(args) -> int:
+    run, parse_size = _SCENARIOS[args.worker]
+    size = parse_size(args.size)
+    with tempfile.TemporaryDirectory(prefix=f"bench-{args.worker}-", dir=args.scratch) as workdir:
+        workdir = Path(workdir)
+        _isolate(workdir)
+        results = run(size, args, workdir)
+    for result in results:
+        result["peak_rss_mb"] = _peak_rss_mb()
+    Path(args.worker_output).write_text(json.dumps(results))
+    return 0
+
+
+# --- Driver ---
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=config.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=config.BASE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _scenario_args(args) -> list:
+    return [
+        "--repeat", str(args.repeat), "--searches", str(args.searches), "--adds", str(args.adds),
+        "--queries", str(args.queries), "--storage", args.storage, "--embedder", args.embedder,
+        "--file-size", args.file_size, "--seed", str(args.seed),
+        "--datasets", str(args.datasets), "--scratch", str(args.scratch),
+    ]
+
+
+def run_scenario(kind: str, size: str, args) -> list:
+    """Runs one scenario in a fresh interpreter. Returns its result records."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as output:
+        output_path = output.name
+    try:
+        command = [sys.executable, "-m", "benchmarks.run", "--worker", kind, "--size", size,
+                   "--worker-output", output_path] + _scenario_args(args)
+        completed = subprocess.run(command, cwd=config.BASE_DIR)
+        if completed.returncode != 0:
+            logging.error(f"Benchmark scenario {kind} {size} failed (exit code {completed.returncode}).")
+            return []
+        return json.loads(Path(output_path).read_text())
+    finally:
+        os.unlink(output_path)
+
+
+def _result_key(result: dict) -> str:
+    return f"{result['scenario']}/{result['size']}/{result['name']}"
+
+
+def compare(results: list, baseline: list) -> list:
+    """Pairs up measurements present in both runs. Returns [(key, old median, new median, ratio)]."""
+    old = {_result_key(r): r["seconds"]["median"] for r in baseline}
+    rows = []
+    for result in results:
+        key = _result_key(result)
+        if key in old and old[key] > 0:
+            new = result["seconds"]["median"]
+            rows.append((key, old[key], new, new / old[key]))
+    return rows
+
+
+def format_results(results: list) -> str:
+    lines = [f"{'measurement':<40} {'runs':>6} {'median ms':>12} {'p95 ms':>12} {'peak MB':>9}"]
+    for r in results:
+        s = r["seconds"]
+        peak = f"{r['peak_rss_mb']:.0f}" if r.get("peak_rss_mb") else "-"
+        lines.append(f"{_result_key(r):<40} {s['runs']:>6} {s['median'] * 1000:>12.3f} {s['p95'] * 1000:>12.3f} {peak:>9}")
+    return "\n".join(lines)
+
+
+def format_comparison(rows: list) -> str:
+    lines = [f"{'measurement':<40} {'old ms':>12} {'new ms':>12} {'ratio':>7}"]
+    for key, old, new, ratio in rows:
+        lines.append(f"{key:<40} {old * 1000:>12.3f} {new * 1000:>12.3f} {ratio:>7.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the catalog and RAG hot paths on synthetic data.")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOGS, help="comma-separated catalog sizes, e.g. 10k,100k,1M")
+    parser.add_argument("--corpus", default=DEFAULT_CORPORA, help="comma-separated corpus sizes, e.g. 10MB,100MB,1GB")
+    parser.add_argument("--only", choices=sorted(_SCENARIOS), help="run only catalog or only rag scenarios")
+    parser.add_argument("--storage", choices=["csv", "sqlite"], default="csv", help="catalog storage backend")
+    parser.add_argument("--embedder", choices=["fake", "hash"], default="fake",
+                        help="fake: instant random vectors; hash: the app's offline hashing embedder")
+    parser.add_argument("--file-size", default="1MB", help="size of each generated document")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of load measurements")
+    parser.add_argument("--searches", type=int, default=200, help="catalog search terms per catalog")
+    parser.add_argument("--adds", type=int, default=100, help="add_book calls per catalog")
+    parser.add_argument("--queries", type=int, default=50, help="RAG questions per corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--datasets", type=Path, default=config.BENCHMARK_DIR / "datasets",
+                        help="where generated datasets are kept between runs")
+    parser.add_argument("--scratch", type=Path, default=config.BENCHMARK_DIR / "scratch",
+                        help="where each scenario's private copy of its data is written")
+    parser.add_argument("--output", type=Path, help="results JSON (default: BENCHMARK_DIR/results-<commit>.json)")
+    parser.add_argument("--compare", type=Path, help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="with --compare, exit 1 if any median is more than this many times slower")
+    parser.add_argument("--worker", choices=sorted(_SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--size", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    args.datasets.mkdir(parents=True, exist_ok=True)
+    args.scratch.mkdir(parents=True, exist_ok=True)
+    if args.worker:
+        return _run_worker(args)
+
+    plan = []
+    if args.only in (None, "catalog"):
+        plan += [("catalog", size.strip()) for size in args.catalog.split(",") if size.strip()]
+    if args.only in (None, "rag"):
+        plan += [("rag", size.strip()) for size in args.corpus.split(",") if size.strip()]
+    for kind, size in plan:
+        _SCENARIOS[kind][1](size)  # reject bad sizes before spending time on the others
+
+    commit = _git_commit()
+    started = time.time()
+    results = []
+    for kind, size in plan:
+        results.extend(run_scenario(kind, size, args))
+
+    report = {
+        "commit": commit,
+        "started_at": started,
+        "seconds": time.time() - started,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: str(value) for key, value in vars(args).items()
+                     if key not in ("worker", "size", "worker_output", "compare", "output")},
+        "results": results,
+    }
+    output = args.output or config.BENCHMARK_DIR / f"results-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(format_results(results))
+    print(f"\nResults written to {output}")
+
+    failed = len(results) == 0 or len({(r["scenario"], r["size"]) for r in results}) < len(plan)
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        for key in ("storage", "embedder", "file_size", "seed"):
+            if baseline.get("settings", {}).get(key) != report["settings"][key]:
+                logging.warning(f"Baseline was run with {key}={baseline.get('settings', {}).get(key)}, "
+                                f"this run with {key}={report['settings'][key]}; timings are not like for like.")
+        rows = compare(results, baseline["results"])
+        print(f"\nCompared with {args.compare}:\n{format_comparison(rows)}")
+        if args.max_regression is not None:
+            regressions = [row for row in rows if row[3] > args.max_regression]
+            for key, _, _, ratio in regressions:
+                print(f"REGRESSION: {key} is {ratio:.2f}x slower")
+            failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
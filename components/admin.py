@@ -0,0 +1,38 @@
+import streamlit as st
+import pandas as pd
+from utils import metrics
+
+def show_metrics_page():
+    """Displays per-operation latency percentiles collected by utils.metrics in this process."""
+    st.header("📈 Metrics")
+    st.caption("Latency of catalog, search and RAG operations since the server started (or the last reset).")
+
+    rows = metrics.snapshot()
+    if not rows:
+        st.info("No operations have been recorded yet.")
+        return
+
+    metrics_df = pd.DataFrame(rows)
+    for column in ["mean", "p50", "p95", "p99", "max"]:
+        metrics_df[f"{column} (ms)"] = (metrics_df[column] * 1000).round(2)
+    metrics_df["total (s)"] = metrics_df["total"].round(2)
+
+    prefixes = sorted({operation.split(".")[0] for operation in metrics_df["operation"]})
+    selected = st.multiselect("Components", prefixes, default=prefixes, key="metrics_components")
+    shown = metrics_df[metrics_df["operation"].str.split(".").str[0].isin(selected)]
+
+    st.dataframe(
+        shown[["operation", "count", "errors", "p50 (ms)", "p95 (ms)", "p99 (ms)", "mean (ms)", "max (ms)", "total (s)"]],
+        hide_index=True, use_container_width=True,
+    )
+    st.subheader("p95 latency by operation (ms)")
+    st.bar_chart(shown.set_index("operation")["p95 (ms)"].head(25))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download Prometheus metrics", metrics.prometheus_text(),
+                           file_name="library_metrics.prom", mime="text/plain")
+    with col2:
+        if st.button("Reset metrics"):
+            metrics.reset()
+            st.rerun()
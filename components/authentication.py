@@ -1,13 +1,12 @@
 import streamlit as st
-from utils import database
+from utils import auth
 import logging
 
 def show_login_page():
     """Displays the login form."""
     st.header("Login")
 
-    users_df = database.load_users()
-    if users_df.empty and not config.USERS_CSV_PATH.exists():
+    if not auth.user_store_available():
          st.warning("User database is empty or not found. Cannot log in.")
          # Optional: Provide instructions to create the file or a first user?
          return # Stop execution if no users can be loaded
@@ -20,7 +19,8 @@ def show_login_page():
         if submitted:
             if not username or not password:
                 st.warning("Please enter both username and password.")
-            elif database.verify_user(users_df, username, password):
+            elif (session := auth.login(username, password)) is not None:
+                st.session_state["auth_token"] = session[0]
                 st.session_state["logged_in"] = True
                 st.session_state["username"] = username
                 logging.info(f"User '{username}' logged in successfully.")
@@ -33,9 +33,22 @@ def show_login_page():
 def add_logout_button():
     """Adds a logout button to the sidebar."""
     if st.sidebar.button("Logout"):
+        auth.logout(st.session_state.get("auth_token"))
         # Clear relevant session state variables
-        for key in ["logged_in", "username"]:
+        for key in ["logged_in", "username", "auth_token"]:
             if key in st.session_state:
                 del st.session_state[key]
         logging.info("User logged out.")
-        st.rerun() # Rerun to go back to login page
\ No newline at end of file
+        st.rerun() # Rerun to go back to login page
+
+
+def is_logged_in() -> bool:
+    """True if this browser session holds a live login session (a dict lookup, no user store access)."""
+    if not st.session_state.get("logged_in"):
+        return False
+    if auth.session_user(st.session_state.get("auth_token")) is None:
+        # Expired or revoked (e.g. the server restarted): back to the login form.
+        for key in ["logged_in", "username", "auth_token"]:
+            st.session_state.pop(key, None)
+        return False
+    return True
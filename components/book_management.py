@@ -1,19 +1,31 @@
 import streamlit as st
 import pandas as pd
+import config
 from utils import database
+from components import pagination
 
 def show_book_management():
     """Displays the book management page."""
     st.header("📚 Book Management")
 
-    books_df = database.load_books()
-
     st.subheader("Current Book Catalog")
-    if books_df.empty:
+    if database.count_books() == 0:
         st.info("The book catalog is currently empty.")
     else:
-        # Display the dataframe - make it non-editable for viewing
-        st.dataframe(books_df, use_container_width=True, hide_index=True)
+        # Filters and sort run server-side; only the visible page is sent to the browser.
+        col1, col2, col3 = st.columns([2, 2, 1])
+        text = col1.text_input("Filter by title, author or genre", key="catalog_filter_text")
+        genres = col2.multiselect("Genre", database.distinct_values("genre"), key="catalog_filter_genre")
+        availability = col3.selectbox("Availability", ["All", "Available", "Checked out"], key="catalog_filter_available")
+        col1, col2, col3 = st.columns([2, 2, 1])
+        sort = col1.selectbox("Sort by", database.SORT_KEYS, format_func=str.capitalize, key="catalog_sort")
+        order = col2.radio("Order", ["Ascending", "Descending"], horizontal=True, key="catalog_order")
+        page_size = col3.selectbox("Rows per page", config.CATALOG_PAGE_SIZES,
+                                   index=config.CATALOG_PAGE_SIZES.index(config.CATALOG_PAGE_SIZE), key="catalog_page_size")
+        filters = {"text": text, "genre": genres}
+        if availability != "All":
+            filters["available"] = availability == "Available"
+        pagination.show_catalog_page("catalog", filters, sort=sort, descending=order == "Descending", page_size=page_size)
 
     st.divider()
 
@@ -35,6 +47,56 @@ def show_book_management():
             else:
                 st.warning("Please fill in all book details.")
 
+    st.divider()
+
+    st.subheader("Bulk Import")
+    st.caption("Files larger than the upload limit can be imported from the command line: "
+               "`python -m utils.catalog_io import <file>`.")
+    uploaded = st.file_uploader(
+        "Catalog file (CSV, JSON Lines or Parquet) with title, author and genre columns",
+        type=["csv", "jsonl", "ndjson", "parquet"], key="bulk_import_file",
+    )
+    dry_run = st.checkbox("Dry run (validate only, import nothing)", key="bulk_import_dry_run")
+    if uploaded is not None and st.button("Import Books"):
+        # Imported on first use; bulk imports are rare.
+        from utils import catalog_io
+        progress_bar = st.progress(0.0, text="Importing...")
+
+        def report(summary):
+            done = min(uploaded.tell() / max(uploaded.size, 1), 1.0)
+            progress_bar.progress(done, text=f"{summary['rows_read']:,} rows read, {summary['imported']:,} imported")
+
+        summary = catalog_io.import_books(uploaded, dry_run=dry_run, progress=report)
+        progress_bar.empty()
+        if summary["error"]:
+            st.error(f"Import stopped: {summary['error']}")
+        verb = "would be imported" if dry_run else "imported"
+        st.success(f"{summary['imported']:,} of {summary['rows_read']:,} books {verb} in {summary['seconds']:.1f}s.")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Invalid rows", summary["invalid"])
+        col2.metric("Already in catalog", summary["duplicates_in_catalog"])
+        col3.metric("Repeated in file", summary["duplicates_in_file"])
+        if summary["rejected_samples"]:
+            st.write("Rejected rows (first few):")
+            st.dataframe(pd.DataFrame(summary["rejected_samples"]), use_container_width=True, hide_index=True)
+
+    st.subheader("Export Catalog")
+    export_format = st.selectbox("Format", ["csv", "jsonl", "parquet"], key="export_format")
+    if st.button("Prepare Export"):
+        import tempfile
+        from utils import catalog_io
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/catalog.{export_format}"
+            try:
+                count = catalog_io.export_books(path, export_format)
+            except catalog_io.CatalogFormatError as e:
+                st.error(str(e))
+            else:
+                with open(path, "rb") as f:
+                    st.download_button(f"Download {count:,} books", f.read(), file_name=f"catalog.{export_format}")
+
+    st.divider()
+
     # Placeholder for Edit/Delete functionality
     st.subheader("Edit/Delete Books (Not Implemented)")
     st.info("Functionality to edit or delete books is not included in this POC version.")
\ No newline at end of file
@@ -0,0 +1,39 @@
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from utils import notifier
+
+
+class StreamlitNotifier(notifier.Notifier):
+    """Renders service-core messages (utils.notifier) on the page that triggered them.
+
+    Messages raised on threads without a Streamlit script context (background index builds,
+    the shared engine's reloads) cannot reach a page and are only logged.
+    """
+
+    @staticmethod
+    def _on_page() -> bool:
+        return get_script_run_ctx(suppress_warning=True) is not None
+
+    def error(self, message: str):
+        super().error(message)
+        if self._on_page():
+            st.error(message)
+
+    def warning(self, message: str):
+        super().warning(message)
+        if self._on_page():
+            st.warning(message)
+
+    def info(self, message: str):
+        super().info(message)
+        if self._on_page():
+            st.info(message)
+
+    def busy(self, message: str):
+        return st.spinner(message) if self._on_page() else super().busy(message)
+
+
+def install():
+    """Makes the Streamlit page the sink for service-core messages in this process."""
+    if not isinstance(notifier.get_notifier(), StreamlitNotifier):
+        notifier.set_notifier(StreamlitNotifier())
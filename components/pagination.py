@@ -0,0 +1,38 @@
+import streamlit as st
+import config
+from utils import database
+
+def show_catalog_page(key: str, filters=None, sort: str = "id", descending: bool = False, page_size: int = None) -> dict:
+    """Displays one page of the catalog with Previous/Next buttons and returns database.query_books()'s page.
+
+    Only the visible rows are fetched and sent to the browser. The cursors of the pages
+    visited so far are kept in session state under `key`, and reset when the query changes.
+    """
+    page_size = page_size or config.CATALOG_PAGE_SIZE
+    query = (repr(filters), sort, descending, page_size)
+    pages = st.session_state.get(f"{key}_pages")
+    if pages is None or pages["query"] != query:
+        pages = st.session_state[f"{key}_pages"] = {"query": query, "cursors": [None]}
+    cursors = pages["cursors"]
+
+    page = database.query_books(filters, sort=sort, descending=descending, limit=page_size, cursor=cursors[-1])
+    books_df = page["books"]
+    if books_df.empty and len(cursors) > 1:
+        # The rows after the cursor are gone (e.g. the catalog was rewritten); start over.
+        pages["cursors"] = [None]
+        st.rerun()
+    if books_df.empty:
+        st.info("No books match the current filters.")
+        return page
+
+    st.dataframe(books_df, use_container_width=True, hide_index=True)
+    first = (len(cursors) - 1) * page_size + 1
+    col1, col2, col3 = st.columns([1, 4, 1])
+    if col1.button("◀ Previous", key=f"{key}_previous", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    col2.caption(f"Books {first:,}–{first + len(books_df) - 1:,} of {page['total']:,}")
+    if col3.button("Next ▶", key=f"{key}_next", disabled=page["next_cursor"] is None):
+        cursors.append(page["next_cursor"])
+        st.rerun()
+    return page
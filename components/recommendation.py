@@ -1,34 +1,44 @@
 import streamlit as st
 import pandas as pd
-from utils import database
+from utils import database, catalog_search
 
 def show_recommendation_page():
-    """Displays a basic recommendation page (placeholder)."""
+    """Displays "books like this" recommendations for a book the user picks."""
     st.header("💡 Book Recommendations")
-    st.info("This is a basic recommendation placeholder.")
 
-    books_df = database.load_books()
-
-    if books_df.empty:
+    if database.count_books() == 0:
         st.warning("No books available in the catalog to provide recommendations.")
         return
 
-    # --- Simple Recommendation Logic ---
-    # Example 1: Recommend books from a popular genre (e.g., Science Fiction)
-    st.subheader("Popular Genre: Science Fiction")
-    sf_books = books_df[books_df['genre'].str.contains("Science Fiction", case=False, na=False)]
-    if not sf_books.empty:
-        # Display a few randomly or the first few
-        st.dataframe(sf_books.head(3), hide_index=True, use_container_width=True)
+    # --- Books like this ---
+    st.subheader("Books Like One You Enjoyed")
+    search_term = st.text_input("Find a book you liked (title or author)", key="recommendation_search_term")
+    if search_term:
+        matches_df, _ = catalog_search.search_books(search_term, limit=20)
+        if matches_df.empty:
+            matches_df, _ = catalog_search.fuzzy_search_books(search_term, limit=20)
+        if matches_df.empty:
+            st.info("No books found matching your search term.")
+        else:
+            labels = {row.id: f"{row.title} — {row.author}" for row in matches_df.itertuples()}
+            book_id = st.selectbox("Book", list(labels), format_func=labels.get, key="recommendation_book")
+            # Imported on first use: the model is built (or loaded) the first time anyone asks.
+            from utils import recommender
+            with st.spinner("Finding similar books..."):
+                similar_df = recommender.similar_books(book_id, limit=10)
+            if similar_df.empty:
+                st.write("No similar books found.")
+            else:
+                st.dataframe(similar_df, hide_index=True, use_container_width=True)
     else:
-        st.write("No Science Fiction books found.")
+        st.info("Enter a title or author above to get similar books.")
 
     st.divider()
 
-    # Example 2: Recommend recently added books (highest IDs)
+    # Recently added books (highest IDs)
     st.subheader("Recently Added Books")
-    recent_books = books_df.sort_values(by='id', ascending=False).head(3)
+    recent_books = database.query_books(sort='id', descending=True, limit=3)["books"]
     if not recent_books.empty:
          st.dataframe(recent_books, hide_index=True, use_container_width=True)
     else:
-         st.write("No books to show.")
\ No newline at end of file
+         st.write("No books to show.")
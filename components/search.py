@@ -1,7 +1,8 @@
+import itertools
 import streamlit as st
 import pandas as pd
-from utils import database
-from utils.rag_engine import query_rag
+import config
+from utils import database, catalog_search
 
 def show_search_page(qa_chain):
     """Displays the search page with options for book search and RAG query."""
@@ -11,27 +12,46 @@ def show_search_page(qa_chain):
 
     with tab1:
         st.subheader("Search Books in Catalog")
-        books_df = database.load_books()
-
-        if books_df.empty:
+        if database.count_books() == 0:
             st.info("Book catalog is empty. Nothing to search.")
         else:
             search_term = st.text_input("Search by Title, Author, or Genre", key="book_search_term")
 
             if search_term:
-                # Simple search across relevant columns (case-insensitive)
-                mask = (
-                    books_df['title'].str.contains(search_term, case=False, na=False) |
-                    books_df['author'].str.contains(search_term, case=False, na=False) |
-                    books_df['genre'].str.contains(search_term, case=False, na=False)
-                )
-                results_df = books_df[mask]
+                # Ranked full-text search across title, author and genre, one page of results at a time
+                if st.session_state.get("book_search_page_term") != search_term:
+                    st.session_state.book_search_page_term = search_term
+                    st.session_state.book_search_offset = 0
+                page_size = config.SEARCH_RESULTS_LIMIT
+                offset = st.session_state.book_search_offset
+                results_df, total_matches = catalog_search.search_books(search_term, limit=page_size, offset=offset)
 
                 if not results_df.empty:
-                    st.write(f"Found {len(results_df)} matching book(s):")
+                    if total_matches > len(results_df):
+                        st.write(f"Found {total_matches} matching book(s), showing {offset + 1}–{offset + len(results_df)}:")
+                    else:
+                        st.write(f"Found {total_matches} matching book(s):")
                     st.dataframe(results_df, use_container_width=True, hide_index=True)
+                    if total_matches > page_size:
+                        col1, _, col2 = st.columns([1, 4, 1])
+                        if col1.button("◀ Previous", key="book_search_previous", disabled=offset == 0):
+                            st.session_state.book_search_offset = max(offset - page_size, 0)
+                            st.rerun()
+                        if col2.button("Next ▶", key="book_search_next", disabled=offset + page_size >= total_matches):
+                            st.session_state.book_search_offset = offset + page_size
+                            st.rerun()
+                elif offset > 0:
+                    # The catalog shrank under the current page; go back to the first one.
+                    st.session_state.book_search_offset = 0
+                    st.rerun()
                 else:
-                    st.info("No books found matching your search term.")
+                    # Nothing matched as typed; fall back to typo-tolerant title/author matching.
+                    fuzzy_df, fuzzy_total = catalog_search.fuzzy_search_books(search_term)
+                    if not fuzzy_df.empty:
+                        st.write(f"No exact matches. Showing {len(fuzzy_df)} of {fuzzy_total} close match(es):")
+                        st.dataframe(fuzzy_df, use_container_width=True, hide_index=True)
+                    else:
+                        st.info("No books found matching your search term.")
             else:
                 st.info("Enter a term above to search the book catalog.")
 
@@ -46,9 +66,31 @@ def show_search_page(qa_chain):
 
             if st.button("Ask RAG Engine"):
                 if rag_query:
-                    answer, source_docs = query_rag(qa_chain, rag_query)
+                    # Imported on first use so langchain and FAISS stay out of app startup.
+                    from utils.rag_engine import stream_rag
+                    events = stream_rag(qa_chain, rag_query)
+                    # Retrieval finishes before generation starts, so sources arrive first.
+                    kind, payload = next(events)
+                    source_docs = payload if kind == "sources" else []
+                    if kind != "sources":
+                        events = itertools.chain([(kind, payload)], events)
+                    timing = {}
+
+                    def answer_tokens():
+                        for kind, payload in events:
+                            if kind == "token":
+                                yield payload
+                            elif kind == "done":
+                                timing.update(payload)
+
                     st.markdown("#### Answer:")
-                    st.markdown(answer)
+                    st.write_stream(answer_tokens())
+                    if timing.get("time_to_first_token") is not None:
+                        st.caption(
+                            f"First token after {timing['time_to_first_token']:.2f}s, "
+                            f"complete after {timing['total_time']:.2f}s"
+                            + (" (cached)" if timing.get("cache_hit") else "")
+                        )
 
                     if source_docs:
                         with st.expander("Show Source Document Chunks"):
@@ -9,14 +9,34 @@ DATA_DIR = BASE_DIR / "data"
 DOCUMENTS_DIR = DATA_DIR / "documents"
 BOOKS_CSV_PATH = DATA_DIR / "books.csv"
 USERS_CSV_PATH = DATA_DIR / "users.csv"
+# Advisory lock and persisted id sequence for append-only catalog writes
+BOOKS_LOCK_PATH = DATA_DIR / "books.csv.lock"
+BOOKS_ID_SEQ_PATH = DATA_DIR / "books.seq"
+USERS_LOCK_PATH = DATA_DIR / "users.csv.lock"
+
+# Storage backend for books and users: "csv" (the files above) or "sqlite".
+# The SQLite database is created and filled from the CSVs on first use.
+STORAGE_BACKEND = os.getenv("LIBRARY_STORAGE_BACKEND", "csv").lower()
+SQLITE_DB_PATH = DATA_DIR / "library.db"
+# Cached catalog layout: categorical author/genre, Arrow-backed titles, int32 ids (0: plain DataFrame)
+CATALOG_COMPACT = os.getenv("LIBRARY_CATALOG_COMPACT", "1") != "0"
+
+# Catalog pages (database.query_books): rows per page in the UI, and cached sort orders / filters
+CATALOG_PAGE_SIZE = 50
+CATALOG_PAGE_SIZES = (25, 50, 100, 250)
+CATALOG_SORT_MERGE_MAX_ROWS = 1000 # Appends larger than this drop the cached sort orders instead of merging
+CATALOG_FILTER_CACHE_ENTRIES = 16
 
 # RAG Vector Store path
 VECTOR_STORE_DIR = BASE_DIR / "vector_store"
+# Persistent caches (embeddings, ...); kept outside the vector store so they survive a rebuild
+CACHE_DIR = BASE_DIR / "cache"
 
 # Create directories if they don't exist
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 DOCUMENTS_DIR.mkdir(parents=True, exist_ok=True)
 VECTOR_STORE_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 # Simple check for placeholder .env value
 # In real app, you might add more robust checks or default values
@@ -29,4 +49,144 @@ if not OPENAI_API_KEY or OPENAI_API_KEY == "sk-...":
 # --- Add other configurations as needed ---
 # Example: RAG settings
 CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 150
\ No newline at end of file
+CHUNK_OVERLAP = 150
+# FAISS index type: "flat" (exact), "ivf", "hnsw" or "ivfpq" (compressed). IVF variants are
+# trained on up to FAISS_TRAIN_SAMPLE_SIZE vectors and fall back to simpler types for tiny corpora.
+FAISS_INDEX_TYPE = os.getenv("LIBRARY_FAISS_INDEX_TYPE", "flat").lower()
+FAISS_TRAIN_SAMPLE_SIZE = 50_000
+FAISS_IVF_NLIST = 1024
+FAISS_IVF_NPROBE = 16
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 80
+FAISS_HNSW_EF_SEARCH = 128
+FAISS_PQ_M = 48 # Sub-quantizers per vector (reduced to a divisor of the embedding dimension)
+FAISS_PQ_NBITS = 8
+# Index builds run in the background and checkpoint this often, so an interrupted build resumes
+INDEX_CHECKPOINT_SECONDS = 60
+# Streaming ingestion: processes parsing/splitting files (the batch size is set below, after the embedding settings)
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Chat model: "openai" or "local" (offline extractive stand-in that streams; for tests and benchmarks)
+LLM_BACKEND = os.getenv("LIBRARY_LLM_BACKEND", "openai").lower()
+LOCAL_LLM_TOKEN_DELAY_SECONDS = 0.0
+
+# Embeddings: "openai" or "local" (deterministic hashing embedder, no network; for offline builds and tests)
+EMBEDDING_BACKEND = os.getenv("LIBRARY_EMBEDDING_BACKEND", "openai").lower()
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+LOCAL_EMBEDDING_DIM = 384
+# Content-addressed embedding cache, keyed by (model, chunk text hash)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = CACHE_DIR / "embeddings.db"
+EMBEDDING_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Concurrent embedding requests during index builds. Batches are packed by token count,
+# 429s/5xx are retried with exponential backoff, and completed batches land in the
+# embedding cache immediately so an interrupted build resumes from there.
+EMBEDDING_MAX_CONCURRENCY = 4
+EMBEDDING_BATCH_MAX_TOKENS = 100_000
+EMBEDDING_BATCH_MAX_TEXTS = 512
+EMBEDDING_TOKEN_ENCODING = "cl100k_base"
+EMBEDDING_MAX_RETRIES = 6
+EMBEDDING_BACKOFF_SECONDS = 1.0
+EMBEDDING_BACKOFF_MAX_SECONDS = 60.0
+# Chunks embedded/added per ingest batch. Each batch is one call into the scheduler, so it must
+# hold enough texts for EMBEDDING_MAX_CONCURRENCY full requests, or builds embed one request at a time.
+INGEST_BATCH_SIZE = EMBEDDING_MAX_CONCURRENCY * EMBEDDING_BATCH_MAX_TEXTS
+# Pooled HTTP connections to the OpenAI API, shared by the chat model and embeddings
+OPENAI_MAX_CONNECTIONS = 64
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 32
+OPENAI_TIMEOUT_SECONDS = 60.0
+
+# RAG answer cache: exact (normalized text) and semantic (query embedding similarity) tiers,
+# cleared automatically whenever the document index changes
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_TTL_SECONDS = 24 * 3600
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+# Bulk catalog import/export (utils.catalog_io): rows per chunk read, validated and committed
+CATALOG_IO_BATCH_ROWS = 50_000
+CATALOG_IO_MAX_FIELD_LENGTH = 500
+CATALOG_IO_MAX_REJECT_SAMPLES = 100
+
+# Latency metrics (utils.metrics): per-operation histograms, exported in Prometheus text
+# format to a file every METRICS_EXPORT_INTERVAL_SECONDS and/or on http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_ENABLED = os.getenv("LIBRARY_METRICS", "1") != "0"
+METRICS_EXPORT_PATH = os.getenv("LIBRARY_METRICS_FILE") or None
+METRICS_EXPORT_INTERVAL_SECONDS = 15
+METRICS_HOST = os.getenv("LIBRARY_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("LIBRARY_METRICS_PORT", "0")) # 0: no endpoint
+# Outermost spans slower than this are logged with their per-stage breakdown
+METRICS_SLOW_SPAN_SECONDS = 2.0
+# Users who see the Metrics admin page
+ADMIN_USERS = set(filter(None, os.getenv("LIBRARY_ADMIN_USERS", "admin").split(",")))
+
+# Benchmarks (`python -m benchmarks.run`): generated datasets, scratch copies and results JSON
+BENCHMARK_DIR = CACHE_DIR / "benchmarks"
+
+# Startup profiling: `python -m utils.startup_profile` reports per-module import cost of app.py;
+# LIBRARY_PROFILE_STARTUP=1 makes the running app log its time to first render. These packages
+# must only load on first use of the RAG/recommendation features, never before login.
+PROFILE_STARTUP = os.getenv("LIBRARY_PROFILE_STARTUP", "0") == "1"
+STARTUP_HEAVY_MODULES = ("langchain", "langchain_core", "langchain_community", "langchain_openai", "openai",
+                         "faiss", "tiktoken")
+
+# Authentication: salted PBKDF2-HMAC-SHA256 password hashes. Raising the iteration count
+# (work factor) re-hashes each user's password on their next login.
+PASSWORD_HASH_ITERATIONS = 600_000
+PASSWORD_SALT_BYTES = 16
+# Login sessions (app and API) are held in memory by opaque token
+SESSION_TTL_SECONDS = 8 * 3600
+SESSION_MAX_ENTRIES = 100_000
+
+# Headless HTTP API (api.py): blocking catalog/RAG work runs on a thread pool; at most
+# API_MAX_CONCURRENT_RAG_QUERIES questions are answered at once, the rest wait their turn
+API_HOST = os.getenv("LIBRARY_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("LIBRARY_API_PORT", "8080"))
+API_WORKER_THREADS = 32
+API_MAX_CONCURRENT_RAG_QUERIES = 16
+API_MAX_PAGE_SIZE = 500
+
+# Shared RAG engine: how often sessions check whether a newer index was published on disk
+RAG_INDEX_CHECK_INTERVAL_SECONDS = 5.0
+
+# RAG retrieval: "hybrid" fuses BM25 keyword hits with FAISS vector hits (reciprocal rank
+# fusion), "vector" uses FAISS alone. Each side fetches RETRIEVAL_FETCH_K candidates;
+# RETRIEVAL_K chunks go to the LLM, optionally diversified with MMR.
+RETRIEVAL_MODE = os.getenv("LIBRARY_RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_K = 4
+RETRIEVAL_FETCH_K = 20
+RETRIEVAL_RRF_K = 60
+RETRIEVAL_USE_MMR = False
+RETRIEVAL_MMR_LAMBDA = 0.7 # 1.0 = pure relevance, 0.0 = maximum diversity
+
+# Batch RAG runs (python -m utils.rag_batch): questions embedded and searched in FAISS together,
+# and LLM calls in flight at once
+RAG_BATCH_SIZE = int(os.getenv("LIBRARY_RAG_BATCH_SIZE", "1000"))
+RAG_BATCH_CONCURRENCY = int(os.getenv("LIBRARY_RAG_BATCH_CONCURRENCY", "8"))
+
+# Catalog full-text search (BM25 over title/author/genre)
+SEARCH_FIELD_BOOSTS = {"title": 3.0, "author": 2.0, "genre": 1.0}
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+SEARCH_PREFIX_WEIGHT = 0.8 # Score multiplier for prefix completions vs. exact token hits
+SEARCH_MAX_PREFIX_EXPANSIONS = 50
+SEARCH_RESULTS_LIMIT = 50
+
+# Content-based recommendations ("books like this"): similarity mixes same genre, same author
+# and title TF-IDF cosine with these weights. Top-N neighbours are precomputed and persisted.
+RECOMMENDER_DIR = CACHE_DIR / "recommendations"
+RECOMMENDER_TOP_N = 20
+RECOMMENDER_WEIGHTS = {"genre": 0.3, "author": 0.4, "title": 0.3}
+RECOMMENDER_BLOCK_ROWS = 1024 # Books scored per vectorized block during a build
+RECOMMENDER_MAX_TERM_POSTINGS = 1000 # Title words in more books than this are too common to link books
+RECOMMENDER_MAX_AUTHOR_CANDIDATES = 500
+RECOMMENDER_TAIL_ROWS = 5000 # Books added since the last postings build; beyond this the postings are rebuilt
+RECOMMENDER_SAVE_DELAY_SECONDS = 30.0 # Incremental updates are persisted at most this often
+
+# Typo-tolerant catalog lookup (trigram candidates re-scored by edit distance)
+FUZZY_FIELDS = ("title", "author")
+FUZZY_SIMILARITY_THRESHOLD = 0.7 # 1 - edit_distance / longer word length
+FUZZY_MAX_RESULTS = 20
+FUZZY_MIN_TOKEN_LENGTH = 3
+FUZZY_MIN_TRIGRAM_DICE = 0.2
+FUZZY_MAX_CANDIDATES = 200 # Candidate words re-scored by edit distance, per query word
@@ -0,0 +1,142 @@
+# utils/answer_cache.py
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form for exact matching: lowercase, collapsed whitespace, no trailing punctuation."""
+    return _WHITESPACE_RE.sub(" ", query.strip().lower()).rstrip(" ?!.")
+
+
+class AnswerCache:
+    """Two-tier cache of RAG answers (with their source chunks).
+
+    Tier one matches the normalized query text exactly. Tier two compares the query embedding
+    with those of cached queries and reuses an answer whose cosine similarity reaches
+    `similarity_threshold`. Entries expire after `ttl_seconds` and the least recently used are
+    evicted beyond `max_entries`. Everything is dropped when the index version changes, so
+    answers never outlive the documents they were generated from.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, similarity_threshold: float = None):
+        self.max_entries = max_entries or config.ANSWER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = config.ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.similarity_threshold = (
+            config.ANSWER_CACHE_SIMILARITY_THRESHOLD if similarity_threshold is None else similarity_threshold
+        )
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized query -> entry dict, in LRU order
+        self._index_version = None
+        # Stacked unit-length query embeddings for tier two, rebuilt lazily after changes
+        self._matrix = None
+        self._matrix_keys = []
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    def _check_version(self, index_version):
+        """Clears the cache if the vector index changed since it was filled. Caller holds the lock."""
+        if index_version != self._index_version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+                logging.info("Vector index changed; answer cache cleared.")
+            self._entries.clear()
+            self._matrix = None
+            self._index_version = index_version
+
+    def _live(self, key):
+        """Returns the entry for key if present and not expired (dropping it if expired). Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl_seconds and time.time() - entry["created"] > self.ttl_seconds:
+            del self._entries[key]
+            self._matrix = None
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_exact(self, query: str, index_version):
+        """Tier one: returns (answer, sources) for the same normalized question, or None."""
+        with self._lock:
+            self._check_version(index_version)
+            entry = self._live(normalize_query(query))
+            if entry is None:
+                return None
+            self._stats["exact_hits"] += 1
+            return entry["answer"], entry["sources"]
+
+    def get_similar(self, query_embedding, index_version):
+        """Tier two: returns (answer, sources, similarity) for the closest cached question above the threshold."""
+        if query_embedding is None:
+            return None
+        with self._lock:
+            self._check_version(index_version)
+            if self._matrix is None:
+                keyed = [(key, entry["embedding"]) for key, entry in self._entries.items() if entry["embedding"] is not None]
+                self._matrix_keys = [key for key, _ in keyed]
+                self._matrix = np.vstack([vector for _, vector in keyed]) if keyed else None
+            if self._matrix is None:
+                self._stats["misses"] += 1
+                return None
+            query_vector = _unit(query_embedding)
+            similarities = self._matrix @ query_vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                entry = self._live(self._matrix_keys[best])
+                if entry is not None:
+                    self._stats["semantic_hits"] += 1
+                    return entry["answer"], entry["sources"], float(similarities[best])
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, query: str, answer, sources, index_version, query_embedding=None):
+        """Stores an answer for the query, evicting the least recently used entries beyond max_entries."""
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[normalize_query(query)] = {
+                "answer": answer,
+                "sources": sources,
+                "created": time.time(),
+                "embedding": _unit(query_embedding) if query_embedding is not None else None,
+            }
+            self._entries.move_to_end(normalize_query(query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+# Process-wide cache shared by all sessions
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
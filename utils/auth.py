@@ -0,0 +1,312 @@
+# utils/auth.py
+
+import base64
+import hashlib
+import heapq
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+import pandas as pd
+import config
+from utils import database, metrics, sqlite_store
+
+logging.basicConfig(level=logging.INFO)
+
+# Passwords are stored as "pbkdf2_sha256$<iterations>$<salt>$<hash>" (salt and hash base64).
+# Plaintext passwords left over in the user store are hashed in place when it is first read
+# (and when users.csv changes). Hashes with fewer iterations than configured are replaced on
+# the user's next successful login, so the work factor can be raised by editing
+# config.PASSWORD_HASH_ITERATIONS.
+_HASH_SCHEME = "pbkdf2_sha256"
+
+
+def hash_password(password: str, iterations: int = None) -> str:
+    """Returns a salted PBKDF2-HMAC-SHA256 hash of the password in the storage format."""
+    iterations = iterations or config.PASSWORD_HASH_ITERATIONS
+    salt = os.urandom(config.PASSWORD_SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join([
+        _HASH_SCHEME, str(iterations),
+        base64.b64encode(salt).decode("ascii"), base64.b64encode(digest).decode("ascii"),
+    ])
+
+
+def is_hashed(stored: str) -> bool:
+    return isinstance(stored, str) and stored.startswith(_HASH_SCHEME + "$")
+
+
+def check_password(stored: str, password: str):
+    """Verifies a password against its stored form. Returns (matches, needs_rehash)."""
+    if not is_hashed(stored):
+        # Legacy plaintext entry: compare in constant time, then upgrade it. The hash is still
+        # computed so that a wrong password takes as long as for any other user.
+        _burn_password_check(password)
+        matches = hmac.compare_digest(str(stored).encode("utf-8"), password.encode("utf-8"))
+        return matches, True
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        iterations = int(iterations)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), iterations)
+    except (ValueError, TypeError) as e:
+        logging.error(f"Malformed password hash in the user store: {e}")
+        return False, False
+    matches = hmac.compare_digest(digest, base64.b64decode(expected))
+    return matches, iterations < config.PASSWORD_HASH_ITERATIONS
+
+
+def _burn_password_check(password: str):
+    """Spends one hash's worth of time on an unknown username, so its response time matches a real user's."""
+    hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), b"\0" * config.PASSWORD_SALT_BYTES,
+                        config.PASSWORD_HASH_ITERATIONS)
+
+
+# --- User index ---
+# users.csv is parsed once into a username -> record dict, shared by every session and
+# keyed on the file's (mtime, size) so edits made outside the app are picked up on the
+# next lookup. The SQLite backend already looks users up through its unique index.
+
+_users_lock = threading.Lock()
+_users_index = {"signature": None, "by_name": {}}
+_sqlite_passwords_checked = False
+
+
+def _use_sqlite() -> bool:
+    return config.STORAGE_BACKEND == "sqlite"
+
+
+def _users_signature():
+    stat = os.stat(config.USERS_CSV_PATH)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _user_index() -> dict:
+    """Returns the username -> record dict for users.csv, re-reading the file if it changed."""
+    try:
+        signature = _users_signature()
+    except FileNotFoundError:
+        return {}
+    with _users_lock:
+        if _users_index["signature"] == signature:
+            return _users_index["by_name"]
+    users_df = database.load_users()
+    if _hash_legacy_passwords(users_df):
+        return _user_index()  # users.csv was rewritten
+    by_name = {
+        str(record["username"]): record
+        for record in users_df.astype(object).where(users_df.notna(), None).to_dict(orient="records")
+    }
+    with _users_lock:
+        _users_index["signature"] = signature
+        _users_index["by_name"] = by_name
+    logging.info(f"User index refreshed: {len(by_name)} users from {config.USERS_CSV_PATH}")
+    return by_name
+
+
+def invalidate_user_index():
+    with _users_lock:
+        _users_index["signature"] = None
+        _users_index["by_name"] = {}
+
+
+def get_user(username: str):
+    """Looks a user up by username in O(1). Returns a dict with id, username and password, or None."""
+    if _use_sqlite():
+        _check_sqlite_passwords()
+        return sqlite_store.get_user(username)
+    return _user_index().get(username)
+
+
+def _check_sqlite_passwords():
+    """Hashes plaintext passwords in the SQLite user store, once per process."""
+    global _sqlite_passwords_checked
+    if _sqlite_passwords_checked:
+        return
+    with _users_lock:
+        if _sqlite_passwords_checked:
+            return
+        _sqlite_passwords_checked = True
+    _hash_legacy_passwords(database.load_users())
+
+
+def user_store_available() -> bool:
+    """True if there is a user store to log in against."""
+    if _use_sqlite():
+        return True
+    return config.USERS_CSV_PATH.exists()
+
+
+def _store_hashes(hashes: dict, expected: dict = None) -> int:
+    """Writes {username: password hash} to the user store in one pass. Returns the number of users updated.
+
+    With `expected` ({username: stored password}), a user is only updated if their stored
+    password is still that value, so a concurrent password change is never overwritten.
+    """
+    expected = expected or {}
+    if _use_sqlite():
+        return sum(sqlite_store.set_user_password(username, hashed, expected.get(username))
+                   for username, hashed in hashes.items())
+    with database.users_write_lock():
+        users_df = pd.read_csv(config.USERS_CSV_PATH, dtype=str, keep_default_na=False)
+        mask = users_df["username"].isin(hashes.keys())
+        if expected:
+            current = users_df["username"].map(expected)
+            mask &= current.isna() | (users_df["password"] == current)
+        if not mask.any():
+            return 0
+        users_df.loc[mask, "password"] = users_df.loc[mask, "username"].map(hashes)
+        tmp_path = f"{config.USERS_CSV_PATH}.tmp"
+        users_df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, config.USERS_CSV_PATH)
+    invalidate_user_index()
+    return int(mask.sum())
+
+
+def set_password(username: str, password: str) -> bool:
+    """Stores a new password for an existing user as a salted hash. Returns False if the user does not exist."""
+    return _store_hashes({username: hash_password(password)}) > 0
+
+
+@metrics.timed("auth.authenticate")
+def authenticate(username: str, password: str) -> bool:
+    """Checks credentials in time independent of the number of users (one lookup, one hash).
+
+    Legacy plaintext passwords and hashes below the configured work factor are upgraded on success.
+    """
+    try:
+        user = get_user(username)
+    except Exception as e:
+        logging.error(f"Error looking up user '{username}': {e}")
+        return False
+    if user is None or user.get("password") is None:
+        _burn_password_check(password)
+        return False
+    matches, needs_rehash = check_password(user["password"], password)
+    if matches and needs_rehash:
+        try:
+            set_password(username, password)
+            logging.info(f"Password of user '{username}' re-hashed with {config.PASSWORD_HASH_ITERATIONS} iterations.")
+        except Exception as e:
+            logging.error(f"Could not upgrade the stored password of '{username}': {e}")
+    return matches
+
+
+def _hash_legacy_passwords(users_df) -> int:
+    """Hashes the plaintext passwords among `users_df`'s rows in the user store. Returns the number hashed."""
+    legacy = {
+        str(record["username"]): str(record["password"])
+        for record in users_df.to_dict(orient="records")
+        if pd.notna(record["password"]) and not is_hashed(record["password"])
+    }
+    if not legacy:
+        return 0
+    hashes = {username: hash_password(password) for username, password in legacy.items()}
+    migrated = _store_hashes(hashes, expected=legacy)
+    logging.info(f"Hashed {migrated} plaintext password(s) in the user store.")
+    return migrated
+
+
+def migrate_passwords() -> int:
+    """Hashes every plaintext password in the user store. Returns the number of users migrated."""
+    return _hash_legacy_passwords(database.load_users())
+
+
+# --- Sessions ---
+
+class SessionStore:
+    """Login sessions by opaque token, held in memory for the process.
+
+    Validating a token is a dict lookup, so reruns of a logged-in page and authenticated API
+    requests never touch the user store.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._sessions = {}  # token -> (username, expires_at)
+
+    def issue(self, username: str):
+        """Creates a session. Returns (token, expires_at)."""
+        token = secrets.token_urlsafe(32)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._sessions[token] = (username, expires_at)
+            if len(self._sessions) > config.SESSION_MAX_ENTRIES:
+                self._purge_expired()
+                self._evict_over_cap()
+        return token, expires_at
+
+    def lookup(self, token):
+        """Returns the username of a live session, or None."""
+        if not token:
+            return None
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._sessions[token]
+                return None
+            return entry[0]
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def _purge_expired(self):
+        now = time.time()
+        for token in [t for t, (_, expires_at) in self._sessions.items() if expires_at < now]:
+            del self._sessions[token]
+
+    def _evict_over_cap(self):
+        """Drops the sessions closest to expiry while the store is still over the cap.
+
+        Evicts down to 90% of SESSION_MAX_ENTRIES, so the scan is not repeated on every login.
+        """
+        if len(self._sessions) <= config.SESSION_MAX_ENTRIES:
+            return
+        excess = len(self._sessions) - int(config.SESSION_MAX_ENTRIES * 0.9)
+        oldest = heapq.nsmallest(excess, self._sessions.items(), key=lambda item: item[1][1])
+        for token, _ in oldest:
+            del self._sessions[token]
+        logging.warning(f"Session store over {config.SESSION_MAX_ENTRIES} entries; evicted {excess} oldest sessions.")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+_sessions = None
+_sessions_lock = threading.Lock()
+
+
+def get_sessions() -> SessionStore:
+    """Returns the process-wide session store shared by the app and the API."""
+    global _sessions
+    with _sessions_lock:
+        if _sessions is None:
+            _sessions = SessionStore(config.SESSION_TTL_SECONDS)
+        return _sessions
+
+
+def login(username: str, password: str):
+    """Authenticates and opens a session. Returns (token, expires_at), or None if the credentials are wrong."""
+    if not authenticate(username, password):
+        return None
+    return get_sessions().issue(username)
+
+
+def session_user(token):
+    """Returns the username for a session token, or None if it is unknown or expired."""
+    return get_sessions().lookup(token)
+
+
+def logout(token):
+    get_sessions().revoke(token)
+
+
+if __name__ == "__main__":
+    # Hash any plaintext passwords in place: python -m utils.auth
+    print(f"Hashed {migrate_passwords()} plaintext password(s).")
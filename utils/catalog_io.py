@@ -0,0 +1,311 @@
+# utils/catalog_io.py
+"""Streaming bulk import and export of the book catalog (CSV, JSON Lines, Parquet).
+
+Imports read the file in chunks of config.CATALOG_IO_BATCH_ROWS rows. Each chunk is
+validated with vectorized pandas operations, de-duplicated on (title, author) against the
+catalog and the rows already imported, and committed as one batch through
+database.add_books, which takes the write lock once, reserves a contiguous block of ids
+and fsyncs once. Memory stays bounded by the chunk size plus 8 bytes per known book.
+Batches that were committed stay committed if a later one fails, and re-running the same
+import skips them as duplicates, so an interrupted import can simply be restarted.
+
+Exports stream the catalog from storage chunk by chunk (database.iter_books), so they
+never hold the whole catalog either.
+
+    python -m utils.catalog_io import dump.parquet [--dry-run] [--rejects rejects.csv]
+    python -m utils.catalog_io export catalog.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import config
+from utils import database, metrics
+
+logging.basicConfig(level=logging.INFO)
+
+FORMATS = ("csv", "jsonl", "parquet")
+_SUFFIXES = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl", ".parquet": "parquet", ".pq": "parquet"}
+REQUIRED_COLUMNS = ["title", "author", "genre"]
+_AVAILABLE_VALUES = {
+    "": True, "true": True, "t": True, "yes": True, "y": True, "1": True, "1.0": True,
+    "false": False, "f": False, "no": False, "n": False, "0": False, "0.0": False,
+}
+
+
+class CatalogFormatError(ValueError):
+    """The file cannot be imported at all (unknown format, missing columns)."""
+
+
+def detect_format(source, fmt: str = None) -> str:
+    """The format of `source` (a path or an uploaded file with a .name), from its extension unless given."""
+    if fmt:
+        if fmt not in FORMATS:
+            raise CatalogFormatError(f"Unsupported format '{fmt}' (expected one of {', '.join(FORMATS)}).")
+        return fmt
+    name = str(getattr(source, "name", source))
+    detected = _SUFFIXES.get(Path(name).suffix.lower())
+    if detected is None:
+        raise CatalogFormatError(f"Cannot tell the format of '{name}'; use a .csv, .jsonl or .parquet file.")
+    return detected
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise CatalogFormatError("Parquet support needs the 'pyarrow' package: pip install pyarrow")
+
+
+# --- Reading ---
+
+def read_chunks(source, fmt: str = None, batch_size: int = None):
+    """Yields DataFrames of at most batch_size rows from a catalog file (path or binary file object)."""
+    fmt = detect_format(source, fmt)
+    batch_size = batch_size or config.CATALOG_IO_BATCH_ROWS
+    if fmt == "csv":
+        with pd.read_csv(source, chunksize=batch_size, dtype=str, keep_default_na=False) as reader:
+            yield from reader
+    elif fmt == "jsonl":
+        with pd.read_json(source, lines=True, chunksize=batch_size, dtype=False) as reader:
+            yield from reader
+    else:
+        pyarrow = _require_pyarrow()
+        for batch in pyarrow.parquet.ParquetFile(source).iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+
+
+# --- Validation ---
+
+def _clean_text(values: pd.Series) -> pd.Series:
+    """Strings with surrounding whitespace removed and inner runs collapsed; missing values become ''."""
+    text = values.where(values.notna(), "").astype(str)
+    return text.str.strip().str.replace(r"\s+", " ", regex=True)
+
+
+def _parse_available(values: pd.Series) -> pd.Series:
+    """True/False for recognised values (missing means available), NaN for anything else."""
+    if values.dtype == bool:
+        return values.astype(object)
+    return _clean_text(values).str.lower().map(_AVAILABLE_VALUES)
+
+
+def validate_chunk(chunk: pd.DataFrame):
+    """Vectorized schema and type checks. Returns (clean rows, rejection reason per row, '' if valid).
+
+    Any 'id' column is ignored: imported books always get new ids from the catalog's sequence.
+    """
+    missing = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+    if missing:
+        raise CatalogFormatError(f"Missing required column(s): {', '.join(missing)}.")
+    clean = pd.DataFrame(index=chunk.index)
+    reasons = pd.Series("", index=chunk.index, dtype=object)
+    for col in REQUIRED_COLUMNS:
+        clean[col] = _clean_text(chunk[col])
+        reasons = reasons.mask((reasons == "") & (clean[col] == ""), f"missing {col}")
+        too_long = clean[col].str.len() > config.CATALOG_IO_MAX_FIELD_LENGTH
+        reasons = reasons.mask((reasons == "") & too_long, f"{col} longer than {config.CATALOG_IO_MAX_FIELD_LENGTH} characters")
+    if "available" in chunk.columns:
+        available = _parse_available(chunk["available"])
+        reasons = reasons.mask((reasons == "") & available.isna(), "invalid 'available' value")
+        clean["available"] = available.fillna(True).astype(bool)
+    else:
+        clean["available"] = True
+    return clean, reasons
+
+
+def book_keys(titles: pd.Series, authors: pd.Series) -> np.ndarray:
+    """64-bit hashes of the normalized (title, author) pairs used for duplicate detection."""
+    key = _clean_text(titles).str.casefold() + "\x1f" + _clean_text(authors).str.casefold()
+    return pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+
+def _catalog_keys() -> np.ndarray:
+    """Sorted unique keys of every book already in the catalog, read chunk by chunk."""
+    keys = [book_keys(chunk["title"], chunk["author"]) for chunk in database.iter_books()]
+    return np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.uint64)
+
+
+# --- Import ---
+
+def _new_summary(source) -> dict:
+    return {
+        "source": str(getattr(source, "name", source)),
+        "rows_read": 0, "imported": 0, "invalid": 0,
+        "duplicates_in_catalog": 0, "duplicates_in_file": 0,
+        "batches": 0, "first_id": None, "last_id": None,
+        "rejected_samples": [], "seconds": 0.0, "dry_run": False, "error": None,
+    }
+
+
+def _note_rejects(summary, rejects_path, rows: pd.DataFrame, reasons: pd.Series):
+    """Keeps the first few rejected rows in the summary and appends all of them to the rejects file."""
+    if rows.empty:
+        return
+    rejected = rows.rename(columns={"_row": "row"}).assign(reason=reasons)
+    room = config.CATALOG_IO_MAX_REJECT_SAMPLES - len(summary["rejected_samples"])
+    if room > 0:
+        sample = rejected.head(room).astype(object)
+        summary["rejected_samples"].extend(sample.where(sample.notna(), None).to_dict(orient="records"))
+    if rejects_path:
+        rejected.to_csv(rejects_path, mode="a", header=not os.path.exists(rejects_path), index=False)
+
+
+@metrics.timed("catalog_io.import_books")
+def import_books(source, fmt: str = None, batch_size: int = None, dry_run: bool = False,
+                 rejects_path=None, progress=None) -> dict:
+    """Imports a catalog file in chunks. Returns a summary of what was imported and rejected.
+
+    With dry_run nothing is written; the summary shows what an import would do. `progress` is
+    called with the running summary after each chunk.
+    """
+    started = time.perf_counter()
+    summary = _new_summary(source)
+    summary["dry_run"] = dry_run
+    if rejects_path and os.path.exists(rejects_path):
+        os.unlink(rejects_path)
+    try:
+        known = _catalog_keys()
+        imported = np.empty(0, dtype=np.uint64)
+        for chunk in read_chunks(source, fmt, batch_size):
+            chunk = chunk.reset_index(drop=True)
+            chunk["_row"] = np.arange(summary["rows_read"] + 1, summary["rows_read"] + len(chunk) + 1)
+            summary["rows_read"] += len(chunk)
+            with metrics.span("catalog_io.validate"):
+                clean, reasons = validate_chunk(chunk)
+                valid = (reasons == "").to_numpy()
+                keys = book_keys(clean["title"], clean["author"])
+                in_catalog = valid & np.isin(keys, known)
+                repeated = pd.Series(np.where(valid, keys, 0)).duplicated().to_numpy() | np.isin(keys, imported)
+                in_file = valid & ~in_catalog & repeated
+                reasons = reasons.mask(in_catalog, "duplicate of a book in the catalog")
+                reasons = reasons.mask(in_file, "duplicate of an earlier row in the file")
+                accepted = valid & ~in_catalog & ~in_file
+            summary["invalid"] += int((~valid).sum())
+            summary["duplicates_in_catalog"] += int(in_catalog.sum())
+            summary["duplicates_in_file"] += int(in_file.sum())
+            _note_rejects(summary, rejects_path, chunk[~accepted], reasons[~accepted])
+
+            if accepted.any():
+                rows = clean[accepted].to_dict(orient="records")
+                if not dry_run:
+                    new_ids = database.add_books(rows)
+                    if not new_ids:
+                        raise RuntimeError(f"Writing batch {summary['batches'] + 1} to the catalog failed.")
+                    summary["first_id"] = summary["first_id"] or new_ids[0]
+                    summary["last_id"] = new_ids[-1]
+                summary["imported"] += len(rows)
+                summary["batches"] += 1
+                imported = np.union1d(imported, keys[accepted])
+            if progress:
+                progress(summary)
+    except CatalogFormatError as e:
+        summary["error"] = str(e)
+    except Exception as e:
+        logging.error(f"Catalog import from {summary['source']} failed: {e}", exc_info=True)
+        summary["error"] = str(e)
+    summary["seconds"] = time.perf_counter() - started
+    logging.info(
+        f"Catalog import from {summary['source']}{' (dry run)' if dry_run else ''}: {summary['rows_read']} rows read, "
+        f"{summary['imported']} imported, {summary['invalid']} invalid, {summary['duplicates_in_catalog']} already in the "
+        f"catalog, {summary['duplicates_in_file']} repeated in the file, in {summary['seconds']:.1f}s"
+    )
+    return summary
+
+
+# --- Export ---
+
+def _write_csv(chunks, path) -> int:
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, header=(i == 0), index=False)
+            rows += len(chunk)
+        if rows == 0:
+            f.write(",".join(database.BOOK_COLUMNS) + "\n")
+    return rows
+
+
+def _write_jsonl(chunks, path) -> int:
+    rows = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            text = chunk.to_json(orient="records", lines=True, force_ascii=False)
+            f.write(text if text.endswith("\n") else text + "\n")
+            rows += len(chunk)
+    return rows
+
+
+def _write_parquet(chunks, path) -> int:
+    pyarrow = _require_pyarrow()
+    schema = pyarrow.schema([
+        ("id", pyarrow.int64()), ("title", pyarrow.string()), ("author", pyarrow.string()),
+        ("genre", pyarrow.string()), ("available", pyarrow.bool_()),
+    ])
+    rows = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            table = pyarrow.Table.from_pandas(chunk.astype({"id": "int64", "available": bool}), schema=schema,
+                                              preserve_index=False)
+            writer.write_table(table)
+            rows += len(chunk)
+    return rows
+
+
+_WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl, "parquet": _write_parquet}
+
+
+@metrics.timed("catalog_io.export_books")
+def export_books(path, fmt: str = None, batch_size: int = None) -> int:
+    """Streams the catalog to `path` (written atomically). Returns the number of books exported."""
+    fmt = detect_format(path, fmt)
+    tmp_path = f"{path}.tmp"
+    try:
+        rows = _WRITERS[fmt](database.iter_books(batch_size), tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    logging.info(f"Exported {rows} books to {path} ({fmt}).")
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import or export the book catalog.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="add the books in a CSV, JSONL or Parquet file to the catalog")
+    importer.add_argument("file")
+    importer.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    importer.add_argument("--batch-size", type=int, default=config.CATALOG_IO_BATCH_ROWS)
+    importer.add_argument("--dry-run", action="store_true", help="validate and count, but write nothing")
+    importer.add_argument("--rejects", help="write rejected rows, with the reason, to this CSV file")
+    exporter = commands.add_parser("export", help="write the catalog to a CSV, JSONL or Parquet file")
+    exporter.add_argument("file")
+    exporter.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    exporter.add_argument("--batch-size", type=int, default=config.CATALOG_IO_BATCH_ROWS)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(f"Exported {export_books(args.file, args.format, args.batch_size)} books to {args.file}.")
+        return 0
+
+    def report(summary):
+        print(f"\r{summary['rows_read']:,} rows read, {summary['imported']:,} imported", end="", flush=True)
+
+    summary = import_books(args.file, args.format, args.batch_size, dry_run=args.dry_run,
+                           rejects_path=args.rejects, progress=report)
+    print()
+    printable = {key: value for key, value in summary.items() if key != "rejected_samples"}
+    print(json.dumps(printable, indent=2))
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,367 @@
+# utils/catalog_search.py
+
+import logging
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+import numpy as np
+import pandas as pd
+import config
+from utils import database, metrics
+
+logging.basicConfig(level=logging.INFO)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text) -> list:
+    """Lowercases and splits text into word tokens."""
+    if text is None or (isinstance(text, float) and math.isnan(text)):
+        return []
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def trigrams(term: str) -> set:
+    """Returns the padded character trigrams of a term ('$ab', 'abc', ..., 'yz$')."""
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions).
+
+    Returns max_distance + 1 as soon as the distance is known to exceed max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev_prev = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(prev[j] + 1, current[j - 1] + 1, prev[j - 1] + cost)
+            if prev_prev is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], prev_prev[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, current
+    return prev[-1]
+
+
+class CatalogIndex:
+    """Field-aware inverted index over the catalog with BM25 ranking and prefix matching.
+
+    Documents are numbered by their row position in load_books(), so new books are
+    appended to the postings without touching existing entries.
+    """
+
+    def __init__(self, field_boosts=None, k1=None, b=None):
+        self.field_boosts = dict(field_boosts or config.SEARCH_FIELD_BOOSTS)
+        self.fields = list(self.field_boosts)
+        self.k1 = config.SEARCH_BM25_K1 if k1 is None else k1
+        self.b = config.SEARCH_BM25_B if b is None else b
+        # field -> term -> (doc positions, term frequencies)
+        self.postings = {field: {} for field in self.fields}
+        self.doc_lengths = {field: array('I') for field in self.fields}
+        self.total_lengths = {field: 0 for field in self.fields}
+        self.num_docs = 0
+        self.signature = None
+        self._vocab = []  # Sorted terms across all fields, for prefix expansion
+        self._vocab_set = set()
+        # NumPy views of postings/lengths, rebuilt lazily after appends
+        self._array_cache = {}
+        self._length_cache = {}
+        # Trigram index over the distinct words of the fuzzy-matchable fields
+        self.fuzzy_fields = [field for field in config.FUZZY_FIELDS if field in self.field_boosts]
+        self._fuzzy_terms = []  # term id -> term
+        self._fuzzy_term_ids = {}
+        self._trigram_postings = {}  # trigram -> term ids
+
+    def add_documents(self, records):
+        """Indexes records (mappings with one entry per field) at the next document positions."""
+        new_terms = []
+        for record in records:
+            doc = self.num_docs
+            for field in self.fields:
+                tokens = tokenize(record.get(field))
+                self.doc_lengths[field].append(len(tokens))
+                self.total_lengths[field] += len(tokens)
+                field_postings = self.postings[field]
+                for term, tf in Counter(tokens).items():
+                    entry = field_postings.get(term)
+                    if entry is None:
+                        entry = field_postings[term] = (array('i'), array('H'))
+                        if term not in self._vocab_set:
+                            self._vocab_set.add(term)
+                            new_terms.append(term)
+                        if field in self.fuzzy_fields and term not in self._fuzzy_term_ids:
+                            self._add_fuzzy_term(term)
+                    entry[0].append(doc)
+                    entry[1].append(min(tf, 65535))
+                    self._array_cache.pop((field, term), None)
+            self.num_docs += 1
+        # A handful of new terms are inserted in place; a bulk load re-sorts once.
+        if len(new_terms) > 64:
+            self._vocab = sorted(self._vocab_set)
+        else:
+            for term in new_terms:
+                insort(self._vocab, term)
+        self._length_cache.clear()
+
+    def _add_fuzzy_term(self, term):
+        term_id = len(self._fuzzy_terms)
+        self._fuzzy_terms.append(term)
+        self._fuzzy_term_ids[term] = term_id
+        for gram in trigrams(term):
+            ids = self._trigram_postings.get(gram)
+            if ids is None:
+                ids = self._trigram_postings[gram] = array('i')
+            ids.append(term_id)
+
+    @classmethod
+    def from_dataframe(cls, books_df: pd.DataFrame, **kwargs):
+        """Builds an index over every row of the catalog."""
+        index = cls(**kwargs)
+        columns = [books_df[field].tolist() for field in index.fields]
+        index.add_documents(dict(zip(index.fields, values)) for values in zip(*columns))
+        return index
+
+    def _postings_arrays(self, field, term):
+        key = (field, term)
+        cached = self._array_cache.get(key)
+        if cached is None:
+            docs, tfs = self.postings[field][term]
+            cached = (np.array(docs, dtype=np.int32), np.array(tfs, dtype=np.float32))
+            self._array_cache[key] = cached
+        return cached
+
+    def _lengths_array(self, field):
+        cached = self._length_cache.get(field)
+        if cached is None:
+            cached = np.array(self.doc_lengths[field], dtype=np.float32)
+            self._length_cache[field] = cached
+        return cached
+
+    def _expand(self, token, prefix: bool) -> list:
+        """Returns the indexed terms a query token matches (itself, plus completions when prefix=True)."""
+        if not prefix:
+            return [token] if token in self._vocab_set else []
+        terms = []
+        i = bisect_left(self._vocab, token)
+        while i < len(self._vocab) and self._vocab[i].startswith(token):
+            terms.append(self._vocab[i])
+            if len(terms) >= config.SEARCH_MAX_PREFIX_EXPANSIONS:
+                break
+            i += 1
+        return terms
+
+    def _estimate_matches(self, terms) -> int:
+        """Upper bound on the documents a token matches: the sum of its postings lengths."""
+        return sum(len(self.postings[field][term][0]) for term in terms for field in self.fields if term in self.postings[field])
+
+    def _score_token(self, token, terms, candidates=None):
+        """Returns (doc positions, BM25 scores) for the documents matching one query token.
+
+        When `candidates` (sorted positions) is given, only those documents are scored, which
+        keeps frequent tokens cheap once a rarer token has narrowed the result set.
+        """
+        doc_parts, score_parts = [], []
+        for term in terms:
+            # Completions rank below an exact hit on the typed token.
+            term_weight = 1.0 if term == token else config.SEARCH_PREFIX_WEIGHT
+            for field in self.fields:
+                if term not in self.postings[field]:
+                    continue
+                docs, tfs = self._postings_arrays(field, term)
+                df = len(docs)
+                if candidates is not None:
+                    # Postings are in ascending doc order, so membership is a binary search.
+                    pos = np.minimum(np.searchsorted(docs, candidates), df - 1)
+                    hit = docs[pos] == candidates
+                    docs, tfs = candidates[hit], tfs[pos[hit]]
+                    if len(docs) == 0:
+                        continue
+                idf = math.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+                avg_len = self.total_lengths[field] / max(self.num_docs, 1) or 1.0
+                lengths = self._lengths_array(field)[docs]
+                norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_len)
+                scores = (self.field_boosts[field] * term_weight * idf) * tfs * (self.k1 + 1.0) / (tfs + norm)
+                doc_parts.append(docs)
+                score_parts.append(scores)
+        if not doc_parts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        if len(doc_parts) == 1:
+            return doc_parts[0], score_parts[0].astype(np.float32)
+        docs = np.concatenate(doc_parts)
+        scores = np.concatenate(score_parts)
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        return unique_docs, np.bincount(inverse, weights=scores).astype(np.float32)
+
+    def search(self, query: str, limit: int = 20, offset: int = 0):
+        """Ranks documents that match every query token, each token also matching as a prefix.
+
+        Returns (doc positions, scores, total matches) for the requested page.
+        """
+        tokens = tokenize(query)
+        empty = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), 0)
+        if not tokens or self.num_docs == 0:
+            return empty
+        # Every token is prefix-matched so partially typed words still hit. Rarest tokens
+        # go first so each later token only scores the surviving candidates.
+        expanded = [(token, self._expand(token, prefix=True)) for token in dict.fromkeys(tokens)]
+        expanded.sort(key=lambda pair: self._estimate_matches(pair[1]))
+        docs, scores = None, None
+        for token, terms in expanded:
+            token_docs, token_scores = self._score_token(token, terms, candidates=docs)
+            if docs is None:
+                docs, scores = token_docs, token_scores
+            else:
+                # token_docs is a subset of docs, both sorted
+                keep = np.searchsorted(docs, token_docs)
+                docs, scores = token_docs, scores[keep] + token_scores
+            if len(docs) == 0:
+                break
+        total = len(docs)
+        if total == 0 or offset >= total:
+            return empty[0], empty[1], total
+        end = min(offset + limit, total)
+        if end < total:
+            # Only the top `end` need ordering; argpartition keeps this linear in the match count.
+            top = np.argpartition(-scores, end - 1)[:end]
+            docs, scores = docs[top], scores[top]
+        order = np.lexsort((docs, -scores))[offset:end]
+        return docs[order], scores[order], total
+
+
+    def similar_terms(self, token: str, threshold: float) -> dict:
+        """Returns {indexed term: similarity} for words within the similarity threshold of `token`.
+
+        Candidates come from the trigram index (ranked by shared trigrams) and are then re-scored
+        by edit distance, so the cost depends on the candidate count, not the catalog size.
+        """
+        query_grams = trigrams(token)
+        parts = [np.array(self._trigram_postings[g], dtype=np.int32) for g in query_grams if g in self._trigram_postings]
+        if not parts:
+            return {}
+        term_ids, shared = np.unique(np.concatenate(parts), return_counts=True)
+        # Dice coefficient on trigram sets is a cheap filter before the exact edit distance.
+        term_grams = np.array([len(self._fuzzy_terms[t]) + 1 for t in term_ids])  # padded trigram count
+        dice = 2.0 * shared / (len(query_grams) + term_grams)
+        keep = dice >= config.FUZZY_MIN_TRIGRAM_DICE
+        term_ids, shared = term_ids[keep], shared[keep]
+        if len(term_ids) > config.FUZZY_MAX_CANDIDATES:
+            top = np.argpartition(-shared, config.FUZZY_MAX_CANDIDATES - 1)[:config.FUZZY_MAX_CANDIDATES]
+            term_ids = term_ids[top]
+        matches = {}
+        for term_id in term_ids:
+            term = self._fuzzy_terms[term_id]
+            longest = max(len(term), len(token))
+            max_distance = int(longest * (1.0 - threshold))
+            distance = edit_distance(token, term, max_distance)
+            if distance <= max_distance:
+                matches[term] = 1.0 - distance / longest
+        return matches
+
+    def fuzzy_search(self, query: str, threshold: float, limit: int):
+        """Typo-tolerant search over the fuzzy fields.
+
+        Every query word (of at least FUZZY_MIN_TOKEN_LENGTH characters) must match some word of
+        a book within the similarity threshold. Books are ranked by the summed best similarity
+        per query word. Returns (doc positions, scores, total matches).
+        """
+        tokens = [t for t in dict.fromkeys(tokenize(query)) if len(t) >= config.FUZZY_MIN_TOKEN_LENGTH]
+        empty = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), 0)
+        if not tokens or self.num_docs == 0:
+            return empty
+        docs, scores = None, None
+        for token in tokens:
+            best = {}
+            for term, similarity in self.similar_terms(token, threshold).items():
+                for field in self.fuzzy_fields:
+                    if term not in self.postings[field]:
+                        continue
+                    for doc in self._postings_arrays(field, term)[0].tolist():
+                        if similarity > best.get(doc, 0.0):
+                            best[doc] = similarity
+            if not best:
+                return empty
+            token_docs = np.fromiter(best.keys(), dtype=np.int32, count=len(best))
+            token_scores = np.fromiter(best.values(), dtype=np.float32, count=len(best))
+            order = np.argsort(token_docs)
+            token_docs, token_scores = token_docs[order], token_scores[order]
+            if docs is None:
+                docs, scores = token_docs, token_scores
+            else:
+                docs, own_idx, other_idx = np.intersect1d(docs, token_docs, assume_unique=True, return_indices=True)
+                scores = scores[own_idx] + token_scores[other_idx]
+                if len(docs) == 0:
+                    return empty
+        total = len(docs)
+        order = np.lexsort((docs, -scores))[:limit]
+        return docs[order], scores[order], total
+
+
+# Process-wide index shared by all sessions, kept in step with the catalog signature.
+_index = None
+_index_lock = threading.Lock()
+
+
+def _on_books_added(new_books, old_signature, new_signature):
+    """Catalog listener: appends new books to the index if it reflects the pre-append catalog."""
+    with _index_lock:
+        if _index is not None and _index.signature == old_signature:
+            _index.add_documents(new_books)
+            _index.signature = new_signature
+
+
+database.register_catalog_listener(_on_books_added)
+
+
+def _current_index(books_df: pd.DataFrame, signature) -> CatalogIndex:
+    """Returns the shared index, rebuilding it if the catalog changed outside add_book. Caller holds _index_lock."""
+    global _index
+    if _index is None or _index.signature != signature or _index.num_docs != len(books_df):
+        _index = CatalogIndex.from_dataframe(books_df)
+        _index.signature = signature
+        logging.info(f"Catalog search index built over {len(books_df)} books.")
+    return _index
+
+
+@metrics.timed("catalog_search.search_books")
+def search_books(query: str, limit: int = None, offset: int = 0):
+    """Ranked full-text catalog search.
+
+    Returns (results DataFrame with a 'score' column, total number of matches).
+    """
+    limit = config.SEARCH_RESULTS_LIMIT if limit is None else limit
+    # Read the signature before the catalog so a concurrent change can only make the index look stale.
+    signature = database.catalog_signature()
+    books_df = database.load_books()
+    with _index_lock:
+        index = _current_index(books_df, signature)
+        positions, scores, total = index.search(query, limit=limit, offset=offset)
+    results = books_df.iloc[positions].copy()
+    results['score'] = np.round(scores.astype(float), 3)
+    return results, total
+
+
+@metrics.timed("catalog_search.fuzzy_search_books")
+def fuzzy_search_books(query: str, threshold: float = None, limit: int = None):
+    """Typo-tolerant title/author search ("Tolkein" finds "Tolkien").
+
+    Returns (results DataFrame with a 'score' column holding the similarity, total number of matches).
+    """
+    threshold = config.FUZZY_SIMILARITY_THRESHOLD if threshold is None else threshold
+    limit = config.FUZZY_MAX_RESULTS if limit is None else limit
+    signature = database.catalog_signature()
+    books_df = database.load_books()
+    with _index_lock:
+        index = _current_index(books_df, signature)
+        positions, scores, total = index.fuzzy_search(query, threshold=threshold, limit=limit)
+    results = books_df.iloc[positions].copy()
+    results['score'] = np.round(scores.astype(float), 3)
+    return results, total
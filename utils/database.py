@@ -1,23 +1,70 @@
+import base64
+import csv
+import io
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 import config
-import streamlit as st
 import logging
+from utils import metrics, notifier, sqlite_store
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 logging.basicConfig(level=logging.INFO)
 
+BOOK_COLUMNS = ['id', 'title', 'author', 'genre', 'available']
+
+# --- Catalog cache ---
+# The parsed catalog is shared by every session in this process. It is keyed on
+# the CSV's (mtime, size), so edits made outside the app are picked up on the
+# next read, and add_book/save_books invalidate it explicitly.
+_books_cache_lock = threading.Lock()
+_books_cache = {"signature": None, "df": None}
+_books_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+# --- Compact catalog layout ---
+# Authors and genres repeat across many rows, so the cached catalog stores them as
+# categoricals (each distinct string once plus small integer codes). Titles are
+# Arrow-backed strings (one contiguous buffer instead of a Python object per row), ids
+# int32 and availability a bool column. Vectorized string methods on a categorical run
+# once per distinct value, so whole-catalog scans touch far less memory.
+_CATEGORY_COLUMNS = ['author', 'genre']
+_title_dtype = None
+
+# Callbacks run after books are appended: callback(new_books, old_signature, new_signature).
+# Derived structures (search indexes, recommenders) use them to update in place
+# instead of rebuilding from the whole catalog.
+_catalog_listeners = []
+
+def _use_sqlite() -> bool:
+    """True when config.STORAGE_BACKEND selects the SQLite store instead of the CSV files."""
+    return config.STORAGE_BACKEND == "sqlite"
+
+@metrics.timed("database.load_users")
 def load_users() -> pd.DataFrame:
-    """Loads user data from the CSV file."""
+    """Loads user data from the configured storage backend."""
     try:
+        if _use_sqlite():
+            return sqlite_store.fetch_users()
         users_df = pd.read_csv(config.USERS_CSV_PATH)
         # Ensure required columns exist, handle potential missing columns gracefully
         if not all(col in users_df.columns for col in ['username', 'password', 'id']):
              logging.error(f"Users CSV ({config.USERS_CSV_PATH}) is missing required columns (id, username, password).")
-             st.error("User database file is corrupted or missing required columns.")
+             notifier.error("User database file is corrupted or missing required columns.")
              return pd.DataFrame(columns=['id', 'username', 'password']) # Return empty DataFrame
         return users_df
     except FileNotFoundError:
         logging.error(f"Users CSV file not found at {config.USERS_CSV_PATH}")
-        st.error(f"User database file not found. Please ensure '{config.USERS_CSV_PATH}' exists.")
+        notifier.error(f"User database file not found. Please ensure '{config.USERS_CSV_PATH}' exists.")
         # Create a dummy empty file or return an empty DataFrame?
         # For now, return empty DF to avoid crashing the app immediately
         return pd.DataFrame(columns=['id', 'username', 'password'])
@@ -26,73 +73,721 @@ def load_users() -> pd.DataFrame:
         return pd.DataFrame(columns=['id', 'username', 'password']) # Return empty DataFrame
     except Exception as e:
         logging.error(f"Error loading users CSV: {e}")
-        st.error("An unexpected error occurred while loading user data.")
+        notifier.error("An unexpected error occurred while loading user data.")
         return pd.DataFrame(columns=['id', 'username', 'password'])
 
+@metrics.timed("database.verify_user")
 def verify_user(users_df: pd.DataFrame, username, password) -> bool:
-    """Verifies user credentials against the loaded DataFrame."""
-    if users_df.empty:
-        return False
-    # WARNING: Plain text password comparison - HIGHLY INSECURE FOR PRODUCTION
-    user_record = users_df[users_df['username'] == username]
-    if not user_record.empty:
-        # Compare plain text password
-        return user_record.iloc[0]['password'] == password
-    return False
+    """Verifies user credentials against the salted password hashes in the user store.
+
+    `users_df` is no longer consulted (kept for existing callers): lookups go through the
+    indexed user store in utils.auth, so the cost does not depend on the number of users.
+    """
+    from utils import auth  # auth builds on this module
+    return auth.authenticate(username, password)
+
+def _books_file_signature():
+    """Returns the catalog cache key: the CSV's (mtime_ns, size), or the SQLite catalog version."""
+    if _use_sqlite():
+        return ("sqlite", sqlite_store.catalog_version())
+    stat = os.stat(config.BOOKS_CSV_PATH)
+    return (stat.st_mtime_ns, stat.st_size)
+
+@metrics.timed("database.read_books")
+def _read_books() -> pd.DataFrame:
+    """Parses the books CSV (or reads the SQLite table). Raises on I/O or parse errors; returns None if columns are missing."""
+    if _use_sqlite():
+        return compact_books(sqlite_store.fetch_books())
+    books_df = pd.read_csv(config.BOOKS_CSV_PATH)
+    if not all(col in books_df.columns for col in BOOK_COLUMNS):
+        return None
+    return compact_books(_normalize_available(books_df))
+
+def _normalize_available(books_df: pd.DataFrame) -> pd.DataFrame:
+    # Ensure 'available' is boolean if read as string
+    if books_df['available'].dtype != bool:
+         books_df['available'] = books_df['available'].astype(str).str.lower().map({'true': True, 'false': False}).fillna(False).astype(bool)
+    return books_df
+
+def _text_dtype():
+    """Arrow-backed string dtype when pyarrow is installed, else object."""
+    global _title_dtype
+    if _title_dtype is None:
+        try:
+            _title_dtype = pd.StringDtype("pyarrow", na_value=np.nan)
+        except (ImportError, TypeError):  # no pyarrow, or pandas < 2.3
+            _title_dtype = np.dtype(object)
+    return _title_dtype
+
+def compact_books(books_df: pd.DataFrame) -> pd.DataFrame:
+    """Returns the catalog in the compact in-memory layout (see above). Other columns are kept as they are."""
+    if not config.CATALOG_COMPACT:
+        return books_df
+    books_df = books_df.copy(deep=False)
+    ids = books_df['id']
+    info = np.iinfo(np.int32)
+    if pd.api.types.is_integer_dtype(ids) and (ids.empty or (ids.min() >= info.min and ids.max() <= info.max)):
+        books_df['id'] = ids.astype(np.int32)
+    books_df['title'] = books_df['title'].astype(_text_dtype())
+    for column in _CATEGORY_COLUMNS:
+        values = books_df[column]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            books_df[column] = values.astype(_text_dtype()).astype('category')
+    books_df['available'] = books_df['available'].astype(bool)
+    return books_df
+
+def _append_compact(books_df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
+    """Concatenates new rows onto a compact catalog, keeping author/genre categorical.
+
+    Unseen values are added at the end of the categories, so existing codes are unchanged.
+    """
+    new_df = compact_books(new_df)
+    for column in _CATEGORY_COLUMNS:
+        if not (isinstance(books_df[column].dtype, pd.CategoricalDtype)
+                and isinstance(new_df[column].dtype, pd.CategoricalDtype)):
+            continue
+        existing = books_df[column].cat.categories
+        unseen = new_df[column].cat.categories.difference(existing)
+        dtype = pd.CategoricalDtype(existing.append(unseen) if len(unseen) else existing)
+        if len(unseen):
+            # Rebuilding from the codes skips add_categories' per-value checks (slow with many authors).
+            books_df = books_df.assign(**{column: pd.Categorical.from_codes(
+                books_df[column].cat.codes, dtype=dtype, validate=False)})
+        new_df[column] = new_df[column].astype(dtype)
+    return pd.concat([books_df, new_df], ignore_index=True)
+
+def catalog_memory_bytes(books_df: pd.DataFrame) -> int:
+    """Resident size of a catalog DataFrame, including string data."""
+    return int(books_df.memory_usage(deep=True).sum())
+
+def iter_books(batch_size: int = None):
+    """Yields the catalog as DataFrames of at most batch_size rows, without loading it whole.
+
+    Reads straight from storage (not the cache), so it can stream catalogs larger than memory.
+    """
+    batch_size = batch_size or config.CATALOG_IO_BATCH_ROWS
+    if _use_sqlite():
+        yield from sqlite_store.iter_books(batch_size)
+        return
+    try:
+        reader = pd.read_csv(config.BOOKS_CSV_PATH, chunksize=batch_size)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return
+    with reader:
+        for chunk in reader:
+            yield _normalize_available(chunk[BOOK_COLUMNS])
+
+def catalog_signature():
+    """Returns the current catalog cache key, or None if the catalog cannot be read."""
+    try:
+        return _books_file_signature()
+    except Exception:
+        return None
+
+def register_catalog_listener(callback):
+    """Registers a callback notified with (new_books, old_signature, new_signature) after each append."""
+    if callback not in _catalog_listeners:
+        _catalog_listeners.append(callback)
+
+def _extend_books_cache(new_books, old_signature, new_signature):
+    """Appends freshly written rows to the cached catalog if it reflects the pre-append file."""
+    with _books_cache_lock:
+        if _books_cache["df"] is None or _books_cache["signature"] != old_signature:
+            _books_cache["signature"] = None
+            _books_cache["df"] = None
+            _books_cache_stats["invalidations"] += 1
+            return
+        new_df = pd.DataFrame(new_books, columns=BOOK_COLUMNS)
+        old_df = _books_cache["df"]
+        _books_cache["df"] = _append_compact(old_df, new_df)
+        _books_cache["signature"] = new_signature
+        _extend_page_cache(old_df, _books_cache["df"])
+
+def invalidate_books_cache():
+    """Drops the cached catalog so the next load_books() re-reads the CSV."""
+    with _books_cache_lock:
+        _books_cache["signature"] = None
+        _books_cache["df"] = None
+        _books_cache_stats["invalidations"] += 1
 
+def get_books_cache_stats() -> dict:
+    """Returns a snapshot of the catalog cache hit/miss counters and the cached catalog's size."""
+    with _books_cache_lock:
+        stats = dict(_books_cache_stats)
+        books_df = _books_cache["df"]
+    stats["cached_rows"] = len(books_df) if books_df is not None else 0
+    stats["cached_bytes"] = catalog_memory_bytes(books_df) if books_df is not None else 0
+    return stats
+
+@metrics.timed("database.load_books")
 def load_books() -> pd.DataFrame:
-    """Loads book data from the CSV file."""
+    """Loads book data from the configured storage backend, served from the process-wide cache when the file is unchanged.
+
+    The returned DataFrame is shared between sessions and must be treated as read-only.
+    """
     try:
-        books_df = pd.read_csv(config.BOOKS_CSV_PATH)
-        if not all(col in books_df.columns for col in ['id', 'title', 'author', 'genre', 'available']):
+        signature = _books_file_signature()
+        with _books_cache_lock:
+            if _books_cache["df"] is not None and _books_cache["signature"] == signature:
+                _books_cache_stats["hits"] += 1
+                return _books_cache["df"]
+
+        books_df = _read_books()
+        if books_df is None:
              logging.error(f"Books CSV ({config.BOOKS_CSV_PATH}) is missing required columns.")
-             st.error("Book database file is corrupted or missing required columns.")
-             return pd.DataFrame(columns=['id', 'title', 'author', 'genre', 'available'])
-        # Ensure 'available' is boolean if read as string
-        if books_df['available'].dtype == 'object':
-             books_df['available'] = books_df['available'].str.lower().map({'true': True, 'false': False}).fillna(False).astype(bool)
+             notifier.error("Book database file is corrupted or missing required columns.")
+             return pd.DataFrame(columns=BOOK_COLUMNS)
+
+        with _books_cache_lock:
+            _books_cache["signature"] = signature
+            _books_cache["df"] = books_df
+            _books_cache_stats["misses"] += 1
+        logging.info(f"Catalog cache refreshed: {len(books_df)} books loaded from {config.BOOKS_CSV_PATH}")
         return books_df
     except FileNotFoundError:
         logging.error(f"Books CSV file not found at {config.BOOKS_CSV_PATH}")
-        st.error(f"Book database file not found. Please ensure '{config.BOOKS_CSV_PATH}' exists.")
-        return pd.DataFrame(columns=['id', 'title', 'author', 'genre', 'available'])
+        notifier.error(f"Book database file not found. Please ensure '{config.BOOKS_CSV_PATH}' exists.")
+        return pd.DataFrame(columns=BOOK_COLUMNS)
     except pd.errors.EmptyDataError:
         logging.warning(f"Books CSV file is empty at {config.BOOKS_CSV_PATH}")
-        return pd.DataFrame(columns=['id', 'title', 'author', 'genre', 'available'])
+        return pd.DataFrame(columns=BOOK_COLUMNS)
     except Exception as e:
         logging.error(f"Error loading books CSV: {e}")
-        st.error("An unexpected error occurred while loading book data.")
-        return pd.DataFrame(columns=['id', 'title', 'author', 'genre', 'available'])
+        notifier.error("An unexpected error occurred while loading book data.")
+        return pd.DataFrame(columns=BOOK_COLUMNS)
+
+
+# --- Catalog writes ---
+# Writers serialize on an advisory lock file so that concurrent sessions (or
+# processes) never interleave rows or hand out the same id. New ids come from a
+# persisted sequence instead of max(id)+1 over the whole catalog.
+
+@contextmanager
+def _file_lock(lock_path):
+    """Holds an exclusive advisory lock on `lock_path` for the duration of the block."""
+    with open(lock_path, 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _catalog_write_lock():
+    """Holds an exclusive advisory lock on the catalog for the duration of the block."""
+    return _file_lock(config.BOOKS_LOCK_PATH)
+
+def users_write_lock():
+    """Holds an exclusive advisory lock on users.csv while it is rewritten (password changes)."""
+    return _file_lock(config.USERS_LOCK_PATH)
+
+def _write_id_sequence(last_id: int):
+    """Atomically persists the last issued book id. Caller must hold the write lock."""
+    tmp_path = f"{config.BOOKS_ID_SEQ_PATH}.tmp"
+    with open(tmp_path, 'w') as seq_file:
+        seq_file.write(str(int(last_id)))
+        seq_file.flush()
+        os.fsync(seq_file.fileno())
+    os.replace(tmp_path, config.BOOKS_ID_SEQ_PATH)
+
+def _read_id_sequence() -> int:
+    """Returns the last issued book id. Caller must hold the write lock.
+
+    The persisted sequence is checked against the id on the CSV's last row, so rows appended
+    to the file outside the app never get their ids issued again. The sequence is seeded
+    from a full scan on first use, or when the last row cannot be parsed.
+    """
+    try:
+        with open(config.BOOKS_ID_SEQ_PATH) as seq_file:
+            last_id = int(seq_file.read().strip())
+    except (FileNotFoundError, ValueError):
+        last_id = None
+    tail_id = _csv_last_id(_csv_header_and_tail()[0])
+    if last_id is not None and tail_id is not None:
+        if tail_id > last_id:
+            logging.info(f"Catalog was edited outside the app; book id sequence advanced from {last_id} to {tail_id}")
+        return max(last_id, tail_id)
+    # O(catalog) scan; normal inserts only read the sequence and the end of the file.
+    try:
+        ids = pd.read_csv(config.BOOKS_CSV_PATH, usecols=['id'])['id']
+        scanned_id = int(ids.max()) if not ids.empty else 0
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        scanned_id = 0
+    last_id = max(last_id or 0, scanned_id)
+    _write_id_sequence(last_id)
+    logging.info(f"Book id sequence seeded at {last_id}")
+    return last_id
+
+def _csv_header_and_tail():
+    """Returns the CSV's column order and whether it ends with a newline (None if the file is empty)."""
+    try:
+        with open(config.BOOKS_CSV_PATH, 'rb') as f:
+            header = f.readline().decode('utf-8').strip()
+            if not header:
+                return None, True
+            f.seek(-1, os.SEEK_END)
+            ends_with_newline = f.read(1) in (b'\n', b'\r')
+    except FileNotFoundError:
+        return None, True
+    return next(csv.reader([header])), ends_with_newline
+
+def _csv_last_id(columns):
+    """Returns the id on the CSV's last row, read from the end of the file; 0 if it has no rows.
 
+    None if the last line is not a parsable row (e.g. the end of a quoted field spanning lines).
+    """
+    if columns is None:
+        return 0
+    try:
+        with open(config.BOOKS_CSV_PATH, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 64 * 1024))
+            lines = [line for line in f.read().decode('utf-8', errors='replace').splitlines() if line.strip()]
+        if len(lines) == 1 and next(csv.reader(lines)) == columns:
+            return 0  # Header only
+        return int(float(next(csv.reader(lines[-1:]))[columns.index('id')]))
+    except (FileNotFoundError, ValueError, IndexError, StopIteration):
+        return None
+
+@metrics.timed("database.append_rows")
+def _append_book_rows(rows) -> list:
+    """Appends rows to the catalog CSV in one fsync'd write and returns their ids. Caller must hold the write lock."""
+    if not rows:
+        return []
+    last_id = _read_id_sequence()
+    new_ids = list(range(last_id + 1, last_id + 1 + len(rows)))
+    # Reserve the ids before writing, so a crash mid-append leaves a gap rather than a duplicate.
+    _write_id_sequence(new_ids[-1])
+
+    columns, ends_with_newline = _csv_header_and_tail()
+    buffer = io.StringIO()
+    if not ends_with_newline:
+        buffer.write('\n')
+    writer = csv.writer(buffer, lineterminator='\n')
+    if columns is None:
+        columns = BOOK_COLUMNS
+        writer.writerow(columns)
+    for book_id, row in zip(new_ids, rows):
+        record = dict(row, id=book_id)
+        writer.writerow([record.get(col, '') for col in columns])
 
+    with open(config.BOOKS_CSV_PATH, 'ab') as f:
+        f.write(buffer.getvalue().encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+    return new_ids
+
+@metrics.timed("database.save_books")
 def save_books(books_df: pd.DataFrame):
     """Saves the book DataFrame back to the CSV file."""
     try:
-        books_df.to_csv(config.BOOKS_CSV_PATH, index=False)
+        if _use_sqlite():
+            sqlite_store.replace_books(books_df)
+            invalidate_books_cache()
+            logging.info("Books data saved successfully.")
+            return
+        with _catalog_write_lock():
+            books_df.to_csv(config.BOOKS_CSV_PATH, index=False)
+            # A full rewrite may have changed the id range; resync the sequence with it.
+            _write_id_sequence(int(books_df['id'].max()) if not books_df.empty else 0)
+        invalidate_books_cache()
         logging.info("Books data saved successfully.")
     except Exception as e:
         logging.error(f"Error saving books CSV: {e}")
-        st.error("Failed to save book data.")
+        notifier.error("Failed to save book data.")
+
+@metrics.timed("database.add_books")
+def add_books(books) -> list:
+    """Appends many books to the catalog in a single locked, fsync'd batch.
+
+    `books` is an iterable of mappings with 'title', 'author', 'genre' and an optional
+    'available' (defaults to True). Returns the list of assigned ids, or [] on failure.
+    """
+    rows = [
+        {
+            'title': book['title'],
+            'author': book['author'],
+            'genre': book['genre'],
+            'available': bool(book.get('available', True)),
+        }
+        for book in books
+    ]
+    if not rows:
+        return []
+    try:
+        if _use_sqlite():
+            new_ids, version_before, version_after = sqlite_store.insert_books(rows)
+            old_signature, new_signature = ("sqlite", version_before), ("sqlite", version_after)
+        else:
+            with _catalog_write_lock():
+                old_signature = catalog_signature()
+                new_ids = _append_book_rows(rows)
+                new_signature = catalog_signature()
+    except Exception as e:
+        logging.error(f"Error appending to books CSV: {e}", exc_info=True)
+        notifier.error("Failed to save book data.")
+        return []
 
+    new_books = [dict(row, id=book_id) for book_id, row in zip(new_ids, rows)]
+    _extend_books_cache(new_books, old_signature, new_signature)
+    with metrics.span("database.catalog_listeners"):
+        for callback in list(_catalog_listeners):
+            try:
+                callback(new_books, old_signature, new_signature)
+            except Exception as e:
+                logging.error(f"Catalog listener {callback!r} failed: {e}", exc_info=True)
+    logging.info(f"Added {len(new_ids)} books (ids {new_ids[0]}-{new_ids[-1]}).")
+    return new_ids
+
+@metrics.timed("database.add_book")
 def add_book(title, author, genre):
-    """Adds a new book to the CSV file."""
+    """Appends a new book to the CSV file without rewriting the catalog."""
+    new_ids = add_books([{'title': title, 'author': author, 'genre': genre}])
+    if not new_ids:
+        return False
+    logging.info(f"Book added: {title}")
+    return True # Indicate success
+
+# --- Catalog queries ---
+# On SQLite these are indexed queries; on CSV they run against the cached catalog.
+
+@metrics.timed("database.search_catalog")
+def search_catalog(term: str) -> pd.DataFrame:
+    """Case-insensitive substring search across title, author and genre."""
+    try:
+        if _use_sqlite():
+            return sqlite_store.search_books(term)
+        books_df = load_books()
+        if books_df.empty:
+            return books_df
+        return books_df[_text_mask(books_df, term)]
+    except Exception as e:
+        logging.error(f"Error searching catalog for '{term}': {e}")
+        notifier.error("An unexpected error occurred while searching the catalog.")
+        return pd.DataFrame(columns=BOOK_COLUMNS)
+
+def _text_mask(books_df: pd.DataFrame, term: str) -> np.ndarray:
+    """Rows whose title, author or genre contains `term` (case-insensitive)."""
+    return (
+        books_df['title'].str.contains(term, case=False, na=False, regex=False) |
+        books_df['author'].str.contains(term, case=False, na=False, regex=False) |
+        books_df['genre'].str.contains(term, case=False, na=False, regex=False)
+    ).to_numpy(dtype=bool)
+
+@metrics.timed("database.get_book")
+def get_book(book_id):
+    """Returns a single book as a dict, or None if it does not exist."""
+    if _use_sqlite():
+        return sqlite_store.get_book(book_id)
     books_df = load_books()
-    # Find the next available ID
-    if books_df.empty:
-        new_id = 1
+    match = books_df[books_df['id'] == book_id]
+    if match.empty:
+        return None
+    return match.iloc[0].to_dict()
+
+@metrics.timed("database.set_book_availability")
+def set_book_availability(book_id, available: bool) -> bool:
+    """Marks a book as available or checked out. Returns False if the book does not exist."""
+    try:
+        if _use_sqlite():
+            updated = sqlite_store.set_book_available(book_id, available)
+            if updated:
+                invalidate_books_cache()
+            return updated
+        books_df = load_books()
+        mask = books_df['id'] == book_id
+        if not mask.any():
+            return False
+        # The cached frame is shared, so update a copy and rewrite it.
+        books_df = books_df.copy()
+        books_df.loc[mask, 'available'] = bool(available)
+        save_books(books_df)
+        return True
+    except Exception as e:
+        logging.error(f"Error updating availability for book {book_id}: {e}")
+        notifier.error("Failed to update book availability.")
+        return False
+
+# --- Catalog pages ---
+# query_books() returns one page of a filtered, sorted catalog instead of the whole
+# DataFrame. Later pages are addressed by a cursor holding the previous page's last
+# (sort value, id): the next page starts with a binary search over the sort order (an
+# index seek on SQLite), so deep pages cost the same as the first and do not shift while
+# books are added. On CSV, sort orders, filter masks and counts are cached for the cached
+# catalog and carried over in place when books are appended.
+
+SORT_KEYS = ('id', 'title', 'author', 'genre')
+FILTER_KEYS = ('genre', 'author', 'available', 'text')
+
+# SQLite's NOCASE collation folds ASCII letters only; the CSV backend sorts the same way.
+_ASCII_FOLD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+_page_cache_lock = threading.Lock()
+# Keyed on the cached catalog DataFrame itself, so row positions always refer to that frame.
+_page_cache = {"df": None, "orders": {}, "masks": OrderedDict(), "counts": {}}
+# SQLite counts, keyed on the catalog version
+_count_cache = {"signature": None, "counts": {}}
+
+def _fold(value) -> str:
+    return value.translate(_ASCII_FOLD) if isinstance(value, str) else ""
+
+def _normalize_filters(filters) -> tuple:
+    """Canonical, hashable form of a filter mapping: ((key, value), ...) in FILTER_KEYS order."""
+    filters = filters or {}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}; expected {', '.join(FILTER_KEYS)}.")
+    normalized = []
+    for key in FILTER_KEYS:
+        value = filters.get(key)
+        if value is None:
+            continue
+        if key in ('genre', 'author'):
+            values = [value] if isinstance(value, str) else list(value)
+            value = tuple(sorted({str(v) for v in values if str(v)}))
+        elif key == 'available':
+            value = bool(value)
+        else:
+            value = str(value).strip()
+        if value == () or value == "":
+            continue
+        normalized.append((key, value))
+    return tuple(normalized)
+
+def _encode_cursor(sort: str, descending: bool, value, book_id) -> str:
+    if sort == 'id':
+        value = int(book_id)
+    elif not isinstance(value, str):
+        value = None  # Missing value, which sorts as ""
+    payload = json.dumps([sort, bool(descending), value, int(book_id)])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str, sort: str, descending: bool) -> tuple:
+    """Returns the (sort value, id) a cursor points after. Raises ValueError if it is malformed or for another order."""
+    try:
+        cursor_sort, cursor_descending, value, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        book_id = int(book_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid page cursor.")
+    if cursor_sort != sort or cursor_descending != bool(descending):
+        raise ValueError("The page cursor belongs to a different sort order.")
+    return value, book_id
+
+def _filter_mask(books_df: pd.DataFrame, filters: tuple) -> np.ndarray:
+    mask = np.ones(len(books_df), dtype=bool)
+    for key, value in filters:
+        if key in ('genre', 'author'):
+            mask &= books_df[key].isin(value).to_numpy(dtype=bool)
+        elif key == 'available':
+            mask &= books_df['available'].to_numpy(dtype=bool) == value
+        else:
+            mask &= _text_mask(books_df, value)
+    return mask
+
+def _sort_order(books_df: pd.DataFrame, sort: str) -> np.ndarray:
+    """Row positions of the catalog in ascending (sort value, id) order."""
+    ids = books_df['id'].to_numpy(dtype=np.int64)
+    if sort == 'id':
+        return np.argsort(ids, kind='stable').astype(np.int32)
+    values = books_df[sort]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Rank the distinct values once; code -1 (missing) selects the trailing "".
+        folded = np.array([_fold(v) for v in values.cat.categories] + [""], dtype=object)
+        _, category_rank = np.unique(folded, return_inverse=True)
+        keys = category_rank[values.cat.codes.to_numpy()]
     else:
-        new_id = books_df['id'].max() + 1
-
-    new_book = pd.DataFrame([{
-        'id': new_id,
-        'title': title,
-        'author': author,
-        'genre': genre,
-        'available': True  # New books are available by default
-    }])
-
-    # Use concat instead of append
-    updated_books_df = pd.concat([books_df, new_book], ignore_index=True)
-    save_books(updated_books_df)
-    logging.info(f"Book added: {title}")
-    return True # Indicate success
\ No newline at end of file
+        keys, _ = pd.factorize(values.str.translate(_ASCII_FOLD).fillna(""), sort=True)
+    return np.lexsort((ids, keys)).astype(np.int32)
+
+def _row_key(books_df: pd.DataFrame, sort: str):
+    """Sort key of a row position, comparable with _cursor_key()."""
+    ids = books_df['id'].to_numpy()
+    if sort == 'id':
+        return lambda position: ids[position]
+    values = books_df[sort]
+    return lambda position: (_fold(values.iat[position]), ids[position])
+
+def _cursor_key(sort: str, after: tuple):
+    value, book_id = after
+    return book_id if sort == 'id' else (_fold(value), book_id)
+
+def _merge_order(books_df: pd.DataFrame, order: np.ndarray, sort: str, first: int) -> np.ndarray:
+    """Inserts rows first.. of books_df into an ascending sort order over the rows before them."""
+    row_key = _row_key(books_df, sort)
+    new_rows = sorted(range(first, len(books_df)), key=row_key)
+    slots = [bisect_right(order, row_key(row), key=row_key) for row in new_rows]
+    return np.insert(order, slots, new_rows).astype(np.int32)
+
+def _page_state(books_df: pd.DataFrame) -> dict:
+    """The page cache for `books_df`, reset if it was built for another frame. Caller holds _page_cache_lock."""
+    if _page_cache["df"] is not books_df:
+        _page_cache.update(df=books_df, orders={}, masks=OrderedDict(), counts={})
+    return _page_cache
+
+def _cached_order(state: dict, sort: str) -> np.ndarray:
+    order = state["orders"].get(sort)
+    if order is None:
+        order = state["orders"][sort] = _sort_order(state["df"], sort)
+    return order
+
+def _cached_mask(state: dict, filters: tuple):
+    """Boolean row mask for the filters (None when there are none), LRU-cached."""
+    if not filters:
+        return None
+    masks = state["masks"]
+    mask = masks.get(filters)
+    if mask is None:
+        mask = masks[filters] = _filter_mask(state["df"], filters)
+        while len(masks) > config.CATALOG_FILTER_CACHE_ENTRIES:
+            masks.popitem(last=False)
+    else:
+        masks.move_to_end(filters)
+    return mask
+
+def _cached_count(state: dict, filters: tuple) -> int:
+    count = state["counts"].get(filters)
+    if count is None:
+        mask = _cached_mask(state, filters)
+        count = state["counts"][filters] = len(state["df"]) if mask is None else int(mask.sum())
+    return count
+
+def _extend_page_cache(old_df: pd.DataFrame, new_df: pd.DataFrame):
+    """Carries the page cache over to new_df (old_df plus appended rows) instead of dropping it."""
+    with _page_cache_lock:
+        if _page_cache["df"] is not old_df:
+            return
+        first = len(old_df)
+        added = new_df.iloc[first:]
+        orders = {}
+        if len(added) <= config.CATALOG_SORT_MERGE_MAX_ROWS:
+            orders = {sort: _merge_order(new_df, order, sort, first) for sort, order in _page_cache["orders"].items()}
+        masks = OrderedDict(
+            (filters, np.concatenate([mask, _filter_mask(added, filters)]))
+            for filters, mask in _page_cache["masks"].items()
+        )
+        counts = {}
+        for filters, count in _page_cache["counts"].items():
+            if not filters:
+                counts[filters] = count + len(added)
+            elif filters in masks:
+                counts[filters] = count + int(masks[filters][first:].sum())
+        _page_cache.update(df=new_df, orders=orders, masks=masks, counts=counts)
+
+def _take(order: np.ndarray, mask, lo: int, hi: int, descending: bool, skip: int, count: int) -> np.ndarray:
+    """Walks order[lo:hi] (backwards if descending) and returns `count` matching positions after skipping `skip`."""
+    candidates = order[lo:hi][::-1] if descending else order[lo:hi]
+    if mask is None:
+        return candidates[skip:skip + count]
+    needed = skip + count
+    found, total, start, step = [], 0, 0, 4096
+    # Scan in growing chunks, so a selective filter does not cost a pass over the whole order.
+    while start < len(candidates) and total < needed:
+        chunk = candidates[start:start + step]
+        chunk = chunk[mask[chunk]]
+        found.append(chunk)
+        total += len(chunk)
+        start += step
+        step *= 2
+    return np.concatenate(found)[skip:needed] if found else candidates[:0]
+
+def _count(filters: tuple) -> int:
+    """count_books() for normalized filters."""
+    if not _use_sqlite():
+        books_df = load_books()
+        with _page_cache_lock:
+            return _cached_count(_page_state(books_df), filters)
+    signature = catalog_signature()
+    with _page_cache_lock:
+        if _count_cache["signature"] != signature:
+            _count_cache.update(signature=signature, counts={})
+        count = _count_cache["counts"].get(filters)
+    if count is None:
+        count = sqlite_store.count_books(filters)
+        with _page_cache_lock:
+            if _count_cache["signature"] == signature:
+                _count_cache["counts"][filters] = count
+    return count
+
+@metrics.timed("database.count_books")
+def count_books(filters=None) -> int:
+    """Number of books matching `filters` (see query_books), served from a cache kept in step with the catalog."""
+    filters = _normalize_filters(filters)
+    try:
+        return _count(filters)
+    except Exception as e:
+        logging.error(f"Error counting books: {e}")
+        notifier.error("An unexpected error occurred while reading the catalog.")
+        return 0
+
+@metrics.timed("database.query_books")
+def query_books(filters=None, sort: str = 'id', descending: bool = False, limit: int = None,
+                offset: int = 0, cursor: str = None) -> dict:
+    """Returns one page of the catalog as {"books": DataFrame, "total", "offset", "next_cursor"}.
+
+    `filters` maps 'genre'/'author' (a value or list of values, exact match), 'available'
+    (bool) and 'text' (case-insensitive substring of title, author or genre) to the rows to
+    keep. Rows are ordered by `sort` (one of SORT_KEYS; case-insensitive, ties by id). Pass
+    the previous page's "next_cursor" as `cursor` to get the page after it; it is None on the
+    last page. `offset` skips rows (after the cursor, if any), for jumping to a page number.
+    "total" counts all matching books. Raises ValueError for an unknown sort key or filter,
+    or a cursor from another sort order.
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key '{sort}'; expected one of {', '.join(SORT_KEYS)}.")
+    limit = config.CATALOG_PAGE_SIZE if limit is None else max(int(limit), 0)
+    offset = max(int(offset), 0)
+    filters = _normalize_filters(filters)
+    after = _decode_cursor(cursor, sort, descending) if cursor else None
+    try:
+        if _use_sqlite():
+            page_df = compact_books(sqlite_store.query_books(filters, sort, descending, limit + 1, offset, after))
+            total = _count(filters)
+        else:
+            books_df = load_books()
+            with _page_cache_lock:
+                state = _page_state(books_df)
+                order = _cached_order(state, sort) if not books_df.empty else np.zeros(0, dtype=np.int32)
+                mask = _cached_mask(state, filters) if not books_df.empty else None
+                total = _cached_count(state, filters) if not books_df.empty else 0
+            lo, hi = 0, len(order)
+            if after is not None:
+                target, row_key = _cursor_key(sort, after), _row_key(books_df, sort)
+                if descending:
+                    hi = bisect_left(order, target, key=row_key)
+                else:
+                    lo = bisect_right(order, target, key=row_key)
+            page_df = books_df.iloc[_take(order, mask, lo, hi, descending, offset, limit + 1)]
+    except Exception as e:
+        logging.error(f"Error querying the catalog: {e}", exc_info=True)
+        notifier.error("An unexpected error occurred while reading the catalog.")
+        return {"books": pd.DataFrame(columns=BOOK_COLUMNS), "total": 0, "offset": offset, "next_cursor": None}
+
+    next_cursor = None
+    if len(page_df) > limit:
+        page_df = page_df.iloc[:limit]
+        if limit:
+            last = page_df.iloc[-1]
+            next_cursor = _encode_cursor(sort, descending, last[sort], last['id'])
+    return {"books": page_df, "total": total, "offset": offset, "next_cursor": next_cursor}
+
+@metrics.timed("database.distinct_values")
+def distinct_values(column: str) -> list:
+    """Distinct genres or authors in the catalog, sorted case-insensitively (e.g. filter choices)."""
+    if column not in ('genre', 'author'):
+        raise ValueError(f"Unknown column '{column}'; expected genre or author.")
+    try:
+        if _use_sqlite():
+            return sqlite_store.distinct_values(column)
+        values = load_books()[column].dropna().unique()
+        return sorted((str(value) for value in values), key=lambda value: (_fold(value), value))
+    except Exception as e:
+        logging.error(f"Error listing catalog {column} values: {e}")
+        notifier.error("An unexpected error occurred while reading the catalog.")
+        return []
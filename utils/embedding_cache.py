@@ -0,0 +1,209 @@
+# utils/embedding_cache.py
+
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class LocalHashEmbeddings(Embeddings):
+    """Deterministic, offline embedder based on feature hashing.
+
+    Words and character trigrams are hashed into a fixed number of signed buckets and the
+    result is L2-normalized, so texts sharing vocabulary land close together. Used for
+    offline index builds, tests and benchmarks; it is not a substitute for a real model.
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or config.LOCAL_EMBEDDING_DIM
+        self.model_name = f"local-hash-{self.dim}"
+
+    def _features(self, text: str):
+        words = _TOKEN_RE.findall(text.lower())
+        yield from words
+        for word in words:
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+            value = int.from_bytes(digest, 'little')
+            vector[value % self.dim] += 1.0 if (value >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class EmbeddingStore:
+    """On-disk vector store keyed by (model, text hash), bounded in size with LRU eviction.
+
+    Vectors are stored as raw float32 blobs in SQLite. Access times are tracked so the least
+    recently used entries are evicted once the total payload exceeds `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access);
+        """)
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys) -> dict:
+        """Returns {key: vector} for the keys present in the store and refreshes their access time."""
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ", ".join("?" for _ in batch)
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                    )
+        return found
+
+    def put_many(self, items):
+        """Stores (key, vector) pairs, evicting least recently used entries if over budget."""
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            with self._conn:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+                )
+                if self._conn.total_changes - before == len(rows):
+                    self._total_bytes += sum(len(blob) for _, blob, _ in rows)
+                else:
+                    self._total_bytes = self._conn.execute(
+                        "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+                    ).fetchone()[0]
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drops the oldest entries until the store is at 90% of its budget. Caller holds the lock."""
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        with self._conn:
+            while self._total_bytes > target:
+                rows = self._conn.execute(
+                    "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT 1000"
+                ).fetchall()
+                if not rows:
+                    break
+                victims = []
+                for key, size in rows:
+                    if self._total_bytes <= target:
+                        break
+                    victims.append((key,))
+                    self._total_bytes -= size
+                self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+                evicted += len(victims)
+        logging.info(f"Embedding cache evicted {evicted} entries ({self._total_bytes} bytes kept).")
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings object with a content-addressed, persistent cache.
+
+    Identical texts embedded with the same model are only ever sent to the provider once;
+    hits and misses are counted for reporting. With a `scheduler` (an EmbeddingScheduler),
+    misses are embedded concurrently and each completed request is stored right away, so the
+    cache doubles as the checkpoint that lets an interrupted index build resume.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, store: EmbeddingStore, scheduler=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.store = store
+        self.scheduler = scheduler
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).digest()
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys = [self._key(text) for text in texts]
+        cached = self.store.get_many(list(dict.fromkeys(keys)))
+        # Embed each distinct missing text once, even if it repeats within the batch.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            if self.scheduler is not None:
+                vectors = self.scheduler.embed(
+                    list(missing.values()),
+                    on_batch=lambda texts, batch_vectors: self.store.put_many(
+                        (self._key(text), vector) for text, vector in zip(texts, batch_vectors)
+                    ),
+                )
+                cached.update(zip(missing.keys(), vectors))
+            else:
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+                fresh = dict(zip(missing.keys(), vectors))
+                self.store.put_many(fresh.items())
+                cached.update(fresh)
+        with self._stats_lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "stored_bytes": self.store.total_bytes,
+            }
@@ -0,0 +1,189 @@
+# utils/embedding_scheduler.py
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from langchain_core.embeddings import Embeddings
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+# Long-lived event loop for synchronous callers. Async HTTP clients keep their
+# connection pools bound to one loop, so reusing a single loop keeps connections
+# to the provider alive between builds.
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="embedding-scheduler", daemon=True).start()
+        return _loop
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken, or estimates ~4 characters per token if the encoding is unavailable offline."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(config.EMBEDDING_TOKEN_ENCODING)
+                except Exception as e:
+                    logging.warning(f"tiktoken encoding unavailable ({e}); estimating token counts from length.")
+                    _encoding = False
+    if _encoding is False:
+        return max(1, len(text) // 4)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def pack_batches(texts, max_tokens: int, max_texts: int):
+    """Greedily packs text indices into batches bounded by total tokens and item count.
+
+    A single text larger than max_tokens gets a batch of its own.
+    """
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_texts):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate limits (HTTP 429), server errors and connection problems."""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    return name in ("RateLimitError", "APIConnectionError", "APITimeoutError") or isinstance(
+        error, (ConnectionError, TimeoutError, asyncio.TimeoutError)
+    )
+
+
+def _retry_after(error: Exception):
+    """Returns the server's Retry-After hint in seconds, if the error carries one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingScheduler:
+    """Runs embedding requests concurrently with token-aware batching and backoff on rate limits.
+
+    `embed_batch` is an async callable taking a list of texts and returning their vectors; any
+    object with `aembed_documents` (every langchain Embeddings) can be adapted with
+    `from_embeddings`, which also makes it easy to drive against a stub in tests. `on_batch`
+    is called with (texts, vectors) as each request completes, so callers can persist progress
+    and a crashed build can resume from what was already stored.
+    """
+
+    def __init__(self, embed_batch, max_concurrency: int = None, max_batch_tokens: int = None,
+                 max_batch_texts: int = None, max_retries: int = None, backoff_seconds: float = None,
+                 max_backoff_seconds: float = None):
+        self.embed_batch = embed_batch
+        self.max_concurrency = max_concurrency or config.EMBEDDING_MAX_CONCURRENCY
+        self.max_batch_tokens = max_batch_tokens or config.EMBEDDING_BATCH_MAX_TOKENS
+        self.max_batch_texts = max_batch_texts or config.EMBEDDING_BATCH_MAX_TEXTS
+        self.max_retries = config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = config.EMBEDDING_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds or config.EMBEDDING_BACKOFF_MAX_SECONDS
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "texts": 0}
+
+    @classmethod
+    def from_embeddings(cls, embeddings: Embeddings, **kwargs):
+        return cls(embeddings.aembed_documents, **kwargs)
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    async def _run_batch(self, texts, semaphore, on_batch):
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self._count("requests")
+                    vectors = await self.embed_batch(texts)
+                    break
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    self._count("retries")
+                    delay = _retry_after(e)
+                    if delay is None:
+                        delay = min(self.max_backoff_seconds, self.backoff_seconds * (2 ** attempt))
+                        delay *= random.uniform(0.5, 1.0)  # Jitter so concurrent batches do not retry in lockstep
+                    logging.warning(f"Embedding request failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s.")
+                    await asyncio.sleep(delay)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(texts)} texts.")
+        self._count("texts", len(texts))
+        if on_batch is not None:
+            on_batch(texts, vectors)
+        return vectors
+
+    async def aembed(self, texts, on_batch=None) -> list:
+        """Embeds texts with at most max_concurrency requests in flight; returns vectors in input order."""
+        texts = list(texts)
+        if not texts:
+            return []
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches = pack_batches(texts, self.max_batch_tokens, self.max_batch_texts)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            self._run_batch([texts[i] for i in batch], semaphore, on_batch) for batch in batches
+        ))
+        vectors = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        if len(batches) > 1:
+            logging.info(f"Embedded {len(texts)} texts in {len(batches)} requests ({time.perf_counter() - started:.2f}s).")
+        return vectors
+
+    def embed(self, texts, on_batch=None) -> list:
+        """Synchronous entry point; runs aembed on the shared background event loop."""
+        return asyncio.run_coroutine_threadsafe(self.aembed(texts, on_batch), _background_loop()).result()
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings wrapper that sends document batches through an EmbeddingScheduler."""
+
+    def __init__(self, embeddings: Embeddings, scheduler: EmbeddingScheduler):
+        self.embeddings = embeddings
+        self.scheduler = scheduler
+        self.model_name = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None)
+
+    def embed_documents(self, texts):
+        return self.scheduler.embed(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.scheduler.aembed(texts)
+
+    def embed_query(self, text):
+        # Through the scheduler too: the client itself does not retry (its max_retries is 0).
+        return self.scheduler.embed([text])[0]
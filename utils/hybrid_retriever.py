@@ -0,0 +1,201 @@
+# utils/hybrid_retriever.py
+
+import heapq
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, List
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have if in into is it its of on or so such that the their then
+there these they this to was were will with what which who whom how when where why do does did can
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens without common English stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class ChunkBM25Index:
+    """Lexical BM25 index over document chunks, keyed by the same ids as the vector store.
+
+    Supports incremental add/remove so it can follow manifest-driven index syncs, and persists
+    as plain JSON next to the FAISS files.
+    """
+
+    def __init__(self, k1: float = None, b: float = None):
+        self.k1 = config.SEARCH_BM25_K1 if k1 is None else k1
+        self.b = config.SEARCH_BM25_B if b is None else b
+        self.doc_terms = {}  # chunk id -> {term: tf}
+        self.postings = {}   # term -> {chunk id: tf}
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, chunk_ids, texts):
+        for chunk_id, text in zip(chunk_ids, texts):
+            if chunk_id in self.doc_terms:
+                self.remove([chunk_id])
+            counts = dict(Counter(tokenize(text)))
+            self._insert(chunk_id, counts)
+
+    def _insert(self, chunk_id, counts):
+        self.doc_terms[chunk_id] = counts
+        self.doc_lengths[chunk_id] = sum(counts.values())
+        self.total_length += self.doc_lengths[chunk_id]
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+
+    def remove(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            counts = self.doc_terms.pop(chunk_id, None)
+            if counts is None:
+                continue
+            self.total_length -= self.doc_lengths.pop(chunk_id)
+            for term in counts:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def search(self, query: str, k: int) -> list:
+        """Returns up to k (chunk id, score) pairs, best first."""
+        n_docs = len(self.doc_terms)
+        if n_docs == 0:
+            return []
+        avg_length = self.total_length / n_docs or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[chunk_id] / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "doc_terms": self.doc_terms}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        index = cls(k1=data.get("k1"), b=data.get("b"))
+        for chunk_id, counts in data["doc_terms"].items():
+            index._insert(chunk_id, counts)
+        return index
+
+    @classmethod
+    def from_vector_store(cls, vector_store):
+        """Builds the lexical index from the chunks already stored in a FAISS docstore."""
+        index = cls()
+        chunk_ids = list(vector_store.index_to_docstore_id.values())
+        docs = [vector_store.docstore.search(chunk_id) for chunk_id in chunk_ids]
+        pairs = [(chunk_id, doc.page_content) for chunk_id, doc in zip(chunk_ids, docs) if isinstance(doc, Document)]
+        index.add([chunk_id for chunk_id, _ in pairs], [text for _, text in pairs])
+        return index
+
+
+def reciprocal_rank_fusion(rankings, rrf_k: int) -> dict:
+    """Fuses ranked id lists: score(id) = sum over lists of 1 / (rrf_k + rank)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (rrf_k + rank)
+    return fused
+
+
+class HybridRetriever(BaseRetriever):
+    """Combines FAISS similarity search and BM25 keyword search with reciprocal rank fusion.
+
+    Each side contributes its top `fetch_k` chunks; the fused list is cut to `k`, optionally
+    after maximal marginal relevance (MMR) re-ranking so near-duplicate chunks do not crowd
+    out other evidence.
+    """
+
+    vector_store: Any
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    use_mmr: bool = False
+    mmr_lambda: float = 0.7
+    rrf_k: int = 60
+
+    def _candidate_vectors(self, docs) -> np.ndarray:
+        """Unit vectors for candidate chunks, read back from FAISS (or re-embedded if the index cannot reconstruct)."""
+        store = self.vector_store
+        try:
+            if hasattr(store, "labels_for"):
+                positions = store.labels_for([doc.id for doc in docs])
+            else:
+                positions = {chunk_id: pos for pos, chunk_id in store.index_to_docstore_id.items()}
+            vectors = np.vstack([store.index.reconstruct(int(positions[doc.id])) for doc in docs])
+        except Exception:
+            vectors = np.asarray(store.embedding_function.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def _mmr(self, docs, relevance) -> list:
+        vectors = self._candidate_vectors(docs)
+        relevance = np.asarray(relevance, dtype=np.float32)
+        relevance = relevance / relevance.max()
+        selected = []
+        max_similarity = np.zeros(len(docs), dtype=np.float32)
+        available = np.ones(len(docs), dtype=bool)
+        for _ in range(min(self.k, len(docs))):
+            mmr_scores = self.mmr_lambda * relevance - (1.0 - self.mmr_lambda) * max_similarity
+            mmr_scores[~available] = -np.inf
+            best = int(np.argmax(mmr_scores))
+            selected.append(best)
+            available[best] = False
+            max_similarity = np.maximum(max_similarity, vectors @ vectors[best])
+        return [docs[i] for i in selected]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.fuse(query, self.vector_store.similarity_search(query, k=self.fetch_k))
+
+    def fuse(self, query: str, dense: List[Document]) -> List[Document]:
+        """Fuses the dense hits for `query` (best first, up to fetch_k) with its BM25 hits.
+
+        Split out of retrieval so callers that run one FAISS search for many queries
+        (utils.rag_batch) get the same ranking as a single query.
+        """
+        docs_by_id = {doc.id: doc for doc in dense}
+        rankings = [[doc.id for doc in dense]]
+        if self.lexical_index is not None:
+            lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, self.fetch_k)]
+            rankings.append(lexical_ids)
+            for chunk_id in lexical_ids:
+                if chunk_id not in docs_by_id:
+                    doc = self.vector_store.docstore.search(chunk_id)
+                    if isinstance(doc, Document):
+                        doc.id = chunk_id
+                        docs_by_id[chunk_id] = doc
+        fused = reciprocal_rank_fusion(rankings, self.rrf_k)
+        ranked = sorted((chunk_id for chunk_id in fused if chunk_id in docs_by_id), key=lambda c: -fused[c])
+        if not ranked:
+            return []
+        if self.use_mmr and len(ranked) > self.k:
+            candidates = ranked[:self.fetch_k]
+            return self._mmr([docs_by_id[c] for c in candidates], [fused[c] for c in candidates])
+        return [docs_by_id[c] for c in ranked[:self.k]]
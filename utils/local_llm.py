@@ -0,0 +1,69 @@
+# utils/local_llm.py
+
+import re
+import time
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import config
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_CONTEXT_MARKER = "----------------"
+
+
+class LocalExtractiveChatModel(BaseChatModel):
+    """Offline stand-in for the chat model used by the RAG chain.
+
+    It answers with the context sentences that share the most words with the question and
+    streams them word by word, so streaming, caching and benchmarks can run without network
+    access. It understands the stuff-chain prompt (context in the system message, question in
+    the last human message).
+    """
+
+    max_sentences: int = 2
+    token_delay_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-extractive"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        context = "\n".join(m.content for m in messages if not isinstance(m, HumanMessage))
+        if _CONTEXT_MARKER in context:
+            context = context.split(_CONTEXT_MARKER, 1)[1]
+        question_words = {w.lower() for w in _WORD_RE.findall(question) if len(w) > 2}
+        sentences = [s.strip() for s in _SENTENCE_RE.split(context) if s.strip()]
+        if not sentences or not question_words:
+            return "I don't know."
+        scored = sorted(
+            enumerate(sentences),
+            key=lambda item: (-len(question_words & {w.lower() for w in _WORD_RE.findall(item[1])}), item[0]),
+        )
+        best = [i for i, sentence in scored[:self.max_sentences]
+                if question_words & {w.lower() for w in _WORD_RE.findall(sentence)}]
+        if not best:
+            return "I don't know."
+        return " ".join(sentences[i] for i in sorted(best))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for i, word in enumerate(self._answer(messages).split(" ")):
+            if self.token_delay_seconds:
+                time.sleep(self.token_delay_seconds)
+            token = word if i == 0 else " " + word
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def create_local_llm() -> LocalExtractiveChatModel:
+    return LocalExtractiveChatModel(token_delay_seconds=config.LOCAL_LLM_TOKEN_DELAY_SECONDS)
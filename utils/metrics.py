@@ -0,0 +1,280 @@
+# utils/metrics.py
+"""Lightweight latency metrics and spans for catalog and RAG operations.
+
+Every instrumented operation ("database.load_books", "rag.retrieve", "openai.chat", ...)
+feeds a fixed-bucket histogram, so recording is a bisect and a few additions under one lock
+and memory does not grow with traffic. p50/p95/p99 are estimated from the buckets.
+
+    with metrics.span("rag.retrieve"):
+        docs = retriever.invoke(query)
+
+    @metrics.timed("database.load_books")
+    def load_books(): ...
+
+Spans nest per thread: when an outermost span takes longer than
+config.METRICS_SLOW_SPAN_SECONDS, its breakdown (every span finished inside it) is logged, so
+a slow query shows whether the time went to parsing, retrieval, prompt building or the LLM.
+
+The histograms are exported in Prometheus text format to config.METRICS_EXPORT_PATH
+and/or served on http://METRICS_HOST:METRICS_PORT/metrics (see start_exporter); the API
+serves them on GET /metrics.
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+# Upper bounds (seconds) of the histogram buckets: 10us to 100s in ~1.5x steps
+BUCKETS = tuple(m * 10.0 ** e for e in range(-5, 2) for m in (1, 1.5, 2, 3, 5, 7)) + (100.0,)
+
+_METRIC = "library_operation_duration_seconds"
+_ERRORS_METRIC = "library_operation_errors_total"
+
+
+class Histogram:
+    """Latency distribution of one operation. Callers hold the module lock."""
+
+    __slots__ = ("counts", "count", "total", "max", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot: above the largest bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def record(self, seconds: float, error: bool = False):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates the q-quantile by interpolating within its bucket."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= target:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (target - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+
+_lock = threading.Lock()
+_histograms = {}
+_local = threading.local()
+# Spans kept for an outermost span's slow-operation breakdown (long builds finish thousands)
+_MAX_TRACE = 100
+
+
+def observe(operation: str, seconds: float, error: bool = False):
+    """Records one timed occurrence of `operation`."""
+    with _lock:
+        histogram = _histograms.get(operation)
+        if histogram is None:
+            histogram = _histograms[operation] = Histogram()
+        histogram.record(seconds, error)
+
+
+class _Span:
+    __slots__ = ("operation", "started", "trace")
+
+    def __init__(self, operation: str):
+        self.operation = operation
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        # The outermost span collects the timings of everything finished inside it.
+        self.trace = stack[0].trace if stack else []
+        stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        stack = _local.stack
+        if stack[-1] is self:
+            stack.pop()
+        else:
+            stack.remove(self)  # closed out of order, e.g. by a generator that was left suspended
+        observe(self.operation, elapsed, error=exc_type is not None)
+        if len(self.trace) < _MAX_TRACE or not stack:
+            self.trace.append((len(stack), self.operation, self.started, elapsed))
+        if not stack and elapsed >= config.METRICS_SLOW_SPAN_SECONDS:
+            _log_slow(self.trace)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(operation: str):
+    """Context manager timing the block as one occurrence of `operation` (errors are counted too)."""
+    return _Span(operation) if config.METRICS_ENABLED else _NULL_SPAN
+
+
+def timed(operation: str):
+    """Decorator: times every call of the function as `operation`."""
+    def decorate(fn):
+        if not config.METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _log_slow(trace: list):
+    _, operation, _, elapsed = trace[-1]
+    # Spans finish innermost first; list them in the order they started.
+    lines = [f"{'  ' * (depth + 1)}{op}: {seconds * 1000:.1f} ms"
+             for depth, op, _, seconds in sorted(trace[:-1], key=lambda entry: entry[2])]
+    logging.warning(f"Slow operation {operation}: {elapsed * 1000:.1f} ms" + ("\n" + "\n".join(lines) if lines else ""))
+
+
+# --- Reading ---
+
+def snapshot() -> list:
+    """Per-operation statistics (seconds), slowest p95 first."""
+    with _lock:
+        rows = [{
+            "operation": operation,
+            "count": h.count,
+            "errors": h.errors,
+            "mean": h.total / h.count if h.count else 0.0,
+            "p50": h.quantile(0.50),
+            "p95": h.quantile(0.95),
+            "p99": h.quantile(0.99),
+            "max": h.max,
+            "total": h.total,
+        } for operation, h in _histograms.items()]
+    return sorted(rows, key=lambda row: row["p95"], reverse=True)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    """All histograms in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        histograms = [(operation, list(h.counts), h.count, h.total, h.errors) for operation, h in sorted(_histograms.items())]
+    lines = [
+        f"# HELP {_METRIC} Latency of library catalog and RAG operations.",
+        f"# TYPE {_METRIC} histogram",
+    ]
+    for operation, counts, count, total, _ in histograms:
+        label = f'operation="{_label(operation)}"'
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            lines.append(f'{_METRIC}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{_METRIC}_bucket{{{label},le="+Inf"}} {count}')
+        lines.append(f"{_METRIC}_sum{{{label}}} {total!r}")
+        lines.append(f"{_METRIC}_count{{{label}}} {count}")
+    lines += [
+        f"# HELP {_ERRORS_METRIC} Library operations that raised an exception.",
+        f"# TYPE {_ERRORS_METRIC} counter",
+    ]
+    for operation, _, _, _, errors in histograms:
+        lines.append(f'{_ERRORS_METRIC}{{operation="{_label(operation)}"}} {errors}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=None):
+    """Atomically writes prometheus_text() to `path` (default config.METRICS_EXPORT_PATH)."""
+    path = path or config.METRICS_EXPORT_PATH
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+# --- Export ---
+
+_exporter_lock = threading.Lock()
+_exporter_started = False
+
+
+def _export_file_loop():
+    while True:
+        time.sleep(config.METRICS_EXPORT_INTERVAL_SECONDS)
+        try:
+            write_prometheus()
+        except OSError as e:
+            logging.error(f"Could not write metrics to {config.METRICS_EXPORT_PATH}: {e}")
+
+
+def _serve_http():
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((config.METRICS_HOST, config.METRICS_PORT), MetricsHandler)
+    except OSError as e:
+        logging.error(f"Could not serve metrics on {config.METRICS_HOST}:{config.METRICS_PORT}: {e}")
+        return
+    logging.info(f"Serving metrics on http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+    server.serve_forever()
+
+
+def start_exporter():
+    """Starts the configured exporters (file and/or HTTP endpoint) once per process. Safe to call on every rerun."""
+    global _exporter_started
+    if not config.METRICS_ENABLED:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    if config.METRICS_EXPORT_PATH:
+        threading.Thread(target=_export_file_loop, name="metrics-file", daemon=True).start()
+    if config.METRICS_PORT:
+        threading.Thread(target=_serve_http, name="metrics-http", daemon=True).start()
@@ -0,0 +1,91 @@
+# utils/notifier.py
+
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+logging.basicConfig(level=logging.INFO)
+
+# User-facing messages from the service core (utils.*) go through a notifier sink instead of
+# calling Streamlit directly, so the same code runs under the Streamlit app, the HTTP API
+# (api.py) and batch jobs. Operators still get the details from logging; the sink decides
+# whether and how to show the short message to an end user.
+
+
+class Notifier:
+    """Default sink for headless use: messages are already logged by the caller, so they are
+    only echoed at debug level, and `busy` is a no-op."""
+
+    def error(self, message: str):
+        logging.debug(f"[notify:error] {message}")
+
+    def warning(self, message: str):
+        logging.debug(f"[notify:warning] {message}")
+
+    def info(self, message: str):
+        logging.debug(f"[notify:info] {message}")
+
+    def busy(self, message: str):
+        """Context manager shown around long-running work (a spinner in the UI)."""
+        return nullcontext()
+
+
+class CollectingNotifier(Notifier):
+    """Keeps the messages of one unit of work, e.g. to return them in an API response."""
+
+    def __init__(self):
+        self.messages = []
+
+    def error(self, message: str):
+        super().error(message)
+        self.messages.append(("error", message))
+
+    def warning(self, message: str):
+        super().warning(message)
+        self.messages.append(("warning", message))
+
+    def info(self, message: str):
+        super().info(message)
+        self.messages.append(("info", message))
+
+
+_default = Notifier()
+_local = threading.local()
+
+
+def set_notifier(notifier: Notifier):
+    """Installs the process-wide sink (the Streamlit app installs one that renders st.error etc.)."""
+    global _default
+    _default = notifier
+
+
+def get_notifier() -> Notifier:
+    """Returns the sink for the current thread: a `notifying()` override, else the process-wide one."""
+    return getattr(_local, "notifier", None) or _default
+
+
+@contextmanager
+def notifying(notifier: Notifier):
+    """Routes messages raised on this thread to `notifier` for the duration of the block."""
+    previous = getattr(_local, "notifier", None)
+    _local.notifier = notifier
+    try:
+        yield notifier
+    finally:
+        _local.notifier = previous
+
+
+def error(message: str):
+    get_notifier().error(message)
+
+
+def warning(message: str):
+    get_notifier().warning(message)
+
+
+def info(message: str):
+    get_notifier().info(message)
+
+
+def busy(message: str):
+    return get_notifier().busy(message)
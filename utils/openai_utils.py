@@ -1,9 +1,12 @@
 import os
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import time
 from dotenv import load_dotenv
 import config
-import streamlit as st
 import logging
+from utils.embedding_cache import CachedEmbeddings, EmbeddingStore, LocalHashEmbeddings
+from utils.embedding_scheduler import EmbeddingScheduler, ScheduledEmbeddings
+from utils.local_llm import create_local_llm
+from utils import metrics, notifier
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,51 +16,131 @@ def get_openai_key():
     api_key = config.OPENAI_API_KEY
     if not api_key or api_key == "sk-...":
         logging.error("OpenAI API Key not configured properly.")
-        st.error("OpenAI API Key is missing or invalid. Please check your .env file.")
+        notifier.error("OpenAI API Key is missing or invalid. Please check your .env file.")
         return None
     return api_key
 
 # Global instances (initialized once)
 _openai_llm = None
 _openai_embeddings = None
+_http_clients = None
+
+def _http_operation(request) -> str:
+    """Metric name for an OpenAI API request: "/v1/chat/completions" -> "openai.chat.completions"."""
+    path = request.url.path.strip("/").split("/")
+    return "openai." + ".".join(part for part in path[1:] if part) if len(path) > 1 else "openai.request"
+
+def _on_request(request):
+    request.extensions["library_started"] = time.perf_counter()
+
+def _on_response(response):
+    # Runs once the response headers arrive: for streamed completions this is the time to the first token.
+    started = response.request.extensions.get("library_started")
+    if started is not None:
+        metrics.observe(_http_operation(response.request), time.perf_counter() - started,
+                        error=response.status_code >= 400)
+
+async def _on_request_async(request):
+    _on_request(request)
+
+async def _on_response_async(response):
+    _on_response(response)
+
+def get_http_clients():
+    """Returns the (sync, async) httpx clients shared by every OpenAI model in this process.
+
+    One pooled client per process keeps TLS connections to the API alive across requests,
+    so concurrent API/UI queries reuse connections instead of opening one per call.
+    """
+    global _http_clients
+    if _http_clients is None:
+        import httpx
+        limits = httpx.Limits(
+            max_connections=config.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        timeout = httpx.Timeout(config.OPENAI_TIMEOUT_SECONDS)
+        # Every request to the API is timed per endpoint (utils.metrics).
+        _http_clients = (
+            httpx.Client(limits=limits, timeout=timeout,
+                         event_hooks={"request": [_on_request], "response": [_on_response]}),
+            httpx.AsyncClient(limits=limits, timeout=timeout,
+                              event_hooks={"request": [_on_request_async], "response": [_on_response_async]}),
+        )
+    return _http_clients
 
 def get_llm():
-    """Initializes and returns the OpenAI LLM instance."""
+    """Initializes and returns the LLM instance (OpenAI, or the offline local model)."""
     global _openai_llm
+    if _openai_llm is None and config.LLM_BACKEND == "local":
+        _openai_llm = create_local_llm()
+        logging.info("Local extractive LLM initialized.")
     if _openai_llm is None:
         api_key = get_openai_key()
         if api_key:
             try:
+                # Imported here: the OpenAI client is a large import and offline backends never need it.
+                from langchain_openai import ChatOpenAI
                 # You can customize the model name if needed, e.g., "gpt-4"
-                _openai_llm = ChatOpenAI(openai_api_key=api_key, model_name="gpt-3.5-turbo")
+                http_client, http_async_client = get_http_clients()
+                with metrics.span("openai.create_llm"):
+                    _openai_llm = ChatOpenAI(openai_api_key=api_key, model_name="gpt-3.5-turbo",
+                                             http_client=http_client, http_async_client=http_async_client)
                 logging.info("OpenAI LLM initialized.")
             except Exception as e:
                 logging.error(f"Failed to initialize OpenAI LLM: {e}")
-                st.error(f"Failed to initialize OpenAI LLM. Check API key and network. Error: {e}")
+                notifier.error(f"Failed to initialize OpenAI LLM. Check API key and network. Error: {e}")
                 return None
         else:
             return None # API key error handled in get_openai_key
     return _openai_llm
 
+def _create_base_embeddings():
+    """Creates the uncached embeddings model selected by config.EMBEDDING_BACKEND. Returns (embeddings, model name)."""
+    if config.EMBEDDING_BACKEND == "local":
+        local = LocalHashEmbeddings()
+        return local, local.model_name
+    api_key = get_openai_key()
+    if not api_key:
+        return None, None # API key error handled in get_openai_key
+    # You can choose different embedding models if desired.
+    # Retries on 429s are handled by the EmbeddingScheduler, so the client itself does not retry.
+    from langchain_openai import OpenAIEmbeddings
+    http_client, http_async_client = get_http_clients()
+    embeddings = OpenAIEmbeddings(openai_api_key=api_key, model=config.OPENAI_EMBEDDING_MODEL, max_retries=0,
+                                  http_client=http_client, http_async_client=http_async_client)
+    return embeddings, config.OPENAI_EMBEDDING_MODEL
+
 def get_embeddings():
-    """Initializes and returns the OpenAI Embeddings instance."""
+    """Initializes and returns the embeddings instance (OpenAI or local), wrapped in the persistent cache."""
     global _openai_embeddings
     if _openai_embeddings is None:
-        api_key = get_openai_key()
-        if api_key:
-            try:
-                 # You can choose different embedding models if desired
-                _openai_embeddings = OpenAIEmbeddings(openai_api_key=api_key)
-                logging.info("OpenAI Embeddings initialized.")
-            except Exception as e:
-                logging.error(f"Failed to initialize OpenAI Embeddings: {e}")
-                st.error(f"Failed to initialize OpenAI Embeddings. Check API key and network. Error: {e}")
+        try:
+            with metrics.span("openai.create_embeddings"):
+                base_embeddings, model_name = _create_base_embeddings()
+            if base_embeddings is None:
                 return None
-        else:
-            return None # API key error handled in get_openai_key
+            scheduler = EmbeddingScheduler.from_embeddings(base_embeddings)
+            if config.EMBEDDING_CACHE_ENABLED:
+                store = EmbeddingStore(config.EMBEDDING_CACHE_PATH, config.EMBEDDING_CACHE_MAX_BYTES)
+                _openai_embeddings = CachedEmbeddings(base_embeddings, model_name, store, scheduler=scheduler)
+            else:
+                _openai_embeddings = ScheduledEmbeddings(base_embeddings, scheduler)
+            logging.info(f"Embeddings initialized ({model_name}, cache {'on' if config.EMBEDDING_CACHE_ENABLED else 'off'}).")
+        except Exception as e:
+            logging.error(f"Failed to initialize embeddings: {e}")
+            notifier.error(f"Failed to initialize OpenAI Embeddings. Check API key and network. Error: {e}")
+            return None
     return _openai_embeddings
 
+def get_embedding_model_name(embeddings=None) -> str:
+    """Returns the identifier of the model behind an embeddings instance (defaults to get_embeddings())."""
+    embeddings = embeddings or get_embeddings()
+    name = getattr(embeddings, 'model_name', None) or getattr(embeddings, 'model', None)
+    return name or type(embeddings).__name__
+
 # Example of a direct call (though RAG engine will likely use the initialized instances)
+@metrics.timed("openai.generate_summary")
 def generate_summary(text: str) -> str:
     """Generates a summary of the given text using OpenAI."""
     llm = get_llm()
@@ -70,5 +153,5 @@ def generate_summary(text: str) -> str:
         return response.content # Access content attribute for the response string
     except Exception as e:
         logging.error(f"Error during OpenAI summary generation: {e}")
-        st.error(f"An error occurred while generating the summary: {e}")
+        notifier.error(f"An error occurred while generating the summary: {e}")
         return "Error generating summary."
\ No newline at end of file
@@ -0,0 +1,383 @@
+# utils/rag_batch.py
+"""Batch RAG runs: answer, or evaluate retrieval for, a JSON Lines file of questions.
+
+Each line holds one question, as a JSON string or an object:
+
+    {"id": "q1", "question": "Who wrote article 2?", "relevant": ["article2.txt"]}
+
+`relevant` is optional and lists what retrieval should find, by chunk id, document path
+(relative to the documents folder) or file name. Questions that have it are scored with
+recall@k: the fraction of those entries matched by the k chunks passed to the LLM.
+
+Questions are processed config.RAG_BATCH_SIZE at a time. Each batch is embedded with one
+embed_documents call (which the embedding scheduler splits into concurrent requests) and
+searched with a single FAISS search; the hits are then fused with BM25 exactly as the
+chain's retriever would, and answered through the chain's stuff prompt by up to
+config.RAG_BATCH_CONCURRENCY concurrent LLM calls. Results are streamed as they complete,
+so they are not in input order (`index` is the question's position in the input). Each
+carries per-stage timings in seconds; embedding and search run once per batch, so every
+question is charged an equal share. The answer cache is bypassed, so repeated runs
+measure the same work.
+
+    python -m utils.rag_batch questions.jsonl -o results.jsonl [-k 4] [--concurrency 8] [--retrieval-only]
+    python -m utils.rag_batch questions.jsonl -o results.jsonl --offline --build
+
+--offline uses the local hashing embedder and extractive chat model (no network); --build
+first brings the document index up to date, e.g. after switching embedders.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+import config
+from utils import metrics
+
+logging.basicConfig(level=logging.INFO)
+
+_STAGES = ("embed", "search", "retrieve", "prompt", "llm_wait", "llm")
+
+
+def parse_question(value, default_id=None) -> dict:
+    """Normalizes one input question (a string or an object) to {"id", "question", "relevant"}.
+
+    Raises ValueError if it has no question text.
+    """
+    if isinstance(value, str):
+        value = {"question": value}
+    if not isinstance(value, dict):
+        raise ValueError(f"expected a string or an object, got {type(value).__name__}")
+    question = value.get("question", value.get("query"))
+    if not isinstance(question, str) or not question.strip():
+        raise ValueError("missing 'question'")
+    relevant = value.get("relevant") or []
+    if isinstance(relevant, str):
+        relevant = [relevant]
+    return {
+        "id": value.get("id", default_id),
+        "question": question.strip(),
+        "relevant": list(dict.fromkeys(str(item) for item in relevant)),
+    }
+
+
+def read_questions(path):
+    """Yields the questions of a JSON Lines file, one per non-blank line.
+
+    Lines that cannot be parsed yield {"id": line number, "error": reason} instead, so one bad
+    line does not stop a run of thousands. Questions without an id get their line number.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield parse_question(json.loads(line), default_id=line_number)
+            except ValueError as e:  # json.JSONDecodeError is a ValueError
+                yield {"id": line_number, "error": f"line {line_number}: {e}"}
+
+
+def _source_keys(doc, docs_dir) -> set:
+    source = str(doc.metadata.get("source", ""))
+    keys = {doc.id, source, os.path.basename(source)}
+    if source:
+        relative = os.path.relpath(os.path.abspath(source), docs_dir)
+        if not relative.startswith(os.pardir):
+            keys.add(relative.replace(os.sep, "/"))
+    return keys
+
+
+def recall_at_k(relevant, docs, docs_dir=None):
+    """Fraction of `relevant` (chunk ids, document paths or file names) matched by `docs`; None if nothing is relevant."""
+    if not relevant:
+        return None
+    docs_dir = docs_dir or os.path.abspath(config.DOCUMENTS_DIR)
+    found = set()
+    for doc in docs:
+        found |= _source_keys(doc, docs_dir)
+    return sum(1 for item in relevant if item in found) / len(relevant)
+
+
+def _with_k(retriever, k):
+    """A copy of the retriever that returns `k` chunks (the shared chain's retriever is left alone)."""
+    if k is None:
+        return retriever
+    if hasattr(retriever, "fetch_k"):
+        return retriever.model_copy(update={"k": k, "fetch_k": max(retriever.fetch_k, k)})
+    search_kwargs = {**retriever.search_kwargs, "k": k}
+    if "fetch_k" in search_kwargs:
+        search_kwargs["fetch_k"] = max(search_kwargs["fetch_k"], k)
+    return retriever.model_copy(update={"search_kwargs": search_kwargs})
+
+
+def _describe(doc) -> dict:
+    source = {"chunk_id": doc.id, "source": doc.metadata.get("source")}
+    if "page" in doc.metadata:
+        source["page"] = doc.metadata["page"]
+    return source
+
+
+def _invoke_llm(llm, prompt, submitted):
+    started = time.perf_counter()
+    response = llm.invoke(prompt.to_messages())
+    finished = time.perf_counter()
+    metrics.observe("rag_batch.llm", finished - started)
+    return getattr(response, "content", response), started - submitted, finished - started
+
+
+def _finish(result, timings):
+    timings["total"] = sum(seconds for stage, seconds in timings.items() if stage != "llm_wait")
+    result["timings"] = {stage: round(seconds, 6) for stage, seconds in timings.items()}
+    return result
+
+
+def _retrieve_batch(block, retriever, vector_store):
+    """Embeds and searches a batch of questions at once.
+
+    Returns (query vectors, [(Document, score)] hits per question, embed seconds, search seconds).
+    """
+    started = time.perf_counter()
+    vectors = vector_store.embedding_function.embed_documents([record["question"] for record in block])
+    embedded = time.perf_counter()
+    metrics.observe("rag_batch.embed", embedded - started)
+    if vectors and len(vectors[0]) != vector_store.index.d:
+        raise ValueError(f"Question embeddings have {len(vectors[0])} dimensions but the index has "
+                         f"{vector_store.index.d}; rebuild the index for this embedder.")
+    if hasattr(retriever, "fuse"):
+        hits = vector_store.search_batch(vectors, retriever.fetch_k)
+    elif retriever.search_type == "similarity":
+        hits = vector_store.search_batch(vectors, retriever.search_kwargs.get("k", config.RETRIEVAL_K))
+    else:
+        # MMR needs each query's candidate vectors; FAISS is searched per question here.
+        hits = [None] * len(vectors)
+    searched = time.perf_counter()
+    metrics.observe("rag_batch.search", searched - embedded)
+    return vectors, hits, embedded - started, searched - embedded
+
+
+def iter_batch_answers(questions, qa_chain=None, retriever=None, k: int = None, batch_size: int = None,
+                       concurrency: int = None):
+    """Runs many questions through retrieval and, if `qa_chain` is given, the LLM; yields one result per question.
+
+    `questions` are strings, objects as in a questions file, or parse_question() records.
+    Without a chain only retrieval is run and scored (pass `retriever`, e.g.
+    rag_engine.get_retriever(vector_store)). Results are yielded as they complete, with at
+    most `concurrency` LLM calls in flight and as many more prompts queued, so memory
+    stays bounded however long the input is.
+    """
+    retriever = _with_k(retriever or qa_chain.retriever, k)
+    vector_store = getattr(retriever, "vector_store", None) or retriever.vectorstore
+    k = retriever.k if hasattr(retriever, "fuse") else retriever.search_kwargs.get("k", config.RETRIEVAL_K)
+    batch_size = batch_size or config.RAG_BATCH_SIZE
+    concurrency = concurrency or config.RAG_BATCH_CONCURRENCY
+    llm = qa_chain.combine_documents_chain.llm_chain.llm if qa_chain is not None else None
+    docs_dir = os.path.abspath(config.DOCUMENTS_DIR)
+    from utils.rag_engine import _stuffed_prompt
+
+    def records():
+        for index, value in enumerate(questions):
+            if isinstance(value, dict) and "error" in value:
+                yield index, value
+                continue
+            try:
+                yield index, parse_question(value, default_id=index)
+            except ValueError as e:
+                yield index, {"id": index, "error": str(e)}
+
+    def completed(pending, block: bool):
+        if not pending:
+            return []
+        done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        finished = []
+        for future in done:
+            result, timings = pending.pop(future)
+            try:
+                result["answer"], timings["llm_wait"], timings["llm"] = future.result()
+            except Exception as e:
+                logging.warning(f"Batch RAG: LLM call failed for question {result['id']!r}: {e}")
+                result["error"] = f"LLM call failed: {e}"
+            finished.append(_finish(result, timings))
+        return finished
+
+    inputs = records()
+    pending = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rag-batch") as pool:
+        try:
+            while True:
+                block = list(islice(inputs, batch_size))
+                if not block:
+                    break
+                valid = [(index, record) for index, record in block if "error" not in record]
+                for index, record in block:
+                    if "error" in record:
+                        yield {"index": index, "id": record["id"], "question": None, "error": record["error"]}
+                if not valid:
+                    continue
+                try:
+                    vectors, hits, embed_seconds, search_seconds = _retrieve_batch(
+                        [record for _, record in valid], retriever, vector_store)
+                except ValueError:
+                    raise  # The embedder does not match the index: every batch would fail.
+                except Exception as e:
+                    logging.error(f"Batch RAG: retrieval failed for a batch of {len(valid)} questions: {e}", exc_info=True)
+                    for index, record in valid:
+                        yield {"index": index, "id": record["id"], "question": record["question"],
+                               "error": f"Retrieval failed: {e}"}
+                    continue
+
+                for (index, record), vector, dense in zip(valid, vectors, hits):
+                    result = {"index": index, "id": record["id"], "question": record["question"], "answer": None,
+                              "sources": [], "relevant": record["relevant"], "recall_at_k": None, "k": k,
+                              "error": None}
+                    timings = dict.fromkeys(_STAGES, 0.0)
+                    timings["embed"] = embed_seconds / len(valid)
+                    timings["search"] = search_seconds / len(valid)
+                    try:
+                        started = time.perf_counter()
+                        if dense is None:
+                            docs = vector_store.max_marginal_relevance_search_by_vector(vector, **retriever.search_kwargs)
+                        elif hasattr(retriever, "fuse"):
+                            docs = retriever.fuse(record["question"], [doc for doc, _ in dense])
+                        else:
+                            docs = [doc for doc, _ in dense]
+                        timings["retrieve"] = time.perf_counter() - started
+                        result["sources"] = [_describe(doc) for doc in docs]
+                        result["recall_at_k"] = recall_at_k(record["relevant"], docs, docs_dir)
+                        if llm is None:
+                            yield _finish(result, timings)
+                            continue
+                        started = time.perf_counter()
+                        prompt = _stuffed_prompt(qa_chain, record["question"], docs)
+                        timings["prompt"] = time.perf_counter() - started
+                    except Exception as e:
+                        logging.warning(f"Batch RAG: retrieval failed for question {record['id']!r}: {e}")
+                        result["error"] = f"Retrieval failed: {e}"
+                        yield _finish(result, timings)
+                        continue
+                    while len(pending) >= 2 * concurrency:
+                        yield from completed(pending, block=True)
+                    pending[pool.submit(_invoke_llm, llm, prompt, time.perf_counter())] = (result, timings)
+                yield from completed(pending, block=False)
+            while pending:
+                yield from completed(pending, block=True)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _summarize(results, started) -> dict:
+    elapsed = time.perf_counter() - started
+    scored = [r["recall_at_k"] for r in results if r.get("recall_at_k") is not None]
+    timed_results = [r["timings"] for r in results if "timings" in r]
+    totals = sorted(t["total"] for t in timed_results)
+    return {
+        "questions": len(results),
+        "answered": sum(1 for r in results if r.get("answer") is not None and not r.get("error")),
+        "errors": sum(1 for r in results if r.get("error")),
+        "evaluated": len(scored),
+        "recall_at_k": sum(scored) / len(scored) if scored else None,
+        "hit_rate": sum(1 for r in scored if r > 0) / len(scored) if scored else None,
+        "k": next((r["k"] for r in results if "k" in r), None),
+        "seconds": elapsed,
+        "questions_per_second": len(results) / elapsed if elapsed > 0 else None,
+        "mean_seconds": {stage: sum(t[stage] for t in timed_results) / len(timed_results)
+                         for stage in _STAGES + ("total",)} if timed_results else {},
+        "p95_total_seconds": totals[min(len(totals) - 1, int(0.95 * len(totals)))] if totals else None,
+    }
+
+
+@metrics.timed("rag_batch.run_batch")
+def run_batch(questions, output_path, qa_chain=None, retriever=None, k: int = None, batch_size: int = None,
+              concurrency: int = None, progress=None) -> dict:
+    """Runs iter_batch_answers() and streams its results to `output_path` as JSON Lines.
+
+    `questions` is a path to a questions file or an iterable of questions. Each result line
+    is flushed as soon as it is complete. `progress`, if given, is called after every result
+    with {"questions": done so far, "errors": failed so far}. Returns the summary: counts, mean recall@k and hit rate
+    over the questions that list relevant sources, throughput and mean per-stage seconds.
+    """
+    if isinstance(questions, (str, os.PathLike)):
+        questions = read_questions(questions)
+    started = time.perf_counter()
+    results = []
+    errors = 0
+    with open(output_path, "w", encoding='utf-8') as f:
+        for result in iter_batch_answers(questions, qa_chain=qa_chain, retriever=retriever, k=k,
+                                         batch_size=batch_size, concurrency=concurrency):
+            f.write(json.dumps(result, default=str) + "\n")
+            f.flush()
+            # Only what the summary needs is kept, not the answers.
+            results.append({key: result.get(key) for key in ("answer", "error", "recall_at_k", "k", "timings")
+                            if key in result})
+            errors += bool(result.get("error"))
+            if progress:
+                progress({"questions": len(results), "errors": errors})
+    summary = _summarize(results, started)
+    logging.info(f"Batch RAG: {summary['questions']} questions in {summary['seconds']:.1f}s, "
+                 f"{summary['errors']} errors, results in {output_path}.")
+    return summary
+
+
+def open_engine(offline: bool = False, build: bool = False, answer: bool = True):
+    """Opens the published document index for a batch run. Returns (retriever, qa_chain or None).
+
+    `offline` switches to the local embedder and chat model; it must be set before anything
+    in the process has created the models. Raises RuntimeError if the index or the models
+    are unavailable, or if the index was built with a different embedding model.
+    """
+    if offline:
+        config.EMBEDDING_BACKEND = config.LLM_BACKEND = "local"
+    # Imported here: langchain/FAISS are only needed once a run starts.
+    from utils import rag_engine
+    from utils.openai_utils import get_embeddings, get_embedding_model_name, get_llm
+
+    if build and rag_engine.build_document_index() is None:
+        raise RuntimeError("Building the document index failed; see the log.")
+    embeddings = get_embeddings()
+    vector_store = rag_engine.load_vector_store(embeddings)
+    if vector_store is None:
+        raise RuntimeError("No document index is available; build it first (--build).")
+    indexed_model = (rag_engine.load_manifest(vector_store) or {}).get("embedding_model")
+    if indexed_model and indexed_model != get_embedding_model_name(embeddings):
+        raise RuntimeError(f"The index was built with {indexed_model!r}, not {get_embedding_model_name(embeddings)!r}; "
+                           f"rebuild it (--build).")
+    if not answer:
+        return rag_engine.get_retriever(vector_store), None
+    qa_chain = rag_engine.get_retrieval_qa_chain(vector_store, get_llm())
+    if qa_chain is None:
+        raise RuntimeError("Could not create the RAG query engine; is the LLM configured?")
+    return qa_chain.retriever, qa_chain
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Answer or evaluate a JSON Lines file of questions with the RAG engine.")
+    parser.add_argument("questions", help='one question per line: a JSON string or {"question": ..., "relevant": [...]}')
+    parser.add_argument("-o", "--output", required=True, help="results are streamed to this JSON Lines file")
+    parser.add_argument("-k", type=int, default=config.RETRIEVAL_K, help="chunks retrieved per question (recall@k)")
+    parser.add_argument("--batch-size", type=int, default=config.RAG_BATCH_SIZE, help="questions embedded and searched together")
+    parser.add_argument("--concurrency", type=int, default=config.RAG_BATCH_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--retrieval-only", action="store_true", help="retrieve and score recall@k, but skip the LLM")
+    parser.add_argument("--offline", action="store_true", help="local hashing embedder and extractive LLM (no network)")
+    parser.add_argument("--build", action="store_true", help="bring the document index up to date first")
+    args = parser.parse_args(argv)
+
+    try:
+        retriever, qa_chain = open_engine(offline=args.offline, build=args.build, answer=not args.retrieval_only)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return 1
+
+    def report(summary):
+        print(f"\r{summary['questions']:,} questions done, {summary['errors']:,} errors", end="", flush=True)
+
+    summary = run_batch(args.questions, args.output, qa_chain=qa_chain, retriever=retriever, k=args.k,
+                        batch_size=args.batch_size, concurrency=args.concurrency, progress=report)
+    print()
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,21 +1,38 @@
 # utils/rag_engine.py
 
 import os
+import json
+import hashlib
 import logging
-import streamlit as st
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
 # Updated Langchain imports
-from langchain_community.vectorstores import FAISS
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader, TextLoader # Use langchain_community
 from langchain.chains import RetrievalQA
-from utils.openai_utils import get_embeddings, get_llm
+from langchain_core.prompts import format_document
+from utils.openai_utils import get_embeddings, get_embedding_model_name, get_llm
+from utils.answer_cache import get_answer_cache
+from utils.hybrid_retriever import ChunkBM25Index, HybridRetriever
+from utils.vector_index import MappedFAISS, discard_checkpoint, read_meta
+from utils import metrics, notifier
 import config
 
 logging.basicConfig(level=logging.INFO)
 
-# Global variable for the vector store instance
-_vector_store = None
 
+# Loaders used for per-file (incremental) indexing, keyed by extension
+_FILE_LOADERS = {
+    ".txt": (TextLoader, {'encoding': 'utf-8'}),
+    ".pdf": (PyPDFLoader, {}),
+}
+
+@metrics.timed("rag.load_documents")
 def load_documents(docs_path):
     """Loads documents from the specified directory using appropriate loaders."""
     loaded_documents = []
@@ -57,7 +74,7 @@ def load_documents(docs_path):
 
         if not loaded_documents:
             logging.warning(f"No documents found or loaded from {docs_path}")
-            st.warning(f"No compatible documents (.txt, .pdf) were found in the '{config.DOCUMENTS_DIR.name}' directory.")
+            notifier.warning(f"No compatible documents (.txt, .pdf) were found in the '{config.DOCUMENTS_DIR.name}' directory.")
             return []
 
         logging.info(f"Total loaded {len(loaded_documents)} documents.")
@@ -67,18 +84,25 @@ def load_documents(docs_path):
          # Catch specific error if PyPDFLoader is used but pypdf isn't installed
          if 'pypdf' in str(ie).lower():
               logging.error(f"Import error loading PDFs: {ie}. Is 'pypdf' installed?")
-              st.error("Failed to load PDF documents. Please install 'pypdf': pip install pypdf")
+              notifier.error("Failed to load PDF documents. Please install 'pypdf': pip install pypdf")
          else:
               logging.error(f"Import error during document loading: {ie}")
-              st.error(f"A required library for document loading might be missing: {ie}")
+              notifier.error(f"A required library for document loading might be missing: {ie}")
          return []
     except Exception as e:
         # Catch other potential errors during loading
         logging.error(f"Error loading documents from {docs_path}: {e}", exc_info=True) # Log traceback
-        st.error(f"Failed to load documents. Check files in '{config.DOCUMENTS_DIR.name}' and ensure required libraries (like 'pypdf' for PDFs) are installed. Error: {e}")
+        notifier.error(f"Failed to load documents. Check files in '{config.DOCUMENTS_DIR.name}' and ensure required libraries (like 'pypdf' for PDFs) are installed. Error: {e}")
         return []
 
 
+def load_file(file_path):
+    """Loads a single document file with the loader registered for its extension."""
+    loader_cls, loader_kwargs = _FILE_LOADERS[Path(file_path).suffix.lower()]
+    return loader_cls(str(file_path), **loader_kwargs).load()
+
+
+@metrics.timed("rag.split_documents")
 def split_documents(documents):
     """Splits documents into chunks."""
     if not documents:
@@ -92,151 +116,725 @@ def split_documents(documents):
     logging.info(f"Split {len(documents)} documents into {len(chunks)} chunks.")
     return chunks
 
+# --- Streaming ingestion ---
+# Files are parsed and split in worker processes with a bounded number in
+# flight, and chunks flow to the index in fixed-size batches, so peak memory
+# depends on INGEST_BATCH_SIZE and INGEST_WORKERS rather than corpus size.
+
+def _load_and_split_file(file_path):
+    """Worker entry point: loads and splits one file. Returns (chunks, error message)."""
+    try:
+        return split_documents(load_file(file_path)), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _bounded_map(fn, items, workers):
+    """Like map(), fanned out over a process pool with at most 2*workers tasks in flight, results in order."""
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque(executor.submit(fn, item) for item in islice(items, workers * 2))
+        while in_flight:
+            result = in_flight.popleft().result()
+            for item in islice(items, 1):
+                in_flight.append(executor.submit(fn, item))
+            yield result
+
+
+def iter_file_chunks(file_paths, workers=None):
+    """Yields (file_path, chunks, error) per file, parsing and splitting in parallel."""
+    workers = config.INGEST_WORKERS if workers is None else workers
+    file_paths = list(file_paths)
+    # Plain text is cheap to parse; only pay for process start-up when there are PDFs.
+    if not any(Path(p).suffix.lower() == ".pdf" for p in file_paths):
+        workers = 1
+    for file_path, (chunks, error) in zip(file_paths, _bounded_map(_load_and_split_file, file_paths, workers)):
+        yield file_path, chunks, error
+
+
+def iter_batches(items, batch_size):
+    """Groups any iterable into lists of at most batch_size items."""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+@metrics.timed("rag.add_chunk_batch")
+def add_chunk_batch(vector_store, embeddings, batch):
+    """Embeds one batch of (chunk_id, Document) pairs and adds it to the index (creating it if None)."""
+    if vector_store is not None and hasattr(vector_store, "labels_for"):
+        # A resumed build may already hold some chunks of a file it was interrupted in.
+        present = vector_store.labels_for(chunk_id for chunk_id, _ in batch)
+        batch = [(chunk_id, doc) for chunk_id, doc in batch if chunk_id not in present]
+        if not batch:
+            return vector_store
+    texts = [doc.page_content for _, doc in batch]
+    metadatas = [doc.metadata for _, doc in batch]
+    ids = [chunk_id for chunk_id, _ in batch]
+    with metrics.span("rag.embed_documents"):
+        vectors = embeddings.embed_documents(texts)
+    if vector_store is None:
+        vector_store = MappedFAISS.create(embeddings, config.VECTOR_STORE_DIR)
+    vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+    return vector_store
+
+
+@metrics.timed("rag.create_vector_store")
 def create_vector_store(chunks, embeddings):
-    """Creates and persists the FAISS vector store."""
-    if not chunks:
-        logging.warning("No chunks provided to create vector store.")
-        return None
+    """Creates and persists the FAISS vector store, embedding the chunks (any iterable) batch by batch."""
     if not embeddings:
         logging.error("Embeddings model not available for vector store creation.")
-        st.error("Cannot create document index: Embeddings model is not available.")
+        notifier.error("Cannot create document index: Embeddings model is not available.")
         return None
 
     try:
-        vector_store = FAISS.from_documents(chunks, embeddings)
+        vector_store = None
+        numbered = ((str(i), chunk) for i, chunk in enumerate(chunks))
+        for batch in iter_batches(numbered, config.INGEST_BATCH_SIZE):
+            vector_store = add_chunk_batch(vector_store, embeddings, batch)
+        if vector_store is None:
+            logging.warning("No chunks provided to create vector store.")
+            return None
         vector_store_path = str(config.VECTOR_STORE_DIR)
         vector_store.save_local(vector_store_path)
         logging.info(f"Vector store created and saved at {vector_store_path}")
         return vector_store
     except Exception as e:
         logging.error(f"Failed to create or save vector store: {e}", exc_info=True)
-        st.error(f"Error creating the document index (vector store): {e}")
+        notifier.error(f"Error creating the document index (vector store): {e}")
         return None
 
-def load_vector_store(embeddings):
-    """Loads the FAISS vector store from local storage."""
+@metrics.timed("rag.load_vector_store")
+def load_vector_store(embeddings, read_only=True):
+    """Opens the saved FAISS index with its SQLite docstore; read-only opens are memory-mapped."""
     if not embeddings:
         logging.error("Embeddings model not available for loading vector store.")
-        st.error("Cannot load document index: Embeddings model is not available.")
+        notifier.error("Cannot load document index: Embeddings model is not available.")
         return None
 
-    index_path = str(config.VECTOR_STORE_DIR)
-    faiss_index_file = os.path.join(index_path, "index.faiss")
-    faiss_pkl_file = os.path.join(index_path, "index.pkl")
-
-    if not os.path.exists(faiss_index_file) or not os.path.exists(faiss_pkl_file):
-         logging.warning(f"Vector store index files not found at {index_path}. Need to create it first.")
-         return None
+    index_path = config.VECTOR_STORE_DIR
+    if not MappedFAISS.exists(index_path):
+        if (index_path / "index.pkl").exists():
+            # Indexes saved before the SQLite docstore are rebuilt (from the embedding cache) rather than unpickled.
+            logging.info(f"Found a pickled vector store at {index_path}; it will be rebuilt in the current format.")
+        else:
+            logging.warning(f"Vector store index files not found at {index_path}. Need to create it first.")
+        return None
     try:
-        # Allow dangerous deserialization for FAISS loading locally, accept the risk for this POC
-        vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-        logging.info(f"Vector store loaded successfully from {index_path}")
+        vector_store = MappedFAISS.open(index_path, embeddings, read_only=read_only)
+        if vector_store.index_type != config.FAISS_INDEX_TYPE:
+            logging.info(f"Saved index is {vector_store.index_type!r}, configured type is {config.FAISS_INDEX_TYPE!r}; rebuilding.")
+            return None
+        logging.info(f"Vector store loaded successfully from {index_path} ({vector_store.index.ntotal} vectors"
+                     f"{', memory-mapped' if read_only else ''})")
         return vector_store
     except Exception as e:
         logging.error(f"Failed to load vector store from {index_path}: {e}", exc_info=True)
-        st.error(f"Error loading existing document index. It might be corrupted or incompatible. Consider deleting the '{config.VECTOR_STORE_DIR.name}' folder and restarting. Error: {e}")
-        # Clean up potentially corrupted files? Be cautious here.
-        # try:
-        #     if os.path.exists(faiss_index_file): os.remove(faiss_index_file)
-        #     if os.path.exists(faiss_pkl_file): os.remove(faiss_pkl_file)
-        # except OSError as ose:
-        #     logging.error(f"Could not delete potentially corrupt index files: {ose}")
+        notifier.error(f"Error loading existing document index. It might be corrupted or incompatible. Consider deleting the '{config.VECTOR_STORE_DIR.name}' folder and restarting. Error: {e}")
         return None
 
+# --- Document manifest ---
+# The manifest records, per file in DOCUMENTS_DIR, its content hash and the ids
+# of the chunks it contributed to the index. It lets sync_vector_store embed
+# only new or changed files and drop chunks of deleted ones. It is saved as part
+# of each index generation (see save_index).
+
+def load_manifest(vector_store):
+    """Returns the document manifest saved with the vector store's generation, or None."""
+    name = getattr(vector_store, "meta", {}).get("manifest_file")
+    if vector_store is None or not name:
+        return None
+    path = config.VECTOR_STORE_DIR / name
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if not isinstance(manifest.get("files"), dict):
+            raise ValueError("manifest has no 'files' mapping")
+        return manifest
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Ignoring unreadable document manifest {path}: {e}")
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+@metrics.timed("rag.save_index")
+def save_index(vector_store, lexical_index, manifest, checkpoint=False):
+    """Writes the index, lexical index and manifest as one generation and publishes it atomically.
+
+    Readers only ever see complete generations: the files are written under new names and
+    become visible together when the metadata file is replaced. With `checkpoint`, the
+    generation is recorded as the build checkpoint instead of being published.
+    """
+    folder = config.VECTOR_STORE_DIR
+    generation = uuid.uuid4().hex[:12]
+    lexical_file = f"lexical-{generation}.json"
+    manifest_file = f"manifest-{generation}.json"
+    lexical_index.save(folder / lexical_file)
+    _write_json(folder / manifest_file, manifest)
+    vector_store.save_local(
+        str(folder), extra_files={"lexical": lexical_file, "manifest": manifest_file}, checkpoint=checkpoint
+    )
+    if not checkpoint:
+        discard_checkpoint(folder)
+
+
+def _file_sha256(file_path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@metrics.timed("rag.scan_documents")
+def scan_documents(docs_path):
+    """Returns {relative path: (absolute path, mtime_ns, size)} for every indexable file."""
+    docs_path = Path(docs_path)
+    found = {}
+    for file_path in sorted(docs_path.rglob("*")):
+        if file_path.is_file() and file_path.suffix.lower() in _FILE_LOADERS:
+            stat = file_path.stat()
+            found[file_path.relative_to(docs_path).as_posix()] = (file_path, stat.st_mtime_ns, stat.st_size)
+    return found
+
+
+def diff_documents(manifest, current):
+    """Compares the manifest with a scan_documents() result.
+
+    Returns (added, changed, removed, hashes). Files whose mtime and size match the manifest
+    are assumed unchanged without being re-hashed.
+    """
+    files = manifest["files"]
+    added, changed, hashes = [], [], {}
+    for rel_path, (file_path, mtime_ns, size) in current.items():
+        entry = files.get(rel_path)
+        if entry is not None and entry.get("mtime_ns") == mtime_ns and entry.get("size") == size:
+            continue
+        hashes[rel_path] = _file_sha256(file_path)
+        if entry is None:
+            added.append(rel_path)
+        elif entry["sha256"] != hashes[rel_path]:
+            changed.append(rel_path)
+        else:
+            # Touched but identical content: just refresh the stat fields.
+            entry["mtime_ns"], entry["size"] = mtime_ns, size
+    removed = [rel_path for rel_path in files if rel_path not in current]
+    return added, changed, removed, hashes
+
+
+# --- Lexical (BM25) index ---
+# Kept in step with the FAISS index by sync_vector_store and saved with each
+# generation, so hybrid retrieval never has to re-tokenize the corpus at startup.
+
+@metrics.timed("rag.load_lexical_index")
+def load_lexical_index(vector_store):
+    """Returns the BM25 index saved with the vector store's generation, rebuilding it if it is missing or stale."""
+    if vector_store is None:
+        return None
+    name = getattr(vector_store, "meta", {}).get("lexical_file")
+    if name:
+        path = config.VECTOR_STORE_DIR / name
+        try:
+            lexical_index = ChunkBM25Index.load(path)
+            if len(lexical_index) != len(vector_store.index_to_docstore_id):
+                raise ValueError(f"has {len(lexical_index)} chunks, vector store has {len(vector_store.index_to_docstore_id)}")
+            return lexical_index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Ignoring stale or unreadable lexical index {path}: {e}")
+    logging.info("Building lexical index from the vector store's documents.")
+    return ChunkBM25Index.from_vector_store(vector_store)
+
+
+class IndexBuildProgress:
+    """Progress of an index build, updated by the build and read by the UI from other threads.
+
+    The ETA extrapolates the chunk count from the bytes of documents split so far and the
+    embedding rate since the build started.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phase = "pending"
+        self.resumed = False
+        self.files_total = 0
+        self.files_done = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.chunks_loaded = 0
+        self.chunks_embedded = 0
+        self.started_at = None
+        self.finished_at = None
+        self.summary = None
+        self.error = None
+
+    def begin(self, files_total, bytes_total, resumed=False):
+        with self._lock:
+            self.phase = "embedding" if files_total else "saving"
+            self.files_total, self.bytes_total, self.resumed = files_total, bytes_total, resumed
+            self.started_at = time.time()
+
+    def file_loaded(self, size, n_chunks):
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+            self.chunks_loaded += n_chunks
+
+    def chunks_added(self, n):
+        with self._lock:
+            self.chunks_embedded += n
+
+    def set_phase(self, phase):
+        with self._lock:
+            self.phase = phase
+
+    def finish(self, summary):
+        with self._lock:
+            self.phase, self.summary, self.finished_at = "done", summary, time.time()
+
+    def fail(self, error):
+        with self._lock:
+            self.phase, self.error, self.finished_at = "failed", str(error), time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = {
+                "phase": self.phase,
+                "resumed": self.resumed,
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "chunks_embedded": self.chunks_embedded,
+                "summary": self.summary,
+                "error": self.error,
+                "fraction": None,
+                "eta_seconds": None,
+            }
+            if self.phase == "done":
+                state["fraction"] = 1.0
+            elif self.bytes_done and self.chunks_loaded:
+                chunks_expected = self.chunks_loaded * self.bytes_total / self.bytes_done
+                state["fraction"] = min(1.0, self.chunks_embedded / chunks_expected) if chunks_expected else 1.0
+                elapsed = time.time() - self.started_at
+                if self.chunks_embedded and elapsed > 0:
+                    rate = self.chunks_embedded / elapsed
+                    state["eta_seconds"] = max(0.0, (chunks_expected - self.chunks_embedded) / rate)
+            return state
+
+
+@metrics.timed("rag.sync_vector_store")
+def sync_vector_store(vector_store, embeddings, docs_path=None, progress=None):
+    """Brings the vector store in line with the documents directory.
+
+    Only new or changed files are loaded, split and embedded; chunks of changed or deleted
+    files are removed from the index. Without a manifest (first run, or an index built before
+    manifests existed) everything is indexed from scratch. Long runs are checkpointed every
+    INDEX_CHECKPOINT_SECONDS, and a file enters the manifest only once all its chunks are in
+    the index, so a resumed build picks up exactly where it stopped. Returns (vector_store, summary).
+    """
+    docs_path = Path(docs_path or config.DOCUMENTS_DIR)
+    progress = progress or IndexBuildProgress()
+    model_name = get_embedding_model_name(embeddings)
+    resumed = getattr(vector_store, "meta", {}).get("checkpoint", False)
+    manifest = load_manifest(vector_store)
+    if manifest is not None and manifest.get("embedding_model") != model_name:
+        # Vectors from a different model are not comparable with new queries.
+        logging.info(f"Index was built with {manifest.get('embedding_model')!r}, now using {model_name!r}; rebuilding.")
+        manifest = None
+    if manifest is None:
+        if vector_store is not None:
+            logging.info("Existing index has no usable document manifest; rebuilding it from scratch.")
+        vector_store = None
+        resumed = False
+        manifest = {"files": {}, "embedding_model": model_name}
+
+    current = scan_documents(docs_path)
+    added, changed, removed, hashes = diff_documents(manifest, current)
+    summary = {"added": added, "changed": changed, "removed": removed, "chunks_added": 0, "chunks_removed": 0}
+    files = manifest["files"]
+    to_index = added + changed
+    progress.begin(len(to_index), sum(current[rel_path][2] for rel_path in to_index), resumed=resumed)
+    lexical_index = load_lexical_index(vector_store) if vector_store is not None else ChunkBM25Index()
+
+    stale_ids = [chunk_id for rel_path in changed + removed for chunk_id in files[rel_path]["chunk_ids"]]
+    if stale_ids and vector_store is not None:
+        vector_store.delete(stale_ids)
+        lexical_index.remove(stale_ids)
+        summary["chunks_removed"] = len(stale_ids)
+    for rel_path in changed + removed:
+        del files[rel_path]
+
+    def pending_chunks():
+        """Streams (chunk_id, Document, manifest entry) for new or changed files; the entry rides on a file's last chunk."""
+        rel_paths = {current[rel_path][0]: rel_path for rel_path in to_index}
+        for file_path, chunks, error in iter_file_chunks(current[rel_path][0] for rel_path in to_index):
+            rel_path = rel_paths[file_path]
+            _, mtime_ns, size = current[rel_path]
+            progress.file_loaded(size, len(chunks) if error is None else 0)
+            if error is not None:
+                # Leave it out of the manifest so the next sync retries it.
+                logging.error(f"Failed to load {file_path}: {error}")
+                continue
+            sha256 = hashes[rel_path]
+            chunk_ids = [f"{rel_path}#{sha256[:12]}#{i}" for i in range(len(chunks))]
+            entry = (rel_path, {"sha256": sha256, "mtime_ns": mtime_ns, "size": size, "chunk_ids": chunk_ids})
+            if not chunks:
+                files[rel_path] = entry[1]
+            for i, (chunk_id, chunk) in enumerate(zip(chunk_ids, chunks)):
+                yield chunk_id, chunk, entry if i == len(chunks) - 1 else None
+
+    last_checkpoint = time.monotonic()
+    for batch in iter_batches(pending_chunks(), config.INGEST_BATCH_SIZE):
+        pairs = [(chunk_id, doc) for chunk_id, doc, _ in batch]
+        vector_store = add_chunk_batch(vector_store, embeddings, pairs)
+        lexical_index.add([chunk_id for chunk_id, _ in pairs], [doc.page_content for _, doc in pairs])
+        for _, _, entry in batch:
+            if entry is not None:
+                files[entry[0]] = entry[1]
+        summary["chunks_added"] += len(batch)
+        progress.chunks_added(len(batch))
+        if time.monotonic() - last_checkpoint >= config.INDEX_CHECKPOINT_SECONDS:
+            save_index(vector_store, lexical_index, manifest, checkpoint=True)
+            last_checkpoint = time.monotonic()
+
+    if summary["chunks_added"]:
+        if hasattr(embeddings, "stats"):
+            cache_stats = embeddings.stats()
+            logging.info(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses so far.")
+
+    if vector_store is not None and (added or changed or removed or resumed):
+        progress.set_phase("saving")
+        save_index(vector_store, lexical_index, manifest)
+        logging.info(
+            f"Document index synced: {len(added)} added, {len(changed)} changed, {len(removed)} removed "
+            f"({summary['chunks_added']} chunks embedded, {summary['chunks_removed']} dropped)."
+        )
+
+    if vector_store is not None and vector_store.index.ntotal == 0:
+        return None, summary
+    return vector_store, summary
+
+
+def get_retriever(vector_store):
+    """Returns the retriever configured by RETRIEVAL_MODE: hybrid BM25 + vector search, or vector search only."""
+    if config.RETRIEVAL_MODE == "hybrid":
+        return HybridRetriever(
+            vector_store=vector_store,
+            lexical_index=load_lexical_index(vector_store),
+            k=config.RETRIEVAL_K,
+            fetch_k=config.RETRIEVAL_FETCH_K,
+            use_mmr=config.RETRIEVAL_USE_MMR,
+            mmr_lambda=config.RETRIEVAL_MMR_LAMBDA,
+            rrf_k=config.RETRIEVAL_RRF_K,
+        )
+    if config.RETRIEVAL_USE_MMR:
+        return vector_store.as_retriever(search_type="mmr", search_kwargs={
+            "k": config.RETRIEVAL_K, "fetch_k": config.RETRIEVAL_FETCH_K, "lambda_mult": config.RETRIEVAL_MMR_LAMBDA,
+        })
+    return vector_store.as_retriever(search_kwargs={"k": config.RETRIEVAL_K})
+
+
+@metrics.timed("rag.create_qa_chain")
 def get_retrieval_qa_chain(vector_store, llm):
     """Creates the RetrievalQA chain."""
     if not vector_store:
         logging.error("Vector store not available for QA chain.")
-        # No need for st.error here, handled during initialization
+        # No need for a user-facing error here, handled during initialization
         return None
     if not llm:
         logging.error("LLM not available for QA chain.")
-        st.error("Cannot create RAG query engine: LLM is not available.")
+        notifier.error("Cannot create RAG query engine: LLM is not available.")
         return None
 
     try:
         qa_chain = RetrievalQA.from_chain_type(
             llm=llm,
             chain_type="stuff",
-            retriever=vector_store.as_retriever(),
+            retriever=get_retriever(vector_store),
             return_source_documents=True
         )
         logging.info("RetrievalQA chain created.")
         return qa_chain
     except Exception as e:
         logging.error(f"Failed to create RetrievalQA chain: {e}", exc_info=True)
-        st.error(f"Error setting up the RAG query engine: {e}")
+        notifier.error(f"Error setting up the RAG query engine: {e}")
         return None
 
-def initialize_rag_engine():
-    """Initializes the entire RAG engine: loads/creates vector store and QA chain."""
-    global _vector_store
-    # Reset vector store at start of initialization if needed
-    # _vector_store = None
+@metrics.timed("rag.build_document_index")
+def build_document_index(progress=None):
+    """Brings the published index up to date with the documents folder, building it on first run.
 
+    Safe to run on a background thread: it reports through `progress` rather than the page,
+    works on a private writable copy of the index and publishes the result atomically. An
+    interrupted build is resumed from its checkpoint. Returns the sync summary, or None on failure.
+    """
+    progress = progress or IndexBuildProgress()
     embeddings = get_embeddings()
-    llm = get_llm()
+    if not embeddings:
+        progress.fail("Embeddings model is not available.")
+        return None
+    folder = config.VECTOR_STORE_DIR
+    vector_store = None
+    try:
+        if MappedFAISS.exists(folder, checkpoint=True):
+            logging.info("Resuming interrupted document index build from its checkpoint.")
+            vector_store = MappedFAISS.open(folder, embeddings, read_only=False, checkpoint=True)
+            vector_store.meta["checkpoint"] = True
+        else:
+            # Opened memory-mapped; only copied into memory if there is something to change.
+            vector_store = load_vector_store(embeddings)
+        vector_store, summary = sync_vector_store(vector_store, embeddings, progress=progress)
+        progress.finish(summary)
+        return summary
+    except Exception as e:
+        logging.error(f"Failed to build the document index: {e}", exc_info=True)
+        progress.fail(e)
+        return None
+    finally:
+        if vector_store is not None:
+            vector_store.close()
+
+
+@metrics.timed("rag.open_rag_engine")
+def open_rag_engine():
+    """Opens the saved index (memory-mapped, read-only) and creates a QA chain over it.
 
+    Returns (vector_store, qa_chain); either may be None if unavailable.
+    """
+    embeddings = get_embeddings()
+    llm = get_llm()
     if not embeddings or not llm:
-        st.error("RAG Engine initialization failed: Cannot get OpenAI models/embeddings.")
+        return None, None
+    vector_store = load_vector_store(embeddings)
+    if vector_store is None:
+        return None, None
+    qa_chain = get_retrieval_qa_chain(vector_store, llm)
+    if not qa_chain:
+        notifier.error("Failed to create RAG query engine even though index exists.")
+    return vector_store, qa_chain
+
+
+def initialize_rag_engine():
+    """Initializes the entire RAG engine synchronously: updates the index on disk, then opens it with a QA chain."""
+    if not get_embeddings() or not get_llm():
+        notifier.error("RAG Engine initialization failed: Cannot get OpenAI models/embeddings.")
         return None, None # Return None for both vector_store and qa_chain
+    progress = IndexBuildProgress()
+    build_document_index(progress)
+    if progress.error:
+        notifier.error(f"Error updating the document index: {progress.error}")
+    return open_rag_engine()
 
-    # Try loading existing vector store first
-    _vector_store = load_vector_store(embeddings)
-
-    if _vector_store is None:
-        st.info("Building document index... (This may take a moment on first run)")
-        logging.info("Attempting to build a new vector store.")
-        # If loading failed or store doesn't exist, create it
-        documents = load_documents(str(config.DOCUMENTS_DIR))
-        if not documents:
-            st.warning("No documents were loaded. RAG querying will be unavailable.")
-            return None, None # No docs, no store, no chain
-        else:
-            chunks = split_documents(documents)
-            if chunks:
-                _vector_store = create_vector_store(chunks, embeddings)
-                if _vector_store:
-                    st.success("Document index built successfully!")
-                else:
-                    st.error("Failed to build the document index.")
-                    # _vector_store remains None
-            else:
-                 st.warning("Documents were loaded but could not be split into chunks.")
-                 # _vector_store remains None
-
-    # Create QA chain if vector store is available *now*
-    qa_chain = None
-    if _vector_store:
-        qa_chain = get_retrieval_qa_chain(_vector_store, llm)
-        if not qa_chain:
-             st.error("Failed to create RAG query engine even though index exists.")
-             # Fallback: _vector_store might exist but chain creation failed.
-    elif not os.path.exists(str(config.VECTOR_STORE_DIR)):
-         # Only show this if we didn't just attempt/fail a build
-         st.warning("RAG query engine not available: Document index needs to be built (check logs for errors).")
-
-    return _vector_store, qa_chain # Return current state
-
-
-def query_rag(qa_chain, query: str):
-    """Queries the RAG engine."""
+
+def index_version():
+    """Identifies the published index generation; it changes whenever a build or sync publishes."""
+    meta = read_meta(config.VECTOR_STORE_DIR)
+    return meta["generation"] if meta else None
+
+
+def chain_index_version(qa_chain):
+    """The index generation a QA chain retrieves from, taken from its opened store rather than from disk.
+
+    Right after a publish this can differ from index_version(): the chain still answers from
+    the previous generation until its engine snapshot is swapped.
+    """
+    retriever = qa_chain.retriever
+    vector_store = getattr(retriever, "vector_store", None) or getattr(retriever, "vectorstore", None)
+    return getattr(vector_store, "meta", {}).get("generation")
+
+
+# Recent per-query timings (seconds), newest last
+_query_timings = deque(maxlen=1000)
+
+
+def _record_timing(query, mode, started, first_token_at, cache_hit):
+    finished = time.perf_counter()
+    timing = {
+        "query": query,
+        "mode": mode,
+        "cache_hit": cache_hit,
+        "time_to_first_token": (first_token_at - started) if first_token_at is not None else None,
+        "total_time": finished - started,
+    }
+    _query_timings.append(timing)
+    ttft = timing["time_to_first_token"]
+    if ttft is not None:
+        metrics.observe("rag.first_token", ttft)
+    if mode == "streaming":
+        # query_rag is timed by its decorator; a generator cannot hold a span open across yields.
+        metrics.observe("rag.stream_rag", timing["total_time"])
+    logging.info(
+        f"RAG {mode} query timing: first token {ttft:.3f}s, total {timing['total_time']:.3f}s"
+        if ttft is not None else f"RAG {mode} query timing: total {timing['total_time']:.3f}s"
+    )
+    return timing
+
+
+def get_query_timings() -> list:
+    """Returns recent query timings: time_to_first_token and total_time in seconds, per query."""
+    return list(_query_timings)
+
+
+@metrics.timed("rag.answer_cache_lookup")
+def _lookup_answer_cache(query, version):
+    """Checks both answer-cache tiers for answers from index generation `version`.
+
+    Returns (hit or None, query embedding, version).
+    """
+    answer_cache = get_answer_cache() if config.ANSWER_CACHE_ENABLED else None
+    if answer_cache is None:
+        return None, None, version
+    cached = answer_cache.get_exact(query, version)
+    if cached is not None:
+        logging.info(f"RAG Query: '{query}' answered from cache (exact match).")
+        return cached, None, version
+    query_embedding = None
+    embeddings = get_embeddings()
+    if embeddings:
+        try:
+            # Goes through the embedding cache, so retrieval afterwards reuses this vector.
+            query_embedding = embeddings.embed_query(query)
+        except Exception as e:
+            logging.warning(f"Could not embed query for the answer cache: {e}")
+    similar = answer_cache.get_similar(query_embedding, version)
+    if similar is not None:
+        answer, source_docs, similarity = similar
+        logging.info(f"RAG Query: '{query}' answered from cache (similarity {similarity:.3f}).")
+        return (answer, source_docs), query_embedding, version
+    return None, query_embedding, version
+
+
+def _store_answer(query, answer, source_docs, version, query_embedding):
+    if config.ANSWER_CACHE_ENABLED:
+        get_answer_cache().put(query, answer, source_docs, version, query_embedding)
+
+
+def _stuffed_prompt(qa_chain, query, source_docs):
+    """The chain's "stuff" prompt for a question: the retrieved chunks joined into its context."""
+    combine_chain = qa_chain.combine_documents_chain
+    context = combine_chain.document_separator.join(
+        format_document(doc, combine_chain.document_prompt) for doc in source_docs
+    )
+    return combine_chain.llm_chain.prompt.format_prompt(**{combine_chain.document_variable_name: context, "question": query})
+
+
+@metrics.timed("rag.query_rag")
+def query_rag(qa_chain, query: str, version=None):
+    """Queries the RAG engine, answering repeated or near-identical questions from the answer cache.
+
+    Cached answers are keyed on the index generation the chain retrieves from: `version`
+    (an engine snapshot's), or else the one its vector store was opened at.
+    """
     if not qa_chain:
         logging.error("QA chain is not initialized for querying.")
-        st.error("Error: RAG Query Engine is not ready. Cannot answer question.")
+        notifier.error("Error: RAG Query Engine is not ready. Cannot answer question.")
         return "Error: RAG Query Engine is not ready.", []
 
+    started = time.perf_counter()
+    cached, query_embedding, version = _lookup_answer_cache(
+        query, chain_index_version(qa_chain) if version is None else version)
+    if cached is not None:
+        _record_timing(query, "blocking", started, time.perf_counter(), cache_hit=True)
+        return cached
+
     try:
-        with st.spinner("🧠 Thinking..."):
-            # Ensure query is passed correctly if using invoke
-            # result = qa_chain.invoke({"query": query}) # For newer LCEL chains
-            result = qa_chain({"query": query}) # For older RetrievalQA chain type
+        with notifier.busy("🧠 Thinking..."):
+            # The chain's steps run one by one (as in stream_rag) so each is timed on its own.
+            with metrics.span("rag.retrieve"):
+                source_docs = qa_chain.retriever.invoke(query)
+            with metrics.span("rag.prompt"):
+                prompt = _stuffed_prompt(qa_chain, query, source_docs)
+            with metrics.span("rag.llm"):
+                response = qa_chain.combine_documents_chain.llm_chain.llm.invoke(prompt.to_messages())
 
-        answer = result.get('result', "Sorry, I couldn't find an answer in the documents.")
-        source_docs = result.get('source_documents', [])
+        answer = getattr(response, "content", response) or "Sorry, I couldn't find an answer in the documents."
+        # The whole answer arrives at once, so first token and completion coincide.
+        _record_timing(query, "blocking", started, time.perf_counter(), cache_hit=False)
         logging.info(f"RAG Query: '{query}', Answer: '{answer[:50]}...'")
+        _store_answer(query, answer, source_docs, version, query_embedding)
         return answer, source_docs
     except Exception as e:
         logging.error(f"Error during RAG query execution: {e}", exc_info=True)
-        st.error(f"An error occurred while processing your query: {e}")
-        return "Error processing query.", []
\ No newline at end of file
+        notifier.error(f"An error occurred while processing your query: {e}")
+        return "Error processing query.", []
+
+
+def stream_rag(qa_chain, query: str, version=None):
+    """Streaming variant of query_rag.
+
+    Yields ("sources", documents) as soon as retrieval finishes, then ("token", text) for each
+    piece of the answer as the LLM produces it, and finally ("done", timing) with
+    time_to_first_token and total_time. The sources event always comes first: if the query
+    fails before retrieval completes it is empty, and the error follows as a token. Uses the
+    chain's own retriever and stuff prompt, so answers match query_rag; any LangChain chat
+    model that supports .stream() works, including the offline local model. `version` keys
+    the answer cache as in query_rag.
+    """
+    started = time.perf_counter()
+    if not qa_chain:
+        logging.error("QA chain is not initialized for querying.")
+        yield "sources", []
+        yield "token", "Error: RAG Query Engine is not ready."
+        yield "done", _record_timing(query, "streaming", started, None, cache_hit=False)
+        return
+
+    llm = qa_chain.combine_documents_chain.llm_chain.llm
+    first_token_at = None
+    parts = []
+    sources_sent = False
+    try:
+        cached, query_embedding, version = _lookup_answer_cache(
+            query, chain_index_version(qa_chain) if version is None else version)
+        if cached is not None:
+            answer, source_docs = cached
+            sources_sent = True
+            yield "sources", source_docs
+            first_token_at = time.perf_counter()
+            yield "token", answer
+            yield "done", _record_timing(query, "streaming", started, first_token_at, cache_hit=True)
+            return
+
+        with metrics.span("rag.retrieve"):
+            source_docs = qa_chain.retriever.invoke(query)
+        sources_sent = True
+        yield "sources", source_docs
+        with metrics.span("rag.prompt"):
+            prompt = _stuffed_prompt(qa_chain, query, source_docs)
+        llm_started = time.perf_counter()
+        for chunk in llm.stream(prompt.to_messages()):
+            text = getattr(chunk, "content", chunk)
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(text)
+            yield "token", text
+        metrics.observe("rag.llm_stream", time.perf_counter() - llm_started)
+    except Exception as e:
+        logging.error(f"Error during streaming RAG query: {e}", exc_info=True)
+        if not sources_sent:
+            # Callers read the sources event first; keep that order when retrieval fails.
+            yield "sources", []
+        yield "token", f"\n\nError processing query: {e}"
+        yield "done", _record_timing(query, "streaming", started, first_token_at, cache_hit=False)
+        return
+
+    answer = "".join(parts)
+    logging.info(f"RAG Query: '{query}', Answer: '{answer[:50]}...'")
+    _store_answer(query, answer, source_docs, version, query_embedding)
+    yield "done", _record_timing(query, "streaming", started, first_token_at, cache_hit=False)
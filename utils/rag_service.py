@@ -0,0 +1,227 @@
+# utils/rag_service.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _rag_engine():
+    """Imports utils.rag_engine on first use: it pulls in langchain, FAISS and the OpenAI client,
+    which the login page and catalog views do not need."""
+    from utils import rag_engine
+    return rag_engine
+
+
+class EngineSnapshot:
+    """One opened index with its QA chain, shared by every session of the process.
+
+    Snapshots are reference-counted: queries hold a reference while they run, and a snapshot
+    that has been replaced (retired) releases its index and docstore once the last query
+    using it finishes.
+    """
+
+    def __init__(self, vector_store, qa_chain, version):
+        self.vector_store = vector_store
+        self.qa_chain = qa_chain
+        self.version = version
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+        self._refs = 0
+        self._retired = False
+
+    @property
+    def ready(self) -> bool:
+        return self.qa_chain is not None
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            close = self._retired and self._refs == 0
+        if close:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            close = self._refs == 0
+        if close:
+            self._close()
+
+    @property
+    def refs(self) -> int:
+        with self._lock:
+            return self._refs
+
+    def _close(self):
+        if self.vector_store is not None and hasattr(self.vector_store, "close"):
+            self.vector_store.close()
+        self.vector_store = None
+        self.qa_chain = None
+
+
+class SharedRagEngine:
+    """Process-wide RAG engine: one index and QA chain for all sessions.
+
+    start() opens the published index, if there is one, and brings it up to date on a
+    background thread, so the first page renders without waiting for embeddings. A finished
+    build, like any other writer publishing a new index (a CLI build, another worker), is
+    noticed on the next acquire and the snapshot is swapped atomically: queries in flight
+    finish on the old one.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._started = False
+        self._last_check = 0.0
+        self._reloads = 0
+        self._error = None
+        self._build_thread = None
+        self.progress = None
+
+    def start(self):
+        """Opens the engine once per process and starts the initial index build; never blocks on the build.
+
+        Called on first use of a RAG feature rather than at app startup, so sessions that never
+        query documents do not load the RAG dependencies.
+        """
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            try:
+                if _rag_engine().index_version() is not None:
+                    self._swap(self._open())
+            except Exception as e:
+                logging.error(f"RAG engine initialization failed: {e}", exc_info=True)
+                self._error = str(e)
+            self._started = True
+            self.start_build()
+
+    def start_build(self) -> bool:
+        """Syncs the documents folder into the index on a background thread. Returns False if a build is already running."""
+        with self._lock:
+            if self.building:
+                return False
+            self.progress = _rag_engine().IndexBuildProgress()
+            self._build_thread = threading.Thread(
+                target=self._run_build, args=(self.progress,), name="rag-index-build", daemon=True
+            )
+            self._build_thread.start()
+            return True
+
+    def _run_build(self, progress):
+        if _rag_engine().build_document_index(progress) is not None:
+            self.reload()
+        elif progress.error:
+            self._error = progress.error
+
+    @property
+    def building(self) -> bool:
+        return self._build_thread is not None and self._build_thread.is_alive()
+
+    def _open(self) -> EngineSnapshot:
+        vector_store, qa_chain = _rag_engine().open_rag_engine()
+        # The generation actually opened; the published one may already have moved on.
+        version = vector_store.meta.get("generation") if vector_store is not None else _rag_engine().index_version()
+        if qa_chain is None:
+            logging.warning("RAG QA chain initialization failed or returned None.")
+        return EngineSnapshot(vector_store, qa_chain, version)
+
+    def _swap(self, snapshot):
+        """Publishes a new snapshot and retires the previous one. Caller holds the lock."""
+        previous, self._snapshot = self._snapshot, snapshot
+        self._error = None if snapshot.ready else "QA chain unavailable"
+        if previous is not None:
+            previous.retire()
+            self._reloads += 1
+        logging.info(f"RAG engine snapshot published (index version {snapshot.version}).")
+
+    def reload(self):
+        """Re-opens the index from disk and swaps it in, unless the current snapshot is already up to date."""
+        with self._lock:
+            current = self._snapshot
+            if current is not None and current.ready and current.version == _rag_engine().index_version():
+                return
+            try:
+                self._swap(self._open())
+            except Exception as e:
+                logging.error(f"Failed to reload the document index: {e}", exc_info=True)
+                self._error = str(e)
+            self._last_check = time.monotonic()
+
+    def _check_for_update(self):
+        """Reloads if the published index changed since the current snapshot was opened (checked at most every few seconds)."""
+        now = time.monotonic()
+        if now - self._last_check < config.RAG_INDEX_CHECK_INTERVAL_SECONDS:
+            return
+        self._last_check = now
+        version = _rag_engine().index_version()
+        current = self._snapshot
+        if version is not None and (current is None or version != current.version):
+            logging.info("Document index changed on disk; reloading the RAG engine.")
+            self.reload()
+
+    def acquire(self) -> EngineSnapshot:
+        """Returns the current snapshot with a reference held; pair with release()."""
+        self.start()
+        self._check_for_update()
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                snapshot = EngineSnapshot(None, None, None)
+            return snapshot.acquire()
+
+    @contextmanager
+    def session(self):
+        """Context manager yielding the current snapshot for the duration of a page render or query."""
+        snapshot = self.acquire()
+        try:
+            yield snapshot
+        finally:
+            snapshot.release()
+
+    def refresh(self) -> bool:
+        """Starts a background sync of the documents folder; the result is swapped in when it finishes."""
+        self.start()
+        return self.start_build()
+
+    def status(self) -> dict:
+        """Health summary for the sidebar and monitoring."""
+        snapshot = self._snapshot
+        vector_store = snapshot.vector_store if snapshot is not None else None
+        return {
+            "started": self._started,
+            "ready": bool(snapshot is not None and snapshot.ready),
+            "chunks": len(vector_store.index_to_docstore_id) if vector_store is not None else 0,
+            "index_type": getattr(vector_store, "index_type", None),
+            "loaded_at": snapshot.loaded_at if snapshot is not None else None,
+            "active_queries": snapshot.refs if snapshot is not None else 0,
+            "reloads": self._reloads,
+            "error": self._error,
+            "building": self.building,
+            "progress": self.progress.snapshot() if self.progress is not None else None,
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> SharedRagEngine:
+    """Returns the process-wide engine (created on first use, not started)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = SharedRagEngine()
+        return _engine
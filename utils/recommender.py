@@ -0,0 +1,421 @@
+# utils/recommender.py
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import config
+from utils import database
+
+logging.basicConfig(level=logging.INFO)
+
+# Content-based "books like this" recommendations.
+#
+# Each book is a feature vector made of three blocks: a one-hot genre, a one-hot author and
+# the L2-normalized TF-IDF of its title words. Block weights come from
+# config.RECOMMENDER_WEIGHTS, so similarity(i, j) = w_genre*[same genre] + w_author*[same
+# author] + w_title*cos(title_i, title_j). The top-N neighbours of every book are precomputed
+# block by block with vectorized sparse joins over inverted postings (only books sharing a
+# title word, the author or the genre can score above zero), persisted under
+# config.RECOMMENDER_DIR and served by a single row lookup. Books appended with add_book are
+# scored against the catalog and merged into the neighbour lists they enter; only those
+# rows change.
+
+_TOKEN_PATTERN = r"\w+"
+_ARRAYS = ("ids", "genre", "author", "t_ptr", "t_idx", "t_w", "df", "neighbours", "scores")
+
+
+def _ragged_ranges(starts, ends):
+    """Concatenates range(s, e) for each (s, e) pair; also returns which pair each element came from."""
+    lengths = np.maximum(np.asarray(ends, dtype=np.int64) - starts, 0)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.arange(int(lengths.sum()), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.asarray(starts, dtype=np.int64)[owner] + offsets, owner
+
+
+def _group(codes, n_codes, first_row):
+    """CSR grouping of rows by code: rows of code c are rows[ptr[c]:ptr[c+1]] (ascending)."""
+    order = np.argsort(codes, kind="stable")
+    ptr = np.zeros(n_codes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=n_codes), out=ptr[1:])
+    return ptr, (order + first_row).astype(np.int32)
+
+
+def _title_terms(titles, vocab: dict):
+    """Tokenizes titles into (row, term id, count) triples, adding unseen words to `vocab`."""
+    tokens = pd.Series(titles, dtype=object).fillna("").astype(str).str.lower().str.findall(_TOKEN_PATTERN)
+    lengths = tokens.str.len().to_numpy(dtype=np.int64)
+    words = tokens.explode().dropna().to_numpy(dtype=object)
+    rows = np.repeat(np.arange(len(tokens), dtype=np.int64), lengths)
+    codes, uniques = pd.factorize(words)
+    lookup = np.fromiter((vocab.setdefault(word, len(vocab)) for word in uniques), dtype=np.int64, count=len(uniques))
+    terms = lookup[codes] if len(codes) else np.zeros(0, dtype=np.int64)
+    keys, counts = np.unique(rows * (len(vocab) + 1) + terms, return_counts=True)
+    return keys // (len(vocab) + 1), keys % (len(vocab) + 1), counts
+
+
+def _encode(values, vocab: dict) -> np.ndarray:
+    """Maps normalized strings to dense codes, extending `vocab` with unseen values."""
+    if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        # Normalize each distinct value once; code -1 (missing) selects the trailing "".
+        lookup = _encode(list(values.cat.categories) + [""], vocab)
+        return lookup[values.cat.codes.to_numpy()]
+    normalized = pd.Series(values, dtype=object).fillna("").astype(str).str.strip().str.lower()
+    codes, uniques = pd.factorize(normalized)
+    lookup = np.fromiter((vocab.setdefault(value, len(vocab)) for value in uniques), dtype=np.int32, count=len(uniques))
+    return lookup[codes] if len(codes) else np.zeros(0, dtype=np.int32)
+
+
+class _Postings:
+    """Inverted postings (title term, author, genre -> rows) over a contiguous range of model rows."""
+
+    def __init__(self, model, start: int, stop: int):
+        self.start, self.stop = start, stop
+        e0, e1 = model.t_ptr[start], model.t_ptr[stop]
+        entry_rows = np.repeat(np.arange(start, stop, dtype=np.int64), np.diff(model.t_ptr[start:stop + 1]))
+        terms = np.asarray(model.t_idx[e0:e1], dtype=np.int64)
+        self.term_ptr, order = _group(terms, len(model.term_vocab), 0)
+        self.term_rows = entry_rows[order].astype(np.int32)
+        self.term_w = np.asarray(model.t_w[e0:e1])[order]
+        self.author_ptr, self.author_rows = _group(model.author[start:stop], len(model.author_vocab), start)
+        self.genre_ptr, self.genre_rows = _group(model.genre[start:stop], len(model.genre_vocab), start)
+
+    @staticmethod
+    def _lookup(ptr, codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        known = codes < len(ptr) - 1
+        starts = np.where(known, ptr[np.minimum(codes, len(ptr) - 2)], 0)
+        ends = np.where(known, ptr[np.minimum(codes, len(ptr) - 2) + 1], 0)
+        return starts, ends
+
+
+class RecommendationModel:
+    """Book feature matrix plus precomputed top-N neighbour lists, aligned with load_books() rows."""
+
+    def __init__(self):
+        self.signature = None
+        self.top_n = config.RECOMMENDER_TOP_N
+        self.weights = dict(config.RECOMMENDER_WEIGHTS)
+        self.genre_vocab, self.author_vocab, self.term_vocab = {}, {}, {}
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.genre = np.zeros(0, dtype=np.int32)
+        self.author = np.zeros(0, dtype=np.int32)
+        self.t_ptr = np.zeros(1, dtype=np.int64)   # title TF-IDF in CSR form
+        self.t_idx = np.zeros(0, dtype=np.int32)
+        self.t_w = np.zeros(0, dtype=np.float32)
+        self.df = np.zeros(0, dtype=np.int32)       # books per title term
+        self.neighbours = np.zeros((0, self.top_n), dtype=np.int32)  # row positions, -1 = empty slot
+        self.scores = np.zeros((0, self.top_n), dtype=np.float32)
+        self._base = None   # postings over rows [0, base.stop)
+        self._tail = None   # postings over rows appended since, rebuilt on every add
+        self._id_order = None
+        self._folder_files = None  # lazily loaded vocabularies of a model opened from disk
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Features ---
+
+    def _append_features(self, books_df: pd.DataFrame):
+        """Encodes books and appends them as new rows (existing rows and IDF weights are untouched)."""
+        first = len(self.ids)
+        n_new = len(books_df)
+        self.ids = np.concatenate([self.ids, books_df["id"].to_numpy(dtype=np.int64)])
+        self.genre = np.concatenate([self.genre, _encode(books_df["genre"], self.genre_vocab)])
+        self.author = np.concatenate([self.author, _encode(books_df["author"], self.author_vocab)])
+
+        rows, terms, counts = _title_terms(books_df["title"].to_numpy(dtype=object), self.term_vocab)
+        df = np.zeros(len(self.term_vocab), dtype=np.int32)
+        df[:len(self.df)] = self.df
+        np.add.at(df, terms, 1)
+        self.df = df
+        idf = np.log((1.0 + len(self.ids)) / (1.0 + df[terms])) + 1.0
+        weights = ((1.0 + np.log(counts)) * idf).astype(np.float32)
+        norms = np.sqrt(np.bincount(rows, weights=weights.astype(np.float64) ** 2, minlength=n_new))
+        weights /= np.where(norms > 0, norms, 1.0)[rows].astype(np.float32)
+        lengths = np.bincount(rows, minlength=n_new)
+        self.t_ptr = np.concatenate([self.t_ptr, self.t_ptr[-1] + np.cumsum(lengths)])
+        self.t_idx = np.concatenate([self.t_idx, terms.astype(np.int32)])
+        self.t_w = np.concatenate([self.t_w, weights])
+        self.neighbours = np.concatenate([self.neighbours, np.full((n_new, self.top_n), -1, dtype=np.int32)])
+        self.scores = np.concatenate([self.scores, np.zeros((n_new, self.top_n), dtype=np.float32)])
+        self._id_order = None
+        return np.arange(first, first + n_new)
+
+    def _reindex(self):
+        """Rebuilds the base postings over every row once the directly compared tail grows too long."""
+        if self._base is None or len(self) - self._base.stop > config.RECOMMENDER_TAIL_ROWS:
+            self._base = _Postings(self, 0, len(self))
+        self._tail = _Postings(self, self._base.stop, len(self)) if self._base.stop < len(self) else None
+
+    # --- Scoring ---
+
+    def _candidate_pairs(self, rows: np.ndarray, postings: _Postings):
+        """Returns (source index into rows, candidate row, title dot product) for one postings range."""
+        # Title words shared with the candidate; words in too many books are skipped.
+        entries, owner = _ragged_ranges(self.t_ptr[rows], self.t_ptr[rows + 1])
+        starts, ends = postings._lookup(postings.term_ptr, self.t_idx[entries])
+        common = (ends - starts) > config.RECOMMENDER_MAX_TERM_POSTINGS
+        ends = np.where(common, starts, ends)
+        hits, hit_owner = _ragged_ranges(starts, ends)
+        src = [owner[hit_owner]]
+        dst = [postings.term_rows[hits]]
+        dot = [self.t_w[entries][hit_owner] * postings.term_w[hits]]
+
+        # Other books by the same author.
+        starts, ends = postings._lookup(postings.author_ptr, self.author[rows])
+        ends = np.minimum(ends, starts + config.RECOMMENDER_MAX_AUTHOR_CANDIDATES)
+        hits, hit_owner = _ragged_ranges(starts, ends)
+        src.append(hit_owner)
+        dst.append(postings.author_rows[hits])
+        dot.append(np.zeros(len(hits), dtype=np.float32))
+
+        # Same-genre filler, so books with unusual titles and authors still get neighbours:
+        # a window of the genre's books starting at a row-dependent offset.
+        starts, ends = postings._lookup(postings.genre_ptr, self.genre[rows])
+        sizes = ends - starts
+        window = np.minimum(sizes, self.top_n + 1)
+        slots, slot_owner = _ragged_ranges(np.zeros(len(rows), dtype=np.int64), window)
+        offsets = (rows[slot_owner] + slots) % np.maximum(sizes[slot_owner], 1)
+        src.append(slot_owner)
+        dst.append(postings.genre_rows[starts[slot_owner] + offsets])
+        dot.append(np.zeros(len(slots), dtype=np.float32))
+        return np.concatenate(src), np.concatenate(dst).astype(np.int64), np.concatenate(dot)
+
+    def _score(self, rows: np.ndarray):
+        """Scores every candidate of `rows`; returns unique (source index into rows, candidate row, similarity)."""
+        parts = [self._candidate_pairs(rows, postings) for postings in (self._base, self._tail) if postings is not None]
+        src = np.concatenate([p[0] for p in parts])
+        dst = np.concatenate([p[1] for p in parts])
+        dot = np.concatenate([p[2] for p in parts])
+        keep = rows[src] != dst
+        keys, inverse = np.unique(src[keep] * len(self) + dst[keep], return_inverse=True)
+        title = np.bincount(inverse, weights=dot[keep], minlength=len(keys))
+        src, dst = keys // len(self), keys % len(self)
+        w = self.weights
+        score = (w["title"] * title
+                 + w["author"] * (self.author[rows[src]] == self.author[dst])
+                 + w["genre"] * (self.genre[rows[src]] == self.genre[dst])) / sum(w.values())
+        return src, dst, score.astype(np.float32)
+
+    def _top_n(self, n_rows: int, src, dst, score):
+        """Keeps the best top_n candidates per source; ties keep their input order (lower rows first after _score)."""
+        # One stable sort on a combined key: source index first, then descending score (scores are in [0, 1]).
+        order = np.argsort(src * 2.0 + (1.0 - score), kind="stable")
+        src, dst, score = src[order], dst[order], score[order]
+        first = np.searchsorted(src, np.arange(n_rows))
+        rank = np.arange(len(src)) - first[src]
+        keep = rank < self.top_n
+        neighbours = np.full((n_rows, self.top_n), -1, dtype=np.int32)
+        scores = np.zeros((n_rows, self.top_n), dtype=np.float32)
+        neighbours[src[keep], rank[keep]] = dst[keep]
+        scores[src[keep], rank[keep]] = score[keep]
+        return neighbours, scores
+
+    def compute_neighbours(self, rows: np.ndarray):
+        """Recomputes the neighbour lists of `rows` from scratch, block by block."""
+        for start in range(0, len(rows), config.RECOMMENDER_BLOCK_ROWS):
+            block = rows[start:start + config.RECOMMENDER_BLOCK_ROWS]
+            src, dst, score = self._score(block)
+            self.neighbours[block], self.scores[block] = self._top_n(len(block), src, dst, score)
+
+    @classmethod
+    def build(cls, books_df: pd.DataFrame, signature=None):
+        started = time.perf_counter()
+        model = cls()
+        model.signature = signature
+        model._append_features(books_df)
+        model._reindex()
+        model.compute_neighbours(np.arange(len(model)))
+        logging.info(f"Recommendation model built over {len(model)} books in {time.perf_counter() - started:.2f}s.")
+        return model
+
+    def add_books(self, books_df: pd.DataFrame):
+        """Adds new books: computes their neighbours and merges them into the lists they now belong to."""
+        self._ensure_loaded()
+        new_rows = self._append_features(books_df)
+        self._reindex()
+        for start in range(0, len(new_rows), config.RECOMMENDER_BLOCK_ROWS):
+            block = new_rows[start:start + config.RECOMMENDER_BLOCK_ROWS]
+            src, dst, score = self._score(block)
+            self.neighbours[block], self.scores[block] = self._top_n(len(block), src, dst, score)
+            # Similarity is symmetric: a new book enters an existing book's list if it beats the last entry there.
+            existing = dst < new_rows[0]
+            src, dst, score = block[src[existing]], dst[existing], score[existing]
+            enters = (score > self.scores[dst, -1]) | (self.neighbours[dst, -1] < 0)
+            affected, local = np.unique(dst[enters], return_inverse=True)
+            if len(affected) == 0:
+                continue
+            current = self.neighbours[affected]
+            filled = current >= 0
+            merged_src = np.concatenate([np.nonzero(filled)[0], local])
+            merged_dst = np.concatenate([current[filled], src[enters]]).astype(np.int64)
+            merged_score = np.concatenate([self.scores[affected][filled], score[enters]])
+            self.neighbours[affected], self.scores[affected] = self._top_n(
+                len(affected), merged_src, merged_dst, merged_score
+            )
+        return new_rows
+
+    # --- Serving ---
+
+    def row_of(self, book_id):
+        """Row position of a book id, or None."""
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind="stable")
+        position = np.searchsorted(self.ids, book_id, sorter=self._id_order)
+        if position < len(self.ids) and self.ids[self._id_order[position]] == book_id:
+            return int(self._id_order[position])
+        return None
+
+    def similar(self, row: int, limit: int):
+        """(neighbour rows, scores) of a row, best first."""
+        neighbours = np.asarray(self.neighbours[row][:limit])
+        valid = neighbours >= 0
+        return neighbours[valid], np.asarray(self.scores[row][:limit])[valid]
+
+    # --- Persistence ---
+
+    def save(self, folder):
+        """Writes a new generation of the model and switches meta.json to it atomically."""
+        self._ensure_loaded()
+        folder = os.fspath(folder)
+        os.makedirs(folder, exist_ok=True)
+        generation = f"gen-{uuid.uuid4().hex[:12]}"
+        target = os.path.join(folder, generation)
+        os.makedirs(target)
+        for name in _ARRAYS:
+            np.save(os.path.join(target, f"{name}.npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(target, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump({"genre": list(self.genre_vocab), "author": list(self.author_vocab),
+                       "term": list(self.term_vocab)}, f)
+        meta = {"generation": generation, "signature": self.signature, "top_n": self.top_n,
+                "weights": self.weights, "books": len(self)}
+        tmp_path = os.path.join(folder, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(folder, "meta.json"))
+        for entry in os.listdir(folder):
+            if entry.startswith("gen-") and entry != generation:
+                shutil.rmtree(os.path.join(folder, entry), ignore_errors=True)
+        logging.info(f"Recommendation model saved ({len(self)} books) to {target}")
+
+    @classmethod
+    def load(cls, folder):
+        """Opens a saved model. Neighbour lists are memory-mapped; features and vocabularies load on first update."""
+        folder = os.fspath(folder)
+        with open(os.path.join(folder, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["top_n"] != config.RECOMMENDER_TOP_N or meta["weights"] != config.RECOMMENDER_WEIGHTS:
+            raise ValueError("saved model was built with different settings")
+        target = os.path.join(folder, meta["generation"])
+        model = cls()
+        model.signature = tuple(meta["signature"]) if meta["signature"] is not None else None
+        for name in _ARRAYS:
+            setattr(model, name, np.load(os.path.join(target, f"{name}.npy"), mmap_mode="r"))
+        model._folder_files = target
+        return model
+
+    def _ensure_loaded(self):
+        """Reads the vocabularies and copies memory-mapped arrays into memory before the model is changed."""
+        if self._folder_files is None:
+            return
+        with open(os.path.join(self._folder_files, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+        self.genre_vocab = {value: i for i, value in enumerate(vocab["genre"])}
+        self.author_vocab = {value: i for i, value in enumerate(vocab["author"])}
+        self.term_vocab = {value: i for i, value in enumerate(vocab["term"])}
+        for name in _ARRAYS:
+            setattr(self, name, np.array(getattr(self, name)))
+        self._folder_files = None
+        self._base = None
+        self._reindex()
+
+
+# Process-wide model shared by all sessions, kept in step with the catalog signature.
+_model = None
+_model_lock = threading.Lock()
+_save_timer = None
+
+
+def _schedule_save():
+    """Persists the model after incremental updates, at most once per RECOMMENDER_SAVE_DELAY_SECONDS."""
+    global _save_timer
+
+    def save():
+        global _save_timer
+        with _model_lock:
+            _save_timer = None
+            if _model is not None:
+                try:
+                    _model.save(config.RECOMMENDER_DIR)
+                except Exception as e:
+                    logging.error(f"Failed to save recommendation model: {e}", exc_info=True)
+
+    if _save_timer is None:
+        _save_timer = threading.Timer(config.RECOMMENDER_SAVE_DELAY_SECONDS, save)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def _on_books_added(new_books, old_signature, new_signature):
+    """Catalog listener: updates the affected neighbour lists if the model reflects the pre-append catalog."""
+    with _model_lock:
+        if _model is None or _model.signature != old_signature:
+            return
+        try:
+            _model.add_books(pd.DataFrame(new_books, columns=database.BOOK_COLUMNS))
+            _model.signature = new_signature
+            _schedule_save()
+        except Exception as e:
+            logging.error(f"Incremental recommendation update failed; the model will be rebuilt: {e}", exc_info=True)
+            _model.signature = None
+
+
+database.register_catalog_listener(_on_books_added)
+
+
+def _current_model(books_df: pd.DataFrame, signature) -> RecommendationModel:
+    """Returns the shared model: from memory, from disk, or rebuilt if the catalog changed. Caller holds _model_lock."""
+    global _model
+    if _model is not None and _model.signature == signature and len(_model) == len(books_df):
+        return _model
+    try:
+        saved = RecommendationModel.load(config.RECOMMENDER_DIR)
+        if saved.signature == signature and len(saved) == len(books_df):
+            _model = saved
+            logging.info(f"Recommendation model loaded from {config.RECOMMENDER_DIR} ({len(saved)} books).")
+            return _model
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"Ignoring saved recommendation model: {e}")
+    _model = RecommendationModel.build(books_df, signature)
+    try:
+        _model.save(config.RECOMMENDER_DIR)
+    except Exception as e:
+        logging.error(f"Failed to save recommendation model: {e}", exc_info=True)
+    return _model
+
+
+def similar_books(book_id, limit: int = None) -> pd.DataFrame:
+    """Books most similar to `book_id` (by genre, author and title words), best first, with a 'score' column.
+
+    Returns an empty DataFrame if the book does not exist.
+    """
+    limit = config.RECOMMENDER_TOP_N if limit is None else min(limit, config.RECOMMENDER_TOP_N)
+    signature = database.catalog_signature()
+    books_df = database.load_books()
+    with _model_lock:
+        model = _current_model(books_df, signature)
+        row = model.row_of(book_id)
+        if row is None:
+            return books_df.iloc[0:0].assign(score=pd.Series(dtype=float))
+        rows, scores = model.similar(row, limit)
+    results = books_df.iloc[rows].copy()
+    results['score'] = np.round(scores.astype(float), 3)
+    return results
@@ -0,0 +1,355 @@
+# utils/sqlite_store.py
+
+import logging
+import sqlite3
+import threading
+import pandas as pd
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+BOOK_COLUMNS = ['id', 'title', 'author', 'genre', 'available']
+USER_COLUMNS = ['id', 'username', 'password']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    available INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_books_title ON books(title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_books_author ON books(author COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_books_genre ON books(genre COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username);
+
+-- Bumped by triggers on every catalog change, so readers can cache by version.
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('books_version', 0);
+CREATE TRIGGER IF NOT EXISTS books_version_ins AFTER INSERT ON books BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'books_version';
+END;
+CREATE TRIGGER IF NOT EXISTS books_version_upd AFTER UPDATE ON books BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'books_version';
+END;
+CREATE TRIGGER IF NOT EXISTS books_version_del AFTER DELETE ON books BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'books_version';
+END;
+"""
+
+# Trigram full-text index so substring search over title/author/genre is an
+# index lookup rather than a table scan. Needs SQLite >= 3.34; without it we
+# fall back to LIKE.
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, author, genre, content='books', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS books_fts_ins AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts(rowid, title, author, genre) VALUES (new.id, new.title, new.author, new.genre);
+END;
+CREATE TRIGGER IF NOT EXISTS books_fts_del AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author, genre) VALUES ('delete', old.id, old.title, old.author, old.genre);
+END;
+CREATE TRIGGER IF NOT EXISTS books_fts_upd AFTER UPDATE OF title, author, genre ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author, genre) VALUES ('delete', old.id, old.title, old.author, old.genre);
+    INSERT INTO books_fts(rowid, title, author, genre) VALUES (new.id, new.title, new.author, new.genre);
+END;
+"""
+
+# One connection per thread; Streamlit serves each session from its own thread.
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+_has_fts = False
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(config.SQLITE_DB_PATH), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _initialize(conn: sqlite3.Connection):
+    """Creates the schema and runs the one-shot CSV migration the first time the database is used."""
+    global _initialized, _has_fts
+    with _init_lock:
+        if _initialized:
+            return
+        conn.executescript(_SCHEMA)
+        try:
+            conn.executescript(_FTS_SCHEMA)
+            _has_fts = True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"SQLite trigram FTS unavailable ({e}); catalog search will use LIKE scans.")
+            _has_fts = False
+        _initialized = True
+    migrate_from_csv(conn)
+
+
+def get_connection() -> sqlite3.Connection:
+    """Returns this thread's connection to the library database, initializing it if needed."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        _initialize(conn)
+    return conn
+
+
+def migrate_from_csv(conn: sqlite3.Connection = None, force: bool = False) -> dict:
+    """Copies books.csv and users.csv into SQLite.
+
+    Only tables that are still empty are filled, unless `force` is set, in which case they are
+    replaced. Returns the number of rows migrated per table.
+    """
+    conn = conn or get_connection()
+    migrated = {"books": 0, "users": 0}
+    sources = [
+        ("books", config.BOOKS_CSV_PATH, BOOK_COLUMNS),
+        ("users", config.USERS_CSV_PATH, USER_COLUMNS),
+    ]
+    for table, csv_path, columns in sources:
+        if not csv_path.exists():
+            continue
+        has_rows = conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is not None
+        if has_rows and not force:
+            continue
+        try:
+            df = pd.read_csv(csv_path)
+        except pd.errors.EmptyDataError:
+            continue
+        if not all(col in df.columns for col in columns):
+            logging.error(f"Skipping migration of {csv_path}: missing required columns {columns}.")
+            continue
+        df = df[columns]
+        if table == "books" and df['available'].dtype == 'object':
+            df['available'] = df['available'].str.lower().map({'true': True, 'false': False}).fillna(False)
+        rows = [tuple(r) for r in df.astype(object).itertuples(index=False, name=None)]
+        placeholders = ", ".join("?" for _ in columns)
+        with conn:
+            if force:
+                conn.execute(f"DELETE FROM {table}")
+            conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+        migrated[table] = len(rows)
+        logging.info(f"Migrated {len(rows)} rows from {csv_path} into SQLite table '{table}'.")
+    return migrated
+
+
+def catalog_version() -> int:
+    """Returns a counter that changes whenever the books table is modified."""
+    row = get_connection().execute("SELECT value FROM meta WHERE key = 'books_version'").fetchone()
+    return row[0]
+
+
+def _books_frame(rows) -> pd.DataFrame:
+    df = pd.DataFrame([tuple(r) for r in rows], columns=BOOK_COLUMNS)
+    df['available'] = df['available'].astype(bool)
+    return df
+
+
+def fetch_books() -> pd.DataFrame:
+    """Returns the whole catalog as a DataFrame ordered by id."""
+    rows = get_connection().execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM books ORDER BY id").fetchall()
+    return _books_frame(rows)
+
+
+def replace_books(books_df: pd.DataFrame):
+    """Replaces the catalog with the given DataFrame in a single transaction."""
+    conn = get_connection()
+    rows = [
+        (int(r.id), r.title, r.author, r.genre, int(bool(r.available)))
+        for r in books_df[BOOK_COLUMNS].itertuples(index=False)
+    ]
+    with conn:
+        conn.execute("DELETE FROM books")
+        conn.executemany("INSERT INTO books (id, title, author, genre, available) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def insert_books(rows):
+    """Inserts book rows (mappings with title/author/genre/available).
+
+    Ids are assigned as one contiguous block and the rows go in with a single executemany.
+    Returns (new_ids, version_before, version_after), with both catalog versions read inside
+    the write transaction so they bracket exactly this insert.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        version_before = conn.execute("SELECT value FROM meta WHERE key = 'books_version'").fetchone()[0]
+        # What AUTOINCREMENT would hand out next: past both the sequence and any explicit ids.
+        last_id = conn.execute(
+            "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'books'), 0),"
+            " COALESCE((SELECT MAX(id) FROM books), 0))"
+        ).fetchone()[0]
+        new_ids = list(range(last_id + 1, last_id + 1 + len(rows)))
+        conn.executemany(
+            "INSERT INTO books (id, title, author, genre, available) VALUES (?, ?, ?, ?, ?)",
+            [
+                (book_id, row['title'], row['author'], row['genre'], int(bool(row.get('available', True))))
+                for book_id, row in zip(new_ids, rows)
+            ],
+        )
+        version_after = conn.execute("SELECT value FROM meta WHERE key = 'books_version'").fetchone()[0]
+    return new_ids, version_before, version_after
+
+
+def iter_books(batch_size: int):
+    """Yields the catalog ordered by id as DataFrames of at most batch_size rows."""
+    cursor = get_connection().execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM books ORDER BY id")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield _books_frame(rows)
+
+
+def search_books(term: str) -> pd.DataFrame:
+    """Case-insensitive substring search over title, author and genre."""
+    conn = get_connection()
+    if _has_fts and len(term) >= 3:
+        # Trigram MATCH on a quoted phrase is a case-insensitive substring match served from the index.
+        phrase = '"' + term.replace('"', '""') + '"'
+        rows = conn.execute(
+            "SELECT b.id, b.title, b.author, b.genre, b.available FROM books_fts "
+            "JOIN books b ON b.id = books_fts.rowid WHERE books_fts MATCH ? ORDER BY b.id",
+            (phrase,),
+        ).fetchall()
+    else:
+        pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        rows = conn.execute(
+            "SELECT id, title, author, genre, available FROM books "
+            "WHERE title LIKE :p ESCAPE '\\' OR author LIKE :p ESCAPE '\\' OR genre LIKE :p ESCAPE '\\' ORDER BY id",
+            {"p": pattern},
+        ).fetchall()
+    return _books_frame(rows)
+
+
+def _where(filters) -> tuple:
+    """SQL conditions and parameters for normalized query filters (see database.query_books)."""
+    clauses, params = [], []
+    for key, value in filters:
+        if key in ("genre", "author"):
+            clauses.append(f"{key} IN ({', '.join('?' for _ in value)})")
+            params.extend(value)
+        elif key == "available":
+            clauses.append("available = ?")
+            params.append(int(value))
+        elif _has_fts and len(value) >= 3:
+            clauses.append("id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)")
+            params.append('"' + value.replace('"', '""') + '"')
+        else:
+            pattern = "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("(title LIKE ? ESCAPE '\\' OR author LIKE ? ESCAPE '\\' OR genre LIKE ? ESCAPE '\\')")
+            params.extend([pattern] * 3)
+    return clauses, params
+
+
+def query_books(filters, sort: str, descending: bool, limit: int, offset: int = 0, after=None) -> pd.DataFrame:
+    """One page of the catalog ordered by (sort column, id), case-insensitively.
+
+    `after` is the (sort value, id) of the previous page's last row: the page then starts right
+    after it through the sort column's index (keyset pagination) instead of skipping rows.
+    """
+    get_connection()  # Ensures the schema (and _has_fts) is initialized
+    clauses, params = _where(filters)
+    direction = "DESC" if descending else "ASC"
+    if sort == "id":
+        order = f"id {direction}"
+        if after is not None:
+            clauses.append("id < ?" if descending else "id > ?")
+            params.append(int(after[1]))
+    else:
+        key = f"{sort} COLLATE NOCASE"
+        order = f"{key} {direction}, id {direction}"
+        if after is not None:
+            # The single-column bound lets SQLite seek the index; the row value breaks ties by id.
+            op = "<" if descending else ">"
+            clauses.append(f"{sort} {op}= ? COLLATE NOCASE AND ({key}, id) {op} (?, ?)")
+            params.extend([after[0], after[0], int(after[1])])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = get_connection().execute(
+        f"SELECT {', '.join(BOOK_COLUMNS)} FROM books {where} ORDER BY {order} LIMIT ? OFFSET ?",
+        params + [int(limit), int(offset)],
+    ).fetchall()
+    return _books_frame(rows)
+
+
+def count_books(filters) -> int:
+    """Number of books matching normalized query filters."""
+    get_connection()
+    clauses, params = _where(filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return get_connection().execute(f"SELECT COUNT(*) FROM books {where}", params).fetchone()[0]
+
+
+def distinct_values(column: str) -> list:
+    """Sorted distinct values of a books column."""
+    rows = get_connection().execute(f"SELECT DISTINCT {column} FROM books ORDER BY {column} COLLATE NOCASE").fetchall()
+    return [row[0] for row in rows]
+
+
+def get_book(book_id: int):
+    """Returns a single book as a dict, or None if the id does not exist."""
+    row = get_connection().execute(
+        f"SELECT {', '.join(BOOK_COLUMNS)} FROM books WHERE id = ?", (int(book_id),)
+    ).fetchone()
+    if row is None:
+        return None
+    book = dict(row)
+    book['available'] = bool(book['available'])
+    return book
+
+
+def set_book_available(book_id: int, available: bool) -> bool:
+    """Updates a book's availability flag. Returns False if the id does not exist."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("UPDATE books SET available = ? WHERE id = ?", (int(bool(available)), int(book_id)))
+    return cursor.rowcount > 0
+
+
+def fetch_users() -> pd.DataFrame:
+    """Returns all users as a DataFrame."""
+    rows = get_connection().execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users ORDER BY id").fetchall()
+    return pd.DataFrame([tuple(r) for r in rows], columns=USER_COLUMNS)
+
+
+def get_user(username: str):
+    """Looks a user up by username through the unique index. Returns a dict or None."""
+    row = get_connection().execute(
+        f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE username = ?", (username,)
+    ).fetchone()
+    return dict(row) if row is not None else None
+
+
+def set_user_password(username: str, password: str, expected: str = None) -> bool:
+    """Replaces a user's stored password (hash). Returns False if the user does not exist.
+
+    With `expected`, only replaces it if the stored password is still that value.
+    """
+    conn = get_connection()
+    with conn:
+        if expected is None:
+            cursor = conn.execute("UPDATE users SET password = ? WHERE username = ?", (password, username))
+        else:
+            cursor = conn.execute("UPDATE users SET password = ? WHERE username = ? AND password = ?",
+                                  (password, username, expected))
+    return cursor.rowcount > 0
+
+
+if __name__ == "__main__":
+    # One-shot migration: python -m utils.sqlite_store [--force]
+    import sys
+    conn = get_connection()  # Creates the schema and fills any empty tables from the CSVs
+    if "--force" in sys.argv[1:]:
+        migrate_from_csv(conn, force=True)
+    print(f"SQLite database ready at {config.SQLITE_DB_PATH}")
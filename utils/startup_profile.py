@@ -0,0 +1,163 @@
+# utils/startup_profile.py
+"""Startup import profiling for the Streamlit app.
+
+Runs `import app` in a fresh interpreter with CPython's `-X importtime`, after importing
+streamlit (which `streamlit run` has already loaded before the script starts), and reports
+what the app itself costs before the login form can render: the slowest modules by
+cumulative and self time, the total per top-level package, and any module from
+config.STARTUP_HEAVY_MODULES that was loaded eagerly.
+
+    python -m utils.startup_profile                      # report
+    python -m utils.startup_profile --budget 0.5         # also fail (exit 1) over budget or on heavy imports
+    python -m utils.startup_profile --json profile.json  # machine-readable results
+
+With LIBRARY_PROFILE_STARTUP=1 the running app also logs its own time to first render
+(see report_first_render).
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+_MARKER = "library-startup-profile: app"
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> list:
+    """Parses `-X importtime` output after the marker into [{module, self_s, cumulative_s, depth}]."""
+    records = []
+    started = False
+    for line in stderr.splitlines():
+        if not started:
+            started = _MARKER in line
+            continue
+        match = _LINE_RE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        records.append({
+            "module": module,
+            "self_s": int(self_us) / 1e6,
+            "cumulative_s": int(cumulative_us) / 1e6,
+            "depth": (len(indent) - 1) // 2,
+        })
+    return records
+
+
+def _is_heavy(module: str) -> bool:
+    return any(module == name or module.startswith(name + ".") for name in config.STARTUP_HEAVY_MODULES)
+
+
+def summarize(records: list, top: int = 20) -> dict:
+    """Aggregates parsed import records into the report dict."""
+    packages = {}
+    for record in records:
+        package = record["module"].split(".")[0]
+        packages[package] = packages.get(package, 0.0) + record["self_s"]
+    return {
+        # Modules at depth 0 were imported directly by the app; their cumulative times add up to the total.
+        "total_s": sum(r["cumulative_s"] for r in records if r["depth"] == 0),
+        "modules": len(records),
+        "slowest_cumulative": sorted(records, key=lambda r: -r["cumulative_s"])[:top],
+        "slowest_self": sorted(records, key=lambda r: -r["self_s"])[:top],
+        "packages": dict(sorted(packages.items(), key=lambda item: -item[1])),
+        "heavy_modules": sorted({r["module"].split(".")[0] for r in records if _is_heavy(r["module"])}),
+    }
+
+
+def profile_app_startup(top: int = 20) -> dict:
+    """Imports app.py in a fresh interpreter and returns the summarized import profile."""
+    code = (
+        "import sys, streamlit\n"
+        f"print({_MARKER!r}, file=sys.stderr, flush=True)\n"
+        "import app\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(config.BASE_DIR), os.getenv("PYTHONPATH")])))
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=config.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    wall_s = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing app.py failed:\n{result.stderr[-2000:]}")
+    report = summarize(parse_importtime(result.stderr), top=top)
+    report["process_wall_s"] = wall_s
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"App imports before login: {report['total_s'] * 1000:.0f} ms across {report['modules']} modules "
+        f"(process wall time incl. interpreter and streamlit: {report['process_wall_s']:.2f} s)",
+        "",
+        "Slowest modules (cumulative ms, self ms):",
+    ]
+    for record in report["slowest_cumulative"]:
+        indent = "  " * record["depth"]
+        lines.append(f"  {record['cumulative_s'] * 1000:9.1f} {record['self_s'] * 1000:9.1f}  {indent}{record['module']}")
+    lines += ["", "Self time by top-level package (ms):"]
+    for package, seconds in list(report["packages"].items())[:15]:
+        lines.append(f"  {seconds * 1000:9.1f}  {package}")
+    lines.append("")
+    if report["heavy_modules"]:
+        lines.append(f"Heavy modules loaded at startup: {', '.join(report['heavy_modules'])}")
+    else:
+        lines.append("No heavy modules loaded at startup.")
+    return "\n".join(lines)
+
+
+_first_render = None
+
+
+def report_first_render(script_started: float) -> dict:
+    """Records, once per process, the time from script start to the first rendered page and
+    the heavy modules loaded by then. Later calls return the first measurement."""
+    global _first_render
+    if _first_render is None:
+        _first_render = {
+            "seconds": time.perf_counter() - script_started,
+            "heavy_modules": sorted({name.split(".")[0] for name in sys.modules if _is_heavy(name)}),
+        }
+        logging.info(
+            f"Startup profile: first page rendered after {_first_render['seconds'] * 1000:.0f} ms; "
+            f"heavy modules loaded: {', '.join(_first_render['heavy_modules']) or 'none'}"
+        )
+    return _first_render
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile the import cost of starting the Streamlit app.")
+    parser.add_argument("--top", type=int, default=20, help="number of slowest modules to list")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="fail if app imports take longer than this many seconds or load a heavy module")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = profile_app_startup(top=args.top)
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.budget is not None:
+        failures = []
+        if report["total_s"] > args.budget:
+            failures.append(f"app imports took {report['total_s']:.3f} s (budget {args.budget:.3f} s)")
+        if report["heavy_modules"]:
+            failures.append(f"heavy modules imported at startup: {', '.join(report['heavy_modules'])}")
+        for failure in failures:
+            logging.error(f"Startup profile: {failure}")
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
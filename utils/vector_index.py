@@ -0,0 +1,534 @@
+# utils/vector_index.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from collections.abc import Mapping
+from pathlib import Path
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+# The metadata file names the files of the published generation; replacing it publishes a new one.
+META_FILENAME = "vector_index.json"
+# Same format, written periodically during a build so an interrupted build can resume
+CHECKPOINT_FILENAME = "build_checkpoint.json"
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+
+def _ivf_nlist(n_train: int) -> int:
+    """Number of IVF cells: the configured value, reduced so every cell gets ~39 training points."""
+    return max(1, min(config.FAISS_IVF_NLIST, n_train // 39))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest number of PQ sub-quantizers <= FAISS_PQ_M that divides the vector dimension."""
+    m = min(config.FAISS_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def make_index(dim: int, training_vectors=None):
+    """Creates (and trains, if needed) an empty FAISS index of the configured FAISS_INDEX_TYPE.
+
+    Every index type is addressed by stable int64 labels (add_with_ids), so removing chunks never
+    renumbers the others. IVF variants are trained on `training_vectors`; if there are too few of
+    them the next simpler index type is used instead.
+    """
+    index_type = config.FAISS_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        logging.warning(f"Unknown FAISS_INDEX_TYPE {index_type!r}; using a flat index.")
+        index_type = "flat"
+    n_train = 0 if training_vectors is None else len(training_vectors)
+    if index_type == "ivfpq" and n_train < 39 * 2 ** config.FAISS_PQ_NBITS:
+        logging.info(f"Only {n_train} vectors to train product quantization; using an IVF index without PQ.")
+        index_type = "ivf"
+    if index_type == "ivf" and n_train < 2 * 39:
+        logging.info(f"Only {n_train} vectors to train IVF cells; using a flat index.")
+        index_type = "flat"
+
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, config.FAISS_HNSW_M)
+        hnsw.hnsw.efConstruction = config.FAISS_HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(hnsw)
+
+    nlist = _ivf_nlist(n_train)
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivfpq":
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), config.FAISS_PQ_NBITS)
+    else:
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    index.own_fields = True
+    quantizer.this.disown()
+    index.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+    # A hashtable direct map keeps reconstruct() (used by MMR) working across removals.
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    logging.info(f"Trained {index_type} index ({nlist} cells) on {n_train} vectors.")
+    return index
+
+
+def needs_training() -> bool:
+    return config.FAISS_INDEX_TYPE in ("ivf", "ivfpq")
+
+
+def apply_search_parameters(index):
+    """Sets query-time knobs (IVF nprobe, HNSW efSearch) from config."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config.FAISS_IVF_NPROBE, ivf.nlist)
+        return
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = config.FAISS_HNSW_EF_SEARCH
+
+
+def _meta_path(folder, checkpoint: bool = False) -> Path:
+    return Path(folder) / (CHECKPOINT_FILENAME if checkpoint else META_FILENAME)
+
+
+def read_meta(folder, checkpoint: bool = False):
+    """Returns the published (or checkpoint) metadata, or None if there is none."""
+    try:
+        with open(_meta_path(folder, checkpoint), encoding='utf-8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logging.error(f"Ignoring unreadable index metadata in {folder}: {e}")
+        return None
+    return meta if "generation" in meta else None
+
+
+def _write_meta(folder, meta, checkpoint: bool = False):
+    path = _meta_path(folder, checkpoint)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _meta_files(meta) -> set:
+    if not meta:
+        return set()
+    return {name for key, name in meta.items() if key in ("index", "docstore") or key.endswith("_file")}
+
+
+def _remove_files(folder, names):
+    """Deletes generation files; processes that still have them open keep reading the unlinked data."""
+    for name in names:
+        suffixes = ("", "-wal", "-shm") if name.endswith(".db") else ("",)
+        for suffix in suffixes:
+            try:
+                os.remove(Path(folder) / f"{name}{suffix}")
+            except FileNotFoundError:
+                pass
+
+
+def discard_checkpoint(folder):
+    """Removes a build checkpoint and the files only it refers to."""
+    checkpoint = read_meta(folder, checkpoint=True)
+    if checkpoint is None:
+        return
+    os.remove(_meta_path(folder, checkpoint=True))
+    _remove_files(folder, _meta_files(checkpoint) - _meta_files(read_meta(folder)))
+
+
+class SQLiteDocstore:
+    """Chunk store for the vector index: FAISS label, chunk id, text and JSON metadata in SQLite.
+
+    Unlike the pickled InMemoryDocstore nothing is deserialized up front; documents are read on
+    demand, so opening an index of any size is immediate. Writes are buffered and applied in one
+    transaction by commit(), which the vector store calls when it saves the index file. Removed
+    chunks are only flagged as deleted, so readers still holding the previous index file can
+    resolve every label it returns until they reload; a full rebuild starts a fresh file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                label INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_id ON chunks(id);
+        """)
+        self._pending_add = {}       # chunk id -> (label, Document)
+        self._pending_labels = {}    # label -> chunk id
+        self._pending_delete = set()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM chunks WHERE deleted = 0").fetchone()[0]
+        max_label = self._conn.execute("SELECT MAX(label) FROM chunks").fetchone()[0]
+        self.next_label = 0 if max_label is None else max_label + 1
+
+    def __len__(self):
+        return self._count
+
+    def search(self, search: str):
+        """Returns the Document for a chunk id, or an explanatory string if it is unknown (like InMemoryDocstore)."""
+        with self._lock:
+            if search in self._pending_add:
+                return self._pending_add[search][1]
+            # Chunk ids embed the content hash, so any row with this id holds the same text.
+            row = self._conn.execute(
+                "SELECT content, metadata FROM chunks WHERE id = ? ORDER BY deleted LIMIT 1", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add_labeled(self, labeled_docs):
+        """Buffers (label, chunk id, Document) triples for the next commit."""
+        with self._lock:
+            for label, chunk_id, doc in labeled_docs:
+                self._pending_delete.discard(chunk_id)
+                self._pending_add[chunk_id] = (label, doc)
+                self._pending_labels[label] = chunk_id
+                self._count += 1
+                self.next_label = max(self.next_label, label + 1)
+
+    def delete(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                pending = self._pending_add.pop(chunk_id, None)
+                if pending is not None:
+                    del self._pending_labels[pending[0]]
+                else:
+                    self._pending_delete.add(chunk_id)
+                self._count -= 1
+
+    def commit(self):
+        """Writes buffered additions and deletions in a single transaction."""
+        with self._lock:
+            if not self._pending_add and not self._pending_delete:
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE chunks SET deleted = 1 WHERE id = ? AND deleted = 0", [(i,) for i in self._pending_delete]
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (label, id, content, metadata) VALUES (?, ?, ?, ?)",
+                    [(label, chunk_id, doc.page_content, json.dumps(doc.metadata))
+                     for chunk_id, (label, doc) in self._pending_add.items()],
+                )
+            self._pending_add.clear()
+            self._pending_labels.clear()
+            self._pending_delete.clear()
+
+    def chunk_id(self, label: int):
+        with self._lock:
+            if label in self._pending_labels:
+                return self._pending_labels[label]
+            row = self._conn.execute("SELECT id FROM chunks WHERE label = ?", (label,)).fetchone()
+            return None if row is None else row[0]
+
+    def labels_for(self, chunk_ids) -> dict:
+        """Returns {chunk id: FAISS label} for the given ids that are live in the store."""
+        chunk_ids = list(chunk_ids)
+        found = {}
+        with self._lock:
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                placeholders = ", ".join("?" for _ in batch)
+                found.update(self._conn.execute(
+                    f"SELECT id, label FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", batch
+                ).fetchall())
+            for chunk_id in self._pending_delete:
+                found.pop(chunk_id, None)
+            for chunk_id in chunk_ids:
+                if chunk_id in self._pending_add:
+                    found[chunk_id] = self._pending_add[chunk_id][0]
+        return found
+
+    def documents_for(self, labels) -> dict:
+        """Returns {FAISS label: Document} for the given labels, in one query per 500 labels."""
+        labels = [int(label) for label in labels]
+        found = {}
+        with self._lock:
+            for start in range(0, len(labels), 500):
+                batch = labels[start:start + 500]
+                placeholders = ", ".join("?" for _ in batch)
+                rows = self._conn.execute(
+                    f"SELECT label, id, content, metadata FROM chunks WHERE label IN ({placeholders})", batch
+                ).fetchall()
+                for label, chunk_id, content, metadata in rows:
+                    found[label] = Document(id=chunk_id, page_content=content, metadata=json.loads(metadata))
+            for label in labels:
+                if label in self._pending_labels:
+                    found[label] = self._pending_add[self._pending_labels[label]][1]
+        return found
+
+    def iter_items(self):
+        """Yields (label, chunk id) for every live chunk, in label order."""
+        with self._lock:
+            rows = self._conn.execute("SELECT label, id FROM chunks WHERE deleted = 0 ORDER BY label").fetchall()
+            pending = sorted(self._pending_labels.items())
+            deleted = set(self._pending_delete)
+        for label, chunk_id in rows:
+            if chunk_id not in deleted and chunk_id not in self._pending_add:
+                yield label, chunk_id
+        yield from pending
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LabelMap(Mapping):
+    """Read-through `index_to_docstore_id` mapping (FAISS label -> chunk id) backed by the docstore."""
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self.docstore = docstore
+
+    def __getitem__(self, label):
+        chunk_id = self.docstore.chunk_id(int(label))
+        if chunk_id is None:
+            raise KeyError(label)
+        return chunk_id
+
+    def __iter__(self):
+        return (label for label, _ in self.docstore.iter_items())
+
+    def __len__(self):
+        return len(self.docstore)
+
+    def items(self):
+        return list(self.docstore.iter_items())
+
+    def values(self):
+        return [chunk_id for _, chunk_id in self.docstore.iter_items()]
+
+
+class MappedFAISS(FAISS):
+    """FAISS vector store with a configurable index type, memory-mapped loading and a SQLite docstore.
+
+    `open()` maps the saved index file read-only, so startup cost does not grow with the
+    index and several processes share its pages; the first write reloads it into memory
+    (`ensure_writable`). Until an IVF index has seen FAISS_TRAIN_SAMPLE_SIZE vectors they are
+    buffered, then the index is trained on them; save() trains on whatever was buffered.
+    """
+
+    def __init__(self, embedding_function, index, docstore: SQLiteDocstore, folder, dim=None, read_only=False,
+                 index_type=None):
+        super().__init__(embedding_function, index, docstore, LabelMap(docstore))
+        self.folder = Path(folder)
+        self.dim = dim if dim is not None else (index.d if index is not None else None)
+        self.index_type = index_type or config.FAISS_INDEX_TYPE
+        self.read_only = read_only
+        self._write_lock = threading.RLock()
+        self._untrained = []  # (labels, vectors) waiting for IVF training
+        self.meta = {}  # metadata of the generation this store was opened from
+
+    @classmethod
+    def create(cls, embeddings, folder):
+        """Starts a new, empty index whose docstore lives in a fresh file until it is saved."""
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        docstore_path = folder / f"docstore-{uuid.uuid4().hex[:12]}.db"
+        return cls(embeddings, None, SQLiteDocstore(docstore_path), folder)
+
+    @classmethod
+    def exists(cls, folder, checkpoint: bool = False) -> bool:
+        return read_meta(folder, checkpoint) is not None
+
+    @classmethod
+    def open(cls, folder, embeddings, read_only: bool = True, checkpoint: bool = False):
+        """Opens a saved index. Read-only opens memory-map the index file instead of reading it."""
+        folder = Path(folder)
+        meta = read_meta(folder, checkpoint)
+        if meta is None:
+            raise FileNotFoundError(f"No saved vector index in {folder}")
+        read_only = read_only and not meta.get("untrained")
+        flags = 0
+        if read_only:
+            # IVF inverted lists have their own mmap reader; flat and HNSW storage map through MMAP_IFC.
+            flags = (faiss.IO_FLAG_MMAP if meta.get("ivf") else faiss.IO_FLAG_MMAP_IFC) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(str(folder / meta["index"]), flags)
+        docstore = SQLiteDocstore(folder / meta["docstore"])
+        store = cls(embeddings, index, docstore, folder, dim=meta["dim"], read_only=read_only,
+                    index_type=meta.get("index_type"))
+        store.meta = meta
+        if meta.get("untrained"):
+            # A checkpoint taken before IVF training holds the buffered vectors in a flat index.
+            labels = faiss.vector_to_array(index.id_map).astype(np.int64)
+            store._untrained = [(labels, index.index.reconstruct_n(0, index.ntotal))]
+            store.index = None
+        else:
+            apply_search_parameters(index)
+        return store
+
+    def ensure_writable(self):
+        """Replaces a memory-mapped, read-only index with an in-memory copy that can be modified."""
+        with self._write_lock:
+            if self.read_only:
+                self.index = faiss.read_index(str(self.folder / self.meta["index"]))
+                apply_search_parameters(self.index)
+                self.read_only = False
+
+    def labels_for(self, chunk_ids) -> dict:
+        return self.docstore.labels_for(chunk_ids)
+
+    def search_batch(self, vectors, k: int) -> list:
+        """Nearest chunks for many query vectors with a single FAISS search.
+
+        Returns one [(Document, score)] list per query, best first, like
+        similarity_search_with_score_by_vector; chunks are read from the docstore in bulk.
+        """
+        vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        scores, labels = self.index.search(vectors, k)
+        docs = self.docstore.documents_for(np.unique(labels[labels >= 0]))
+        return [
+            [(docs[label], float(score)) for label, score in zip(row_labels, row_scores) if label in docs]
+            for row_labels, row_scores in zip(labels.tolist(), scores.tolist())
+        ]
+
+    def close(self):
+        """Releases the docstore connection and the (possibly memory-mapped) index."""
+        with self._write_lock:
+            self.docstore.close()
+            self.index = None
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        texts = [text for text, _ in text_embeddings]
+        vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        with self._write_lock:
+            self.ensure_writable()
+            self.dim = self.dim or vectors.shape[1]
+            labels = np.arange(self.docstore.next_label, self.docstore.next_label + len(texts), dtype=np.int64)
+            self.docstore.add_labeled(
+                (int(label), chunk_id, Document(id=chunk_id, page_content=text, metadata=metadata))
+                for label, chunk_id, text, metadata in zip(labels, ids, texts, metadatas)
+            )
+            if self.index is None and needs_training():
+                self._untrained.append((labels, vectors))
+                if sum(len(l) for l, _ in self._untrained) >= config.FAISS_TRAIN_SAMPLE_SIZE:
+                    self._train_pending()
+            else:
+                if self.index is None:
+                    self.index = make_index(self.dim)
+                    apply_search_parameters(self.index)
+                self.index.add_with_ids(vectors, labels)
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+
+    def _train_pending(self):
+        """Trains a new index on the buffered vectors and adds them. Caller holds the write lock."""
+        if not self._untrained:
+            return
+        labels = np.concatenate([l for l, _ in self._untrained])
+        vectors = np.vstack([v for _, v in self._untrained])
+        self._untrained = []
+        sample = vectors
+        if len(vectors) > config.FAISS_TRAIN_SAMPLE_SIZE:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(len(vectors), config.FAISS_TRAIN_SAMPLE_SIZE, replace=False)]
+        self.index = make_index(self.dim, sample)
+        apply_search_parameters(self.index)
+        self.index.add_with_ids(vectors, labels)
+
+    def delete(self, ids=None, **kwargs):
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        with self._write_lock:
+            self.ensure_writable()
+            labels = self.docstore.labels_for(ids)
+            missing = set(ids).difference(labels)
+            if missing:
+                raise ValueError(f"Some specified ids do not exist in the current store. Ids not found: {missing}")
+            doomed = np.fromiter(labels.values(), dtype=np.int64)
+            if self._untrained:
+                self._untrained = [(l[~np.isin(l, doomed)], v[~np.isin(l, doomed)]) for l, v in self._untrained]
+            if self.index is not None:
+                try:
+                    self.index.remove_ids(doomed)
+                except RuntimeError:
+                    # HNSW graphs cannot drop nodes; rebuild from the surviving vectors.
+                    self._rebuild_without(doomed)
+            self.docstore.delete(ids)
+        return True
+
+    def _rebuild_without(self, doomed):
+        doomed_set = set(doomed.tolist())
+        keep = np.array([label for label, _ in self.docstore.iter_items() if label not in doomed_set], dtype=np.int64)
+        logging.info(f"Rebuilding {self.index_type} index without {len(doomed)} removed chunks.")
+        index = make_index(self.dim)
+        apply_search_parameters(index)
+        for start in range(0, len(keep), 10_000):
+            batch = keep[start:start + 10_000]
+            index.add_with_ids(np.vstack([self.index.reconstruct(int(label)) for label in batch]), batch)
+        self.index = index
+
+    def save_local(self, folder_path=None, index_name: str = "index", extra_files=None, checkpoint: bool = False):
+        """Writes a new generation of the index and publishes it by replacing the metadata file.
+
+        `extra_files` ({key: file name}) are recorded in the metadata next to the index, so files
+        written alongside it (lexical index, manifest) are published and cleaned up with it.
+        With `checkpoint`, the build checkpoint is written instead and readers are unaffected;
+        IVF vectors still waiting for training are then stored untrained.
+        """
+        folder = Path(folder_path or self.folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        generation = uuid.uuid4().hex[:12]
+        index_file = f"index-{generation}.faiss"
+        with self._write_lock:
+            untrained = checkpoint and bool(self._untrained)
+            if untrained:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dim))
+                for labels, vectors in self._untrained:
+                    index.add_with_ids(vectors, labels)
+            else:
+                self._train_pending()
+                if self.index is None:
+                    self.index = make_index(self.dim)
+                index = self.index
+            faiss.write_index(index, str(folder / index_file))
+            self.docstore.commit()
+            meta = {
+                "generation": generation,
+                "index_type": self.index_type,
+                "ivf": faiss.try_extract_index_ivf(index) is not None,
+                "untrained": untrained,
+                "dim": self.dim,
+                "index": index_file,
+                "docstore": self.docstore.path.name,
+            }
+            meta.update({f"{key}_file": name for key, name in (extra_files or {}).items()})
+            previous = read_meta(folder, checkpoint)
+            _write_meta(folder, meta, checkpoint)
+            self.meta = meta
+        _remove_files(folder, _meta_files(previous) - _meta_files(meta) - _meta_files(read_meta(folder, not checkpoint)))
+        if not checkpoint:
+            legacy_pickle = folder / f"{index_name}.pkl"
+            if legacy_pickle.exists():
+                os.remove(legacy_pickle)
+        logging.info(f"Saved {self.index_type} index generation {generation} ({index.ntotal} vectors"
+                     f"{', checkpoint' if checkpoint else ''}) to {folder}")
+        return meta